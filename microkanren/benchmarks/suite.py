@@ -0,0 +1,534 @@
+'''
+A suite of benchmarks of the whole engine, which times each workload as
+*pyperf* does, namely calibrating a number of loops that takes some time at
+least, then repeating a warmup and a few runs of those loops, and writes
+results and metadata to a JSON file; given the file of a previous run as
+baseline, it reports the workloads that got slower or faster, and exits with
+status 1 if any got slower. Run it from the ``microkanren`` directory as::
+
+    python3 -m benchmarks.suite --output results.json
+    python3 -m benchmarks.suite --baseline results.json --threshold 0.1
+    python3 -m benchmarks.suite --select appendo --memory
+
+Workloads are compared by the fastest run, the estimate least disturbed by
+other processes; medians and deviations are reported too, and with
+``--memory`` the peak of memory that ``tracemalloc`` traces in a further call.
+Variants of a workload, as closures and compiled ones or searches by each
+scheduler, are workloads of their own, named by a common prefix.
+
+'''
+
+import argparse, asyncio, atexit, json, os, platform, re, shutil, statistics, subprocess, sys, tempfile, time, tracemalloc
+from contextlib import contextmanager
+
+from muk.core import *
+from muk.core import _unification, _unify, _unify_checked
+from muk.ext import *
+from muk.constraints import infd, fd_plus, fd_distinct, labeling, disunify
+from muk.pmap import pmap
+from muk.sexp import adapt_iterables_to_conses, all_arguments
+from muk.parallel import process_pool
+import mclock, reasonedschemer
+from reasonedschemer import (appendo, nullo, num, membero, listo, bumpo, flatteno, enumerateo, lengthi_leqo,
+                             multiplyo, divmodo, pluso)
+from mclock import mcculloch_lawo, craig_lawo, associateo, mccullocho, reverseo, mcculloch__o, opnumbero
+
+workloads = {} # from names to thunks that search, filled by `workload`
+
+def workload(name):
+    def W(thunk):
+        workloads[name] = thunk
+        return thunk
+    return W
+
+# UNIFICATION {{{
+
+xs, ys = [var(i, 'x') for i in range(30)], [var(100 + i, 'y') for i in range(30)]
+tree = lambda leaves: [[leaves[i], [leaves[i+1]]] for i in range(0, len(leaves), 2)]
+
+workload('unify 30 vars with 30 vars')(lambda: _unification(xs, ys, {}, ext_s))
+workload('unify 30 vars with 30 ints')(lambda: _unification(xs, list(range(30)), {}, ext_s))
+workload('unify trees of 30 leaves')(lambda: _unification(tree(xs), tree(list(range(30))), {}, ext_s))
+
+def unifications():
+    x, y, z = var(0, 'x'), var(1, 'y'), var(2, 'z')
+    return {
+        'equal atoms': (5, 5, {}),
+        'different atoms': (5, 6, {}),
+        'bound var and atom': (x, 5, {x: y, y: 5}),
+        'pattern of 30': (list_to_cons(list(range(29)) + [x]), list_to_cons(list(range(30))), {}),
+        'mismatch at 12th': (list_to_cons(list(range(11)) + ['no']), list_to_cons(list(range(12))), {}),
+        'nested trees': (list_to_cons([[1, [2, [3, [4, y]]]], [z, [6]]]),
+                         list_to_cons([[1, [2, [3, [4, 5]]]], [x, [6]]]), {x: 'a'}),
+    }
+
+for name, (u, v, sub) in unifications().items():
+    workload('unify {}'.format(name))(lambda u=u, v=v, sub=sub: _unification(u, v, sub, ext_s))
+
+# }}}
+
+# VARS {{{
+
+chain = [var(i, 'c') for i in range(50)]
+wide = {var(300 + i, 'w'): i for i in range(200)}
+
+workload('walk a chain of 50 vars')(lambda: walk(chain[0], dict(zip(chain, chain[1:] + [0]))))
+workload('lookups of 200 vars')(lambda: [wide.get(w) for w in wide])
+workload('make 30 vars')(lambda: [var(400 + i, 'm') for i in range(30)])
+
+# }}}
+
+# OCCUR CHECK {{{
+
+def associations():
+    x, y = var(0, 'x'), var(1, 'y')
+    tree = y
+    for i in range(300): tree = cons(cons(i, tree), [])
+    return {
+        'ground list of 300': (x, list_to_cons(list(range(300))), {}),
+        'list of 300 ending in a var': (x, list_to_cons(list(range(299)) + [y]), {}),
+        'bound vars in a list': (x, list_to_cons([y] * 300), {y: list_to_cons([1, 2, 3])}),
+        'tree 300 deep': (x, tree, {}),
+    }
+
+for name, (u, v, sub) in associations().items():
+    workload('occur check, {}'.format(name))(lambda u=u, v=v, sub=sub: ext_s(u, v, sub, occur_check=True))
+
+def checked_appendo(unify):
+    def A(l, s, out): # as `appendo`, with the unifications of `unify`
+        return conde([unify([], l), unify(s, out)],
+                     [fresh(lambda a, d, res: conj(unify(cons(a, d), l), unify(cons(a, res), out), A(d, s, res)))])
+    return A
+
+unifiers = {
+    'unchecked': lambda u, v: _unify(u, v, ext_s),
+    'checked': lambda u, v: _unify(u, v, partial(ext_s, occur_check=True)),
+    'checked, linear skips': _unify_checked,
+}
+
+elements = list_to_cons([var(1000 + i, 'e') for i in range(150)])
+for name, unify_ in unifiers.items():
+    workload('appendo of 150 vars, {}'.format(name))(
+        lambda unify_=unify_: run(fresh(lambda q: checked_appendo(unify_)(elements, list_to_cons([1]), q))))
+
+# }}}
+
+# CONSTRUCTION {{{
+
+x, y = var(0, 'x'), var(1, 'y')
+nullo_ = adapt_iterables_to_conses(all_arguments)(lambda l: unify([], l))
+appendo_ = adapt_iterables_to_conses(all_arguments)(lambda l, s, out: unify(l, out))
+conso_ = adapt_iterables_to_conses(lambda a, d, p: {d, p})(lambda a, d, p: unify(cons(a, d), p))
+
+workload('build nullo([])')(lambda: nullo_([]))
+workload('build appendo(x, [3, 2], y)')(lambda: appendo_(x, [3, 2], y))
+workload('build conso(x, y, [2])')(lambda: conso_(x, y, [2]))
+workload('build num.build(200)')(lambda: num.build(200))
+
+# }}}
+
+# SUBSTITUTIONS {{{
+
+searches = {
+    'multiplyo 8.24': (lambda: fresh(lambda p: multiplyo([1, 1, 1], [1, 1, 1, 1, 1, 1], p)), False),
+    'divmodo(83, 6)': (lambda: fresh(lambda dm, q, r: conj(divmodo(83, 6, q, r), unify([q, r], dm))), False),
+    'bumpo of 6 bits': (lambda: fresh(lambda x: bumpo([1, 1, 1, 1, 1, 1], x)), False),
+    'listo 150': (lambda: fresh(lambda q: listo(q)), 150),
+    'lengthi_leqo 8.44': (lambda: fresh(rel(lengthi_leqo)), 15),
+}
+
+for name, (goal, n) in searches.items():
+    for substitution in [dict, pmap]:
+        workload('{}, {}'.format(name, substitution.__name__))(
+            lambda goal=goal, n=n, substitution=substitution: run(goal(), n=n, substitution=substitution))
+
+# }}}
+
+# APPENDO {{{
+
+workload('appendo forward, 200 items')(lambda: run(fresh(lambda q: appendo(list(range(200)), list(range(200)), q))))
+workload('appendo forward, compiled')(lambda: run(fresh(lambda q: appendo(list(range(200)), list(range(200)), q)),
+                                                  compiled=True))
+workload('appendo backward, 30 items')(lambda: run(fresh(lambda x, y: appendo(x, y, list(range(30)))), n=31))
+
+# }}}
+
+# MACHINE {{{
+
+searches = {
+    'membero 300': (lambda: fresh(lambda q: membero(q, list(range(300)))), False, dict),
+    'appendo splits of 30': (lambda: fresh(lambda q, x, y: conj(appendo(x, y, list(range(30))), unify([x, y], q))), 31, dict),
+    'listo 150': (lambda: fresh(lambda q: listo(q)), 150, dict),
+    'bumpo of 6 bits': (lambda: fresh(lambda x: bumpo([1, 1, 1, 1, 1, 1], x)), False, dict),
+    'appendo of 1000': (lambda: fresh(lambda q: appendo(list(range(1000)), [1, 2], q)), False, pmap),
+}
+
+for name, (goal, n, substitution) in searches.items():
+    for compiled in [False, True]:
+        workload('{}, {}'.format(name, 'compiled' if compiled else 'closures'))(
+            lambda goal=goal, n=n, substitution=substitution, compiled=compiled:
+                run(goal(), n=n, substitution=substitution, compiled=compiled))
+
+# }}}
+
+# ARITHMETIC {{{
+
+@contextmanager
+def bit_level():
+    natives = {name: getattr(reasonedschemer, name) for name in ('pluso', 'multiplyo', 'divmodo')}
+    for name, relation in natives.items():
+        setattr(reasonedschemer, name, adapt_iterables_to_conses(all_arguments, ctor=num.build)(relation.relational))
+    try: yield
+    finally:
+        for name, relation in natives.items(): setattr(reasonedschemer, name, relation)
+
+def arithmetic(bits, level):
+    n, m = 2**bits - 3, 2**(bits-1) + 1
+    goals = {
+        'pluso': lambda R: fresh(lambda k: R.pluso(num.build(n), num.build(m), k)),
+        'multiplyo': lambda R: fresh(lambda p: R.multiplyo(num.build(n), num.build(m), p)),
+        'divmodo': lambda R: fresh(lambda q, r: R.divmodo(num.build(n), num.build(3), q, r)),
+    }
+    for relation, goal in goals.items():
+        if level is None:
+            thunk = lambda goal=goal: run(goal(reasonedschemer))
+        else:
+            def thunk(goal=goal):
+                with bit_level(): return run(goal(reasonedschemer))
+        workload('{} of {} bits{}'.format(relation, bits, '' if level is None else ', ' + level))(thunk)
+
+for bits in [8, 32, 64]: arithmetic(bits, level=None)
+for bits in [3, 4]: arithmetic(bits, level='bit level') # multiplying takes a second from 6 bits on
+
+workload('pluso backwards, 20 bits')(lambda: run(fresh(lambda n: pluso(n, num.build(2**19 + 7), num.build(2**20 - 3)))))
+
+# }}}
+
+# INDEXING {{{
+
+rows = [(i, i * i) for i in range(500)]
+keys = list(range(0, 500, 7))
+
+def lookups(squareo):
+    return fresh(lambda q: conj(disj(*[unify(q, k) for k in keys], interleaving=False), fresh(lambda y: squareo(q, y))))
+
+squareos = {
+    'conde': lambda x, y: conde(*[[unify(x, i), unify(y, s)] for i, s in rows]),
+    'indexed_conde': lambda x, y: indexed_conde(*[[unify(x, i), unify(y, s)] for i, s in rows]),
+    'facts': facts(*rows),
+}
+
+for name, squareo in squareos.items():
+    workload('{} lookups in {} rows, {}'.format(len(keys), len(rows), name))(lambda squareo=squareo: run(lookups(squareo)))
+
+# }}}
+
+# CONSTRAINTS {{{
+
+def holds(p, *logic_vars):
+    return project(*logic_vars, into=lambda *vs: succeed if p(*vs) else fail)
+
+def queens_filtered(n):
+
+    def Q(*qs):
+        goals = []
+        for j, qj in enumerate(qs):
+            goals.append(disj(*[unify(qj, v) for v in range(n)], interleaving=False))
+            for i, qi in enumerate(qs[:j]): # as soon as both queens are placed
+                goals.append(holds(lambda a, b, k=j-i: a != b and abs(a - b) != k, qi, qj))
+        return conj(*goals)
+
+    return fresh(lambda r: fresh(lambda *qs: conj(Q(*qs), unify(list(qs), r)), arity=n))
+
+def queens_constrained(n):
+
+    def Q(*qs):
+
+        def diagonals(*ds): # queen `i` lies on diagonals `q + i` and `q - i`, which differ among queens
+            ups, downs = ds[:n], ds[n:]
+            return conj(*[conj(infd(u, range(2 * n)), fd_plus(q, i, u), infd(d, range(-n, n)), fd_plus(d, i, q))
+                          for i, (q, u, d) in enumerate(zip(qs, ups, downs))],
+                        fd_distinct(*ups), fd_distinct(*downs))
+
+        return conj(*[infd(q, range(n)) for q in qs], fd_distinct(*qs), fresh(diagonals, arity=2 * n), labeling(*qs))
+
+    return fresh(lambda r: fresh(lambda *qs: conj(Q(*qs), unify(list(qs), r)), arity=n))
+
+def pairs_filtered(l):
+    return fresh(lambda r, x, y: conj(membero(x, l), membero(y, l), holds(lambda a, b: a != b, x, y), unify([x, y], r)))
+
+def pairs_constrained(l):
+    return fresh(lambda r, x, y: conj(disunify(x, y), membero(x, l), membero(y, l), unify([x, y], r)))
+
+def sums_constrained(k):
+    return fresh(lambda r, x, y: conj(infd(x, range(k + 1)), infd(y, range(k + 1)), fd_plus(x, y, k),
+                                      labeling(x, y), unify([x, y], r)))
+
+workload('6 queens, filtered')(lambda: run(queens_filtered(6)))
+workload('6 queens, constrained')(lambda: run(queens_constrained(6)))
+workload('distinct pairs of 40, filtered')(lambda: run(pairs_filtered(list(range(40)))))
+workload('distinct pairs of 40, constrained')(lambda: run(pairs_constrained(list(range(40)))))
+workload('sums to 32, pluso')(lambda: run(fresh(lambda r, x, y: conj(pluso(x, y, int_to_list(32)), unify([x, y], r)))))
+workload('sums to 32, fd_plus')(lambda: run(sums_constrained(32)))
+
+# }}}
+
+# DISTINCT {{{
+
+lines = [list(range(i, i + 100)) for i in range(5)]
+shared = list_to_cons([list_to_cons(l) for l in lines] * 40) # each line is one term, as relations bind vars to
+
+searches = {
+    'flatteno of 4 lists': lambda: fresh(lambda x: flatteno([['a', ['b']], 'c', ['d']], x)),
+    'membero of 40 x 5 lines': lambda: fresh(lambda x: membero(x, lines * 40)),
+    'membero of 40 x 5 shared': lambda: fresh(lambda x: membero(x, shared)),
+}
+
+for name, goal in searches.items():
+    workload('{}, distinct'.format(name))(lambda goal=goal: run(goal(), distinct=True))
+
+# }}}
+
+# MCCULLOCH {{{
+
+workload('mcculloch_lawo, proof of 8')(
+    lambda: run(fresh(lambda out, γ, αγ: conj(mcculloch_lawo(γ, αγ), unify([γ, αγ], out))), n=6))
+workload('craig_lawo, 20')(
+    lambda: run(fresh(lambda out, χ, M_of_χ, γ: conj(unify([3, 5, 4]+γ, χ),
+                                                     craig_lawo(χ, M_of_χ),
+                                                     unify([χ, M_of_χ], out))), n=1))
+
+# }}}
+
+# INTERLEAVING {{{
+
+def splitso(cond):
+    def S(l, s, out):
+        return cond([nullo(l), unify(s, out)],
+                    [fresh(lambda a, d, res: conj(unify([a] + d, l), unify([a] + res, out), S(d, s, res)))])
+    return S
+
+for name, cond in [('depth-first', conde), ('interleaving', condi)]:
+    workload('splits of 60 items, {}'.format(name))(
+        lambda cond=cond: run(fresh(lambda x, y: splitso(cond)(x, y, list(range(60)))), var_selector=lambda x, y: [x, y]))
+
+# }}}
+
+# SCHEDULERS {{{
+
+searches = {
+    'proof of 9': (lambda: fresh(lambda out, α, γ, αγ, αγ2αγ: conji(mclock.appendo([3, 3, 2]+α, [3, 3], γ),
+                                                                    mclock.appendo(α, γ, αγ),
+                                                                    associateo(αγ, αγ2αγ),
+                                                                    mccullocho(γ, αγ2αγ),
+                                                                    unify([α, γ], out))), 4),
+    'law 10': (lambda: fresh(lambda ν, ν2ν, ν2ν2ν2ν: conji(associateo(ν, ν2ν),
+                                                           associateo(ν2ν, ν2ν2ν2ν),
+                                                           mccullocho(ν, ν2ν2ν2ν))), 1),
+    'craig reversed': (lambda: fresh(lambda α, α_reversed: conji(reverseo(α, α_reversed),
+                                                                 mcculloch__o(α, α_reversed))), 1),
+    'many live streams': (lambda: fresh(lambda q, α, β: conji(opnumbero(α), opnumbero(β), unify([α, β], q))), 300),
+}
+
+schedulers = {
+    'dovetail': dovetail,
+    'round_robin': round_robin,
+    'weighted 4,2,1': weighted(lambda k: 2 ** max(0, 2 - k)),
+}
+
+for name, (goal, n) in searches.items():
+    for s, scheduler in schedulers.items():
+        workload('{}, {}'.format(name, s))(lambda goal=goal, n=n, scheduler=scheduler: run(goal(), n=n, scheduler=scheduler))
+
+# }}}
+
+# BOUNDED SEARCHES {{{
+
+def nat(cond):
+    def N(x):
+        return cond([unify(x, 0)], [fresh(lambda d: conj(unify(x, [d]), N(d)))])
+    return N
+
+def triples(cond, conj):
+    N = nat(cond)
+    return fresh(lambda q, a, b, c: conj(N(a), N(b), N(c), unify([a, b, c], q)))
+
+def craig():
+    return fresh(lambda out, χ, M_of_χ, γ: conj(unify([3, 5, 4]+γ, χ), craig_lawo(χ, M_of_χ), unify([χ, M_of_χ], out)))
+
+workload('triples of nats, interleaving')(lambda: run(triples(condi, conji), n=200))
+workload('triples of nats, deepening')(lambda: run(triples(conde, conj), n=200, deepening=True))
+workload('triples of nats, accounted')(lambda: run(triples(condi, conji), n=200, metrics=stream_metrics()))
+workload('triples of nats, deepening over 100')(
+    lambda: run(triples(condi, conji), n=200, metrics=stream_metrics(streams=100)))
+workload('craig_lawo, 20, deepening by 8')(lambda: run(craig(), n=1, deepening=range(8, 1000, 8)))
+
+# }}}
+
+# RUN MANY {{{
+
+splits = list(range(60))
+prefix, query, inputs = (lambda x, y: splitso(conde)(x, y, splits)), (lambda i, x, y: unify(y, splits[i:])), range(0, 61, 4)
+
+workload('splits of 60 items, run each')(
+    lambda: [run(fresh(lambda x, y: conj(prefix(x, y), query(i, x, y)))) for i in inputs])
+workload('splits of 60 items, run_many')(lambda: run_many(query, inputs, prefix=prefix))
+
+# }}}
+
+# CHECKPOINTS {{{
+
+def pairs(k):
+    return fresh(lambda q, x, y: conj(membero(x, list(range(k))), membero(y, list(range(k))), unify([x, y], q)))
+
+class crash(Exception): pass
+
+def crashing(after):
+    found = 0
+    def post(r):
+        nonlocal found
+        found += 1
+        if found == after: raise crash
+        return cons_to_list(r)
+    return post
+
+directory = tempfile.mkdtemp(prefix='muk-suite-')
+atexit.register(shutil.rmtree, directory, ignore_errors=True)
+checkpoint, halfway = os.path.join(directory, 'search.checkpoint'), os.path.join(directory, 'halfway.checkpoint')
+
+def resumed():
+    if not os.path.exists(halfway): # written once, then copied before each resume, which completes it
+        try: run(pairs(60), post=crashing(len(run(pairs(60))) // 2), checkpoint=halfway, every=0)
+        except crash: pass
+    shutil.copyfile(halfway, checkpoint)
+    return resume(pairs(60), checkpoint)
+
+workload('pairs of 60 members, compiled')(lambda: run(pairs(60), compiled=True))
+workload('pairs of 60 members, checkpoint every 0s')(lambda: run(pairs(60), checkpoint=checkpoint, every=0))
+workload('pairs of 60 members, checkpoint every 60s')(lambda: run(pairs(60), checkpoint=checkpoint, every=60))
+workload('pairs of 60 members, resumed halfway')(resumed)
+
+# }}}
+
+# COMMITTED CHOICES {{{
+
+def loopo(k):
+    return succeed if k == 0 else fresh(lambda x: conj(reasonedschemer.onceo(nat(condi)(x)), loopo(k - 1)))
+
+workload('onceo loop of 100')(lambda: run(fresh(lambda q: conj(loopo(100), unify(q, 100)))))
+workload('enumerateo pluso of 2 bits')(lambda: run(fresh(lambda s: enumerateo(pluso, s, [1, 1]))))
+
+# }}}
+
+# ASYNCHRONOUS {{{
+
+def concurrently(query, queries=4):
+    async def gathered(): return await asyncio.gather(*[query() for _ in range(queries)])
+    loop = asyncio.new_event_loop() # Python 3.6 has no `asyncio.run`
+    try: return loop.run_until_complete(gathered())
+    finally: loop.close()
+
+def pooled():
+    pool = process_pool(2) # on the loop of `concurrently`, which is new at each call
+    return concurrently(lambda: async_run(pairs(30), compiled=True, pool=pool))
+
+async def blocking(): return run(pairs(30), compiled=True) # as the `async_run` s below search
+
+workload('4 queries, run')(lambda: concurrently(blocking))
+for steps in [100, 1000, 10000]:
+    workload('4 queries, async_run by {} steps'.format(steps))(
+        lambda steps=steps: concurrently(lambda: async_run(pairs(30), compiled=True, steps=steps)))
+workload('4 queries, process pool of 2')(pooled)
+
+# }}}
+
+def timed(thunk, loops):
+    start = time.perf_counter()
+    for _ in range(loops): thunk()
+    return time.perf_counter() - start
+
+def measure(thunk, runs, warmups, min_time):
+    loops = 1
+    while timed(thunk, loops) < min_time: loops *= 2 # calibration, as pyperf does
+    for _ in range(warmups): timed(thunk, loops)
+    values = [timed(thunk, loops) / loops for _ in range(runs)]
+    return {'loops': loops, 'values': values, 'min': min(values), 'median': statistics.median(values),
+            'mean': statistics.mean(values), 'stdev': statistics.stdev(values) if runs > 1 else 0.0}
+
+def peak(thunk):
+    '''The peak of memory that a call of ``thunk`` allocates, as ``tracemalloc`` traces it.'''
+    tracemalloc.start()
+    try:
+        thunk()
+        return tracemalloc.get_traced_memory()[1]
+    finally: tracemalloc.stop()
+
+def metadata():
+    try: commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                          stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError): commit = None
+    return {'python': platform.python_version(), 'implementation': platform.python_implementation(),
+            'platform': platform.platform(), 'cpus': os.cpu_count(), 'commit': commit,
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+def compare(results, baseline, threshold):
+    '''Rows of a name, baseline and current times and a verdict, for workloads of ``results``.'''
+    rows = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if b is None:
+            rows.append((name, None, r['min'], 'new'))
+            continue
+        ratio = r['min'] / b['min']
+        verdict = 'slower' if ratio > 1 + threshold else 'faster' if ratio < 1 / (1 + threshold) else ''
+        rows.append((name, b['min'], r['min'], verdict))
+    return rows
+
+def seconds(t):
+    return '-' if t is None else '{:.3f}ms'.format(t * 1e3) if t >= 1e-4 else '{:.2f}µs'.format(t * 1e6)
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Benchmarks of the microkanren engine.')
+    parser.add_argument('-o', '--output', help='the JSON file to write results to')
+    parser.add_argument('-b', '--baseline', help='the JSON file of a previous run to compare with')
+    parser.add_argument('-t', '--threshold', type=float, default=0.1,
+                        help='the relative change that counts as a regression, 0.1 by default')
+    parser.add_argument('-k', '--select', help='a regex of the names of the workloads to run')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--warmups', type=int, default=1)
+    parser.add_argument('--min-time', type=float, default=0.1, help='the seconds that the loops of a run take at least')
+    parser.add_argument('--memory', action='store_true', help='trace the peak of memory of a further call of each workload')
+    args = parser.parse_args(argv)
+
+    sys.setrecursionlimit(100000) # the bit level arithmetic needs it
+    row = '{:<42} {:>12} {:>12} {:>10} {:>7} {:>10}'
+    print(row.format('workload', 'min', 'median', 'stdev', 'loops', 'peak' if args.memory else ''))
+    results = {}
+    for name, thunk in workloads.items():
+        if args.select and not re.search(args.select, name): continue
+        r = results[name] = measure(thunk, args.runs, args.warmups, args.min_time)
+        if args.memory: r['peak'] = peak(thunk)
+        print(row.format(name, seconds(r['min']), seconds(r['median']), seconds(r['stdev']), r['loops'],
+                         '{:.0f}KiB'.format(r['peak'] / 1024) if args.memory else ''))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'metadata': metadata(), 'benchmarks': results}, f, indent=2)
+
+    if not args.baseline: return 0
+    if not os.path.exists(args.baseline):
+        print('\nno baseline at {}, write one with --output'.format(args.baseline))
+        return 0
+    with open(args.baseline) as f: baseline = json.load(f)
+    rows = compare(results, baseline['benchmarks'], args.threshold)
+    row = '{:<42} {:>12} {:>12} {:>8} {:>7}'
+    print('\ncompared with {} ({})'.format(args.baseline, baseline['metadata'].get('commit')))
+    print(row.format('workload', 'baseline', 'current', 'change', ''))
+    for name, b, c, verdict in rows:
+        change = '-' if b is None else '{:+.1f}%'.format((c / b - 1) * 100)
+        print(row.format(name, seconds(b), seconds(c), change, verdict))
+    return 1 if any(verdict == 'slower' for *_, verdict in rows) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -93,9 +93,9 @@ mcculloch__o = machine(rules=[ mcculloch_second_ruleo, mcculloch_fourth_ruleo, m
 @adapt_iterables_to_conses(all_arguments)
 def opnumbero(α):
      return disj(nullo(α), fresh(lambda a, β: conj(appendo(β, [a], α), 
-                                     condi([unify(a, 3), succeed],
-                                           [unify(a, 4), succeed],
-                                           [unify(a, 5), succeed]), 
+                                     indexed_condi([unify(a, 3), succeed],
+                                                   [unify(a, 4), succeed],
+                                                   [unify(a, 5), succeed]), 
                                      fresh(lambda: opnumbero(β)))))
 
 
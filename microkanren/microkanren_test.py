@@ -1,9 +1,13 @@
 
-import unittest
+import unittest, threading, time, os, tempfile, weakref, gc, warnings
 
 from muk.core import *
 from muk.ext import *
 from muk.sexp import *
+from muk.profiler import profiling
+import muk.profiler
+
+one = lambda q: unify(q, 1) # a goal built by a lambda of the module, see `test_profiling`
 
 class microkanren_tests(unittest.TestCase):
 
@@ -145,5 +149,796 @@ class microkanren_tests(unittest.TestCase):
         self.assertEqual(run(fresh(questiono(d=3))), ['a', 'b', 'c', 'a', 'b', 'c', 'a', 'b', 'c'])
         self.assertEqual(run(fresh(questiono(d=10)), n=4), ['a', 'b', 'c', 'a'])
 
+    def test_persistent_substitution(self):
+
+        m = pmap()
+        extended = [m]
+        for i in range(1000): extended.append(extended[-1].assoc(var(i, 'x'), i))
+
+        self.assertEqual(len(m), 0) # structure sharing leaves older maps untouched
+        self.assertEqual(len(extended[500]), 500)
+        self.assertEqual(extended[-1], {var(i, 'x'): i for i in range(1000)})
+        self.assertNotIn(var(500, 'x'), extended[500])
+        self.assertEqual(extended[-1].assoc(var(3, 'x'), 'three')[var(3, 'x')], 'three')
+
+        class colliding:
+            def __init__(self, i): self.i = i
+            def __eq__(self, other): return self.i == other.i
+            def __hash__(self): return 42
+
+        c = pmap((colliding(i), i) for i in range(10))
+        self.assertEqual([c[colliding(i)] for i in range(10)], list(range(10)))
+        with self.assertRaises(KeyError): c[colliding(10)]
+
+    def test_run_with_persistent_substitution(self):
+
+        def ns(x, n):
+            return disj(unify(x, n), snooze(ns, [x, n+1]))
+
+        for goal in [lambda: fresh(lambda x: ns(x, 0)),
+                     lambda: fresh(lambda w, x, y, z: conj(unify([3,[4,5],6], [3, [x, y], z]), unify([x, y, z], w)))]:
+            self.assertEqual(run(goal(), n=10), run(goal(), n=10, substitution=pmap))
+
+    def test_walk_star_without_recursion(self):
+
+        def cars(c, k=4):
+            l = []
+            while isinstance(c, cons) and len(l) < k: l, c = l + [c.car], c.cdr
+            return l
+
+        x, y = var(0, 'x'), var(1, 'y')
+        c = []
+        for i in reversed(range(100000)): c = cons(x if i % 2 else i, c)
+
+        self.assertEqual(cars(walk_star(y, sub={y: c, x: 'odd'})), [0, 'odd', 2, 'odd'])
+        self.assertEqual(cars(reify(walk_star(c, sub={}))), [0, rvar(0), 2, rvar(0)])
+
+        with self.assertRaises(RecursionError): walk_star(x, sub={x: [1, y], y: cons(2, x)})
+
+    def test_walk_memo(self):
+
+        x, y, z = var(0, 'x'), var(1, 'y'), var(2, 'z')
+        sub = pmap({x: y, y: z, z: 'a'})
+        self.assertEqual(walk(x, sub), 'a')
+        self.assertEqual(sub.memo, {x: 'a', y: 'a', z: 'a'})
+        extended = pmap({x: y}).assoc(y, z)
+        self.assertEqual(walk(x, extended), z)
+        self.assertEqual(walk(x, extended.assoc(z, 'b')), 'b') # memo is per map, never stale
+
+    def test_unifiers_table(self):
+
+        class point: # a user term, unifiable coordinate-wise with other points only
+            def __init__(self, x, y): self.x, self.y = x, y
+
+        def unify_points(u, v, sub, ext_s, pairs):
+            pairs.append((u.y, v.y))
+            pairs.append((u.x, v.x))
+            return sub
+
+        register_unifier(point, point, unify_points)
+        self.assertEqual(run(fresh(lambda q: unify(point(1, q), point(1, 2)))), [2])
+        self.assertEqual(run(fresh(lambda q, x: conj(unify(point(x, q), point(q, 3)), unify(x, 4)))), [])
+        self.assertEqual(run(fresh(lambda q: unify(point(1, q), (1, q)))), [])
+
+        def conses(n, tail=[]):
+            for i in reversed(range(n)): tail = cons(i, tail)
+            return tail
+
+        x, l = var(0, 'x'), conses(5000)
+        self.assertEqual(unification(l, conses(4999, tail=cons(x, [])), {}, ext_s), {x: 4999})
+        self.assertIs(walk(x, unification(l, list_to_cons([0, 1] + x), {}, ext_s)), l.cdr.cdr)
+
+        with self.assertRaises(UnificationError): 
+            unification(list_to_cons(list(range(60)) + ['a']), list_to_cons(list(range(60)) + ['b']), {}, ext_s)
 
+    def test_seq_terms(self):
 
+        x, y = var(0, 'x'), var(1, 'y')
+        self.assertEqual(unification(seq([1, x, 3]), list_to_cons([1, 2] + y), {}, ext_s), {x: 2, y: seq([3])})
+        self.assertEqual(unification(seq([1, 2], tail=y), seq([1, x, 3, 4]), {}, ext_s), {x: 2, y: seq([3, 4])})
+        with self.assertRaises(UnificationError): 
+            unification(seq([1, x]), seq([1, 2, 3]), {}, ext_s)
+
+        self.assertEqual(walk_star(seq([x, y], tail=y), {y: seq([5])}), seq([x, seq([5]), 5]))
+        self.assertEqual(reify(seq([x, [y]], tail=x)), seq([rvar(0), [rvar(1)]], tail=rvar(0)))
+        self.assertEqual(run(fresh(lambda q, d: conj(unify([1] + d, seq(range(1, 100))), unify(q, d)))), 
+                         [list(range(2, 100))])
+        self.assertEqual(run(fresh(lambda q: unify_occur_check(q, seq([1], tail=q)))), [])
+
+    def test_tabled(self):
+
+        edges = [(1, 2), (2, 3), (3, 1), (3, 4)]
+
+        def edgeo(x, y): 
+            return disj(*[conj(unify(x, a), unify(y, b)) for a, b in edges])
+
+        @tabled
+        def patho(x, y): # left recursive on a cyclic graph, it diverges if not tabled
+            return conde([fresh(lambda z: conj(patho(x, z), edgeo(z, y)))], [edgeo(x, y)])
+
+        self.assertEqual(sorted(run(fresh(lambda y: patho(1, y)))), [1, 2, 3, 4])
+        self.assertEqual(patho.tables.stats(), {'calls': 1, 'answers': 4, 'complete': 1, 'hits': 3, 'misses': 1})
+        self.assertEqual(sorted(run(fresh(lambda y: patho(1, y)))), [1, 2, 3, 4])
+        self.assertEqual(patho.tables.hits, 4) # no search at all
+        self.assertEqual(run(fresh(lambda q: patho(4, q))), [])
+
+        @tabled
+        def eveno(x, y): # mutually recursive relations, whose tables complete together
+            return conde([edgeo(x, y)], [fresh(lambda z: conj(oddo(x, z), edgeo(z, y)))])
+
+        @tabled
+        def oddo(x, y): 
+            return fresh(lambda z: conj(eveno(x, z), edgeo(z, y)))
+
+        self.assertEqual(sorted(run(fresh(lambda q, y: conj(oddo(2, y), unify(q, y))))), [1, 2, 3, 4])
+        self.assertEqual((len(oddo.tables), len(eveno.tables)), (1, 1))
+        self.assertTrue(all(e.complete for e in eveno.tables.entries.values()))
+
+        patho.tables.abolish()
+        self.assertEqual(len(patho.tables), 0)
+
+    def test_parallel_run(self):
+
+        def nat(x):
+            return condi([unify(x, [])], [fresh(lambda d: conj(unify(x, [1] + d), nat(d)))])
+
+        def goal(): 
+            return fresh(lambda q: condi([nat(q)], 
+                                         [conde([unify(q, 'tea')], [unify(q, 'cup')])], 
+                                         [fresh(lambda x, y: conj(disj(unify(x, 1), unify(x, 2)), unify(q, [x, y])))]))
+
+        expected = run(goal(), n=12)
+        for workers in [1, 2, 3, 8]:
+            self.assertEqual(run(goal(), n=12, workers=workers), expected)
+            self.assertEqual(len(run(goal(), n=12, workers=workers, ordered=False)), 12)
+
+        finite = fresh(lambda q: conde([unify(q, 1)], [fail], [fresh(lambda x: conj(unify(x, 2), unify(q, [x])))]))
+        self.assertEqual(run(finite, workers=2), [1, [2]])
+        self.assertEqual(run(fresh(lambda q: disj(unify(q, 1), unify(q, 2), unify(q, 3))), workers=1), [1, 2, 3]) # one subproblem
+        self.assertCountEqual(run(finite, workers=2, ordered=False), [1, [2]])
+
+        with self.assertRaises(RecursionError): # errors in workers reach the caller
+            run(fresh(lambda q: conde([unify(q, 1)], [nat(q)])), workers=2)
+
+    def test_schedulers(self):
+
+        def streams(): 
+            return iter([iter('ab'), iter(''), iter('cde'), iter('f'), iter('ghij')])
+
+        self.assertEqual(''.join(dovetail(streams())), 'abcfdgehij')
+        self.assertEqual(''.join(round_robin(streams())), 'abcdfeghij')
+        self.assertEqual(''.join(weighted(lambda k: 3 if k == 2 else 1)(streams())), 'abcdefghij')
+        self.assertEqual(''.join(mplus(streams(), interleaving=False)), 'abcdefghij')
+
+        def nat(x):
+            return condi([unify(x, 0)], [fresh(lambda d: conj(unify(x, [d]), nat(d)))])
+
+        def goal(): 
+            return fresh(lambda q: condi([nat(q)], [unify(q, 'a')], [unify(q, 'b')]))
+
+        self.assertEqual(run(goal(), n=4), [0, 'a', [0], 'b'])
+        self.assertEqual(run(goal(), n=4, scheduler=round_robin), [0, [0], 'a', [[0]]])
+        self.assertEqual(run(goal(), n=4), [0, 'a', [0], 'b']) # the default one again
+
+    def test_flat_conj_disj_conde(self):
+
+        from muk.core import _conj, _disj
+        from muk.utils import foldr
+
+        n = 5000 # far more goals than the default recursion limit allows nesting
+        vs = [var(n + i, 'v') for i in range(n)] # indices that `fresh` does not hand out here
+
+        self.assertEqual(run(fresh(lambda q: conj(*[unify(v, i) for i, v in enumerate(vs)], unify(q, vs[-1])))), [n-1])
+        self.assertEqual(run(fresh(lambda q: disj(*[unify(q, i) for i in range(n)], interleaving=False)), n=3), [0, 1, 2])
+        self.assertEqual(len(run(fresh(lambda q: disj(*[unify(q, i) for i in range(n)], interleaving=False)))), n)
+        self.assertEqual(run(fresh(lambda q: conde(*[[unify(q, i), succeed] for i in range(n)], else_clause=[unify(q, 'e')])))[-2:],
+                         [n-1, 'e'])
+
+        # same order as nesting the binary goals
+        def nested(q):
+            return _disj(_conj(disj(unify(q, 1), unify(q, 2)), succeed, interleaving=False),
+                         _disj(unify(q, 3), unify(q, 4), interleaving=False), interleaving=False)
+
+        def flat(q):
+            return disj(conj(disj(unify(q, 1), unify(q, 2)), succeed), unify(q, 3), unify(q, 4), interleaving=False)
+
+        self.assertEqual(run(fresh(nested)), run(fresh(flat)))
+        self.assertEqual(foldr(lambda a, r: [a, r], range(n), initialize=[])[:1], [0])
+
+        # interleaving ones nest, whatever the number of goals, unless flat, with the same answers in another order
+        def nat(x):
+            return condi([unify(x, 0)], [fresh(lambda d: conj(unify(x, [d]), nat(d)))])
+        self.assertEqual(run(fresh(lambda q: disj(nat(q), nat(q), unify(q, 'b'))), n=6), [0, 0, [0], 'b', [[0]], [0]])
+        self.assertEqual(run(fresh(lambda q: disj(nat(q), nat(q), unify(q, 'b'), flat=True)), n=6), [0, 0, [0], 'b', [0], [[0]]])
+        self.assertEqual(sorted(run(fresh(lambda q: disj(*[unify(q, i) for i in range(1000)], flat=True)))), list(range(1000)))
+        self.assertEqual(run(fresh(lambda q: conji(*[unify(v, i) for i, v in enumerate(vs[:1000])], unify(q, vs[999]), flat=True))), 
+                         [999])
+        pairs = lambda k, flat: fresh(lambda q, a, b: conji(disj(*[unify(a, i) for i in range(4)], flat=flat), *[succeed] * k,
+                                                            disj(*[unify(b, i) for i in range(4)], flat=flat), unify([a, b], q),
+                                                            flat=flat))
+        self.assertEqual(run(pairs(40, False)), run(pairs(1, False))) # nested, so the same order
+        self.assertCountEqual(run(pairs(1000, True)), run(pairs(1, False)))
+        self.assertEqual(run(pairs(1000, True), scheduler=depth_first), run(pairs(1, False), scheduler=depth_first))
+        m = stream_metrics()
+        self.assertEqual((len(run(pairs(1000, True), metrics=m)), m.suspended), (16, 0))
+
+    def test_constraints(self):
+
+        from muk.constraints import disunify, absento, infd, fd_lt, fd_plus, fd_distinct, fd_neq, labeling
+
+        def one_of(q, *values):
+            return disj(*[unify(q, v) for v in values], interleaving=False)
+
+        self.assertEqual(run(fresh(lambda q: conj(disunify(q, 2), one_of(q, 1, 2, 3)))), [1, 3])
+        self.assertEqual(run(fresh(lambda q: conj(one_of(q, 1, 2, 3), disunify(q, 2)))), [1, 3])
+        self.assertEqual(run(fresh(lambda q, x, y: conj(disunify([x, 1], [2, y]), unify(x, 2), one_of(y, 1, 5), unify([x, y], q)))),
+                         [[2, 5]])
+        self.assertEqual(run(fresh(lambda q: conj(disunify(q, q), succeed))), [])
+        self.assertEqual(run(fresh(lambda q, x: conj(absento('cat', q), unify(q, [1, x]), one_of(x, 'cat', ['a', 'cat'], 'dog')))),
+                         [[1, 'dog']])
+        self.assertRaises(ValueError, absento, var(0, 'x'), [])
+
+        self.assertEqual(run(fresh(lambda q: conj(infd(q, range(10)), fd_lt(q, 3), labeling(q)))), [0, 1, 2])
+        self.assertEqual(run(fresh(lambda q: conj(infd(q, range(10)), fd_plus(q, q, 8), labeling(q)))), [4])
+        self.assertEqual(run(fresh(lambda q: conj(infd(q, range(3)), unify(q, 5)))), [])
+        for c in [lambda q: fd_lt(q, 'a'), lambda q: fd_lt('a', q), lambda q: fd_plus(q, 1.5, 2), lambda q: fd_neq(q, 'a')]:
+            self.assertEqual(run(fresh(lambda q: conj(infd(q, range(3)), c(q)))), []) # fails, instead of raising
+        [s] = fresh(lambda q: conj(infd(q, range(3)), fd_neq(q, 0), fd_neq(q, 2)))(emptystate())
+        self.assertEqual(list(s.store.domains.values()), [frozenset([1])]) # narrowed before labeling
+        self.assertRaises(ValueError, run, fresh(lambda q: labeling(q)))
+
+        def queens(n):
+
+            def apart(qi, qj, k): # diagonals, since `qi + k` and `qj + k` differ from `qj` and `qi`, respectively
+                return fresh(lambda a, b: conj(infd(a, range(k, n + k)), infd(b, range(k, n + k)),
+                                               fd_plus(qi, k, a), fd_plus(qj, k, b), fd_neq(a, qj), fd_neq(b, qi)))
+
+            def Q(*qs):
+                return conj(*[infd(q, range(n)) for q in qs], fd_distinct(*qs),
+                            *[apart(qs[i], qs[j], j - i) for i in range(n) for j in range(i + 1, n)],
+                            labeling(*qs))
+
+            return fresh(lambda r: fresh(lambda *qs: conj(Q(*qs), unify(list(qs), r)), arity=n))
+
+        self.assertEqual(run(queens(4)), [[1, 3, 0, 2], [2, 0, 3, 1]])
+        self.assertEqual(len(run(queens(6))), 4)
+
+    def test_compiled(self):
+
+        from muk.vm import compile_goal, execute
+        from muk.constraints import disunify
+
+        def nat(x):
+            return conde([unify(x, 0)], [fresh(lambda d: conj(unify(x, [d]), nat(d)))])
+
+        def nati(x):
+            return condi([unify(x, 0)], [fresh(lambda d: conj(unify(x, [d]), nati(d)))])
+
+        goals = [
+            (lambda: fresh(lambda q: nat(q)), 5),
+            (lambda: fresh(lambda q: conj(nat(q), unify(q, [[0]]))), 1),
+            (lambda: fresh(lambda q: disj(nati(q), unify(q, 'a'), interleaving=True)), 6),
+            (lambda: fresh(lambda q, r: conj(disj(unify(q, 1), unify(q, 2), interleaving=False), 
+                                             conda([unify(r, q), succeed], else_clause=[fail]))), False),
+            (lambda: fresh(lambda q: conj(disunify(q, 2), disj(unify(q, 1), unify(q, 2), unify(q, 3), interleaving=False))), False),
+            (lambda: fresh(lambda q: conj(unify(q, 3), project(q, into=lambda q: unify(q + 1, 4)))), False),
+            (lambda: fresh(lambda q: conj(fail, nat(q))), False),
+        ]
+
+        for goal, n in goals:
+            self.assertEqual(run(goal(), n=n, compiled=True), run(goal(), n=n))
+
+        g = conj(unify(var(0, 'x'), 1), disj(succeed, unify(var(1, 'y'), 2), interleaving=False))
+        self.assertIs(compile_goal(g), compile_goal(g)) # compiled once
+        self.assertEqual([s.sub for s in execute(g, emptystate())], 
+                         [{var(0, 'x'): 1}, {var(0, 'x'): 1, var(1, 'y'): 2}])
+
+        # no frame per level of recursion
+        self.assertEqual(run(fresh(lambda q: conj(nat(q), unify(q, [[[0]]]))), n=1, compiled=True), [[[[0]]]])
+        self.assertEqual(len(run(fresh(lambda q: nat(q)), n=1200, post=lambda r: r, substitution=pmap, compiled=True)), 1200)
+
+    def test_run_iter(self):
+
+        def nat(x):
+            return condi([unify(x, 0)], [fresh(lambda d: conj(unify(x, [d]), nat(d)))])
+
+        self.assertEqual(list(run_iter(fresh(lambda q: nat(q)), n=10)), run(fresh(lambda q: nat(q)), n=10))
+        self.assertEqual(list(run_iter(fresh(lambda q: nat(q)), n=5, scheduler=round_robin, compiled=True)), 
+                         run(fresh(lambda q: nat(q)), n=5, scheduler=round_robin, compiled=True))
+        self.assertEqual(list(run_iter(fresh(lambda q: conj(unify(q, 1), fail)))), [])
+
+        answers = run_iter(fresh(lambda q: nat(q))) # an infinite enumeration, consumed lazily
+        self.assertEqual([next(answers) for _ in range(3)], [0, [0], [[0]]])
+        answers.close()
+
+        closed = []
+        def watched(s):
+            try: yield from nat(var(s.next_index, 'w'))(state(s.sub, s.next_index + 1))
+            finally: closed.append(True)
+        for answer in run_iter(watched): break
+        self.assertEqual(closed, [True]) # leaving the loop closes the search
+
+        token, seen = threading.Event(), []
+        for answer in run_iter(fresh(lambda q: nat(q)), cancel=token):
+            seen.append(answer)
+            if len(seen) == 4: token.set()
+        self.assertEqual(len(seen), 4)
+
+        with self.assertRaises(TimeoutError):
+            for answer in run_iter(fresh(lambda q: nat(q)), timeout=0.05): time.sleep(0.01)
+
+        # searches that find no answer end as well
+        def forever(s):
+            while True: yield s
+        def spin(x):
+            return conde([fail], [fresh(lambda y: spin(y))])
+        for goal, compiled in [(conj(forever, fail, interleaving=True), False),
+                               (conj(forever, fail, interleaving=True), True),
+                               (fresh(spin), True)]:
+            with self.assertRaises(TimeoutError):
+                next(run_iter(goal, timeout=0.05, compiled=compiled))
+            token = threading.Event()
+            threading.Timer(0.05, token.set).start()
+            self.assertEqual(list(run_iter(goal, cancel=token, compiled=compiled)), [])
+
+        pairs = list(run_iter(fresh(lambda q: nat(q)), n=3, timed=True))
+        self.assertEqual([a for a, t in pairs], [0, [0], [[0]]])
+        self.assertTrue(all(isinstance(t, float) and t >= 0 for a, t in pairs))
+
+
+    def test_profiling(self):
+
+        def appendo(l, s, out):
+            return conde([unify([], l), unify(s, out)],
+                         else_clause=[fresh(lambda a, d, res: conj(unify([a] + d, l), 
+                                                                   unify([a] + res, out),
+                                                                   appendo(d, s, res)))])
+
+        def splits(q, l):
+            return fresh(lambda x, y: conj(appendo(x, y, l), unify([x, y], q)))
+
+        with profiling() as p:
+            answers = run(fresh(lambda q: splits(q, [1, 2, 3])))
+        self.assertEqual(answers, run(fresh(lambda q: splits(q, [1, 2, 3])))) # same search
+        self.assertEqual(p.calls['splits', 'fresh'], 1)
+        self.assertEqual(p.fresh_vars['splits'], 2)
+        self.assertEqual(p.fresh_vars['appendo'], 4 * 3) # the else clause, tried on `x` of 0 up to 3 items
+        self.assertEqual(p.failures['appendo', 'unify'], 1) # as `out` is empty on the last try
+        stacks = dict(line.rsplit(' ', 1) for line in p.collapsed())
+        self.assertIn('test_profiling;splits;appendo', stacks)
+        self.assertTrue(all(int(us) >= 0 for us in stacks.values()))
+
+        self.assertIsNone(muk.profiler.active) # goals built outside the block are plain
+        g = unify(var(0, 'x'), 1)
+        self.assertEqual(g.terms, (var(0, 'x'), 1))
+        
+        with profiling(p): 
+            self.assertEqual(run(fresh(lambda q: appendo([1, 2], [3], q))), [[1, 2, 3]])
+        self.assertEqual(p.calls['appendo', 'clause 0'], 4 + 3) # a profile collects more runs
+        self.assertEqual(p.failures['appendo', 'clause 0'], 2) # `l` is a pair but in the last call
+
+        path = os.path.join(tempfile.mkdtemp(), 'profile.folded')
+        p.dump(path)
+        with open(path) as f: self.assertEqual(f.read().splitlines(), p.collapsed())
+
+        with profiling() as p: self.assertEqual(run(fresh(one)), [1])
+        self.assertEqual(p.calls['<toplevel>', 'unify'], 1)
+
+    def test_occurs_check(self):
+
+        from muk.core import _occurs, _linear
+
+        def nested(t, depth): # the car of the car of ... of a cons cell
+            for _ in range(depth): t = cons(t, [])
+            return t
+
+        x, y, z = var(0, 'x'), var(1, 'y'), var(2, 'z')
+        self.assertTrue(_occurs(x, nested(x, 50000), {})) # no frame per level
+        self.assertTrue(_occurs(x, nested(y, 10), {y: [1, z], z: cons(2, x)}))
+        self.assertFalse(_occurs(x, seq([y, 2], tail=z), {}))
+
+        ground = list_to_cons(list(range(1000)))
+        self.assertFalse(_occurs(x, ground, {}))
+        self.assertTrue(ground.ground and ground.cdr.cdr.ground) # remembered, for the cells inside too
+        self.assertFalse(list_to_cons([1, y]).ground or _occurs(x, list_to_cons([1, y]), {}))
+
+        self.assertEqual(run(fresh(lambda q, x: conj(unify(q, nested(x, 50000)), unify_occur_check(x, q)))), [])
+        self.assertEqual(run(fresh(lambda q: unify_occur_check(q, ground))), [list(range(1000))])
+
+        self.assertEqual(_linear([cons(x, y), z], [x, y]), {x, y})
+        self.assertEqual(_linear([cons(x, y), x], [x, y]), {y})
+        self.assertEqual(_linear([z, ground], [x, y]), set())
+
+        # the first goal of a `fresh` body skips the check for its vars that occur once
+        g, s = fresh(lambda a, d: conj(unify_occur_check([a] + d, z), unify_occur_check(a, d))).unfold(emptystate())
+        self.assertEqual(g.goals[0].unification.linear, {var(0, 'a'), var(1, 'd')})
+        self.assertEqual(g.goals[1].unification.linear, ())
+
+        for goal, answers in [
+                (lambda q: fresh(lambda a: unify_occur_check(a, [a])), []), # twice, hence checked
+                (lambda q: fresh(lambda a, b: conj(unify_occur_check(a, [b]), unify_occur_check(b, a))), []),
+                (lambda q: fresh(lambda a, d: conj(unify_occur_check([a] + d, q), unify(a, 1), unify(d, []))), [[1]]),
+                (lambda q: fresh(lambda a, d: conj(unify_occur_check([a] + d, q), unify_occur_check(q, d))), []),]:
+            self.assertEqual(run(fresh(goal)), answers)
+
+    def test_distinct(self):
+
+        def answers(q):
+            return conde([unify(q, [1, 2])], [unify(q, 3)], [unify(q, [1, 2])],
+                         [fresh(lambda a, b: unify(q, [a, b, a]))], [fresh(lambda c, d: unify(q, [c, d, c]))],
+                         [unify(q, seq([1, 2]))], [fresh(lambda a: unify(q, [a, 4]))], [unify(q, 3)])
+
+        self.assertEqual(run(fresh(answers), distinct=True), [[1, 2], 3, [rvar(0), rvar(1), rvar(0)], [rvar(0), 4]])
+        self.assertEqual(len(run(fresh(answers))), 8)
+        self.assertEqual(run(fresh(answers), n=3, distinct=True), [[1, 2], 3, [rvar(0), rvar(1), rvar(0)]])
+        self.assertEqual(list(run_iter(fresh(answers), distinct=True)), run(fresh(answers), distinct=True))
+        for workers in [2, 3]:
+            self.assertEqual(run(fresh(answers), n=3, workers=workers, distinct=True), run(fresh(answers), n=3, distinct=True))
+            self.assertCountEqual(run(fresh(answers), workers=workers, ordered=False, distinct=True), 
+                                  run(fresh(answers), distinct=True))
+
+        def nat(x): # infinitely many answers, but only two distinct ones
+            return condi([unify(x, 0)], [unify(x, 1)], [fresh(lambda d: conj(unify(d, 0), nat(x)))])
+
+        self.assertEqual(run(fresh(nat), n=2, distinct=True), [0, 1])
+
+        ground = list_to_cons(list(range(1000))) # as a relation binds a var to, shared by each answer
+        self.assertEqual(run(fresh(lambda q: disj(unify(q, ground), unify(q, ground))), distinct=True), [list(range(1000))])
+
+    def test_deepening(self):
+
+        def nat(x): # depth-first, hence complete only when bounded
+            return conde([unify(x, 0)], [fresh(lambda d: conj(unify(x, [d]), nat(d)))])
+
+        self.assertEqual(run(fresh(nat), depth=3), [0, [0], [[0]]])
+        self.assertEqual(run(fresh(nat), n=4, deepening=True), [0, [0], [[0]], [[[0]]]])
+        self.assertEqual(run(fresh(nat), depth=5, deepening=True), run(fresh(nat), depth=5))
+        self.assertEqual(run(fresh(nat), n=3, deepening=range(2, 100, 4)), [0, [0], [[0]]])
+        self.assertEqual(list(run_iter(fresh(nat), n=3, deepening=True)), [0, [0], [[0]]])
+        self.assertEqual(run(fresh(lambda q: conj(unify(q, [[0]]), nat(q))), deepening=True), [[[0]]]) # it stops, since it is finite
+        
+        pairs = run(fresh(lambda q, a, b: conj(nat(a), nat(b), unify([a, b], q))), n=4, deepening=True)
+        self.assertCountEqual(pairs, [[0, 0], [0, [0]], [[0], 0], [[0], [0]]]) # by depth, a plain run never varies `a`
+
+        self.assertEqual(run(fresh(lambda q: condi([unify(q, 1)], [nat(q)], [unify(q, 1)])), n=3, deepening=True), 
+                         [1, 0, [0]]) # by depth, each answer once
+        self.assertIs(muk.core._scheduler, dovetail)
+        with self.assertRaises(ValueError): run(fresh(nat), depth=3, workers=2)
+
+        def projected(x): # whose goals are built while searching, at any depth
+            return project(x, into=lambda _: conde([unify(x, 0)], [fresh(lambda d: conj(unify(x, [d]), projected(d)))]))
+
+        self.assertEqual(run(fresh(projected), depth=3), [0, [0], [[0]]]) # finite
+        self.assertEqual(run(fresh(projected), depth=3, compiled=True), [0, [0], [[0]]])
+        self.assertEqual(run(fresh(lambda q: conj(nat(q), nat(q))), depth=3), [0, [0], [[0]]]) # the second one is as deep as the first
+
+        from reasonedschemer import pluso
+        triples = lambda plus: fresh(lambda q, a, b, c: conj(plus(a, b, c), unify([a, b, c], q)))
+        self.assertEqual(run(triples(pluso), depth=4), run(triples(pluso.relational), depth=4))
+        self.assertEqual(run(triples(pluso), depth=3, deepening=True), run(triples(pluso.relational), depth=3, deepening=True))
+
+    def test_stream_metrics(self):
+
+        def nat(x):
+            return condi([unify(x, 0)], [fresh(lambda d: conj(unify(x, [d]), nat(d)))])
+
+        pairs = lambda: fresh(lambda q, a, b: conji(nat(a), nat(b), unify([a, b], q)))
+        answers = run(pairs(), n=30)
+
+        m = stream_metrics()
+        self.assertEqual(run(pairs(), n=30, metrics=m), answers) # accounting changes nothing
+        self.assertGreater(m.peak, 20)
+        self.assertGreater(m.peak_size, 0)
+        self.assertGreater(m.rounds, m.peak)
+        self.assertEqual((m.suspended, m.size, m.exceeded), (0, 0, False)) # every scheduler released its streams
+
+        m = stream_metrics(streams=10, fallback='depth-first')
+        first = run(pairs(), n=30, metrics=m)
+        self.assertTrue(m.exceeded)
+        self.assertEqual(first[:3], answers[:3]) # before exceeding
+        self.assertEqual(len({str(a) for a, b in first[-20:]}), 1) # depth-first, `a` stops varying
+
+        m = stream_metrics(streams=10, fallback='deepening')
+        deepened = run(pairs(), n=30, metrics=m)
+        self.assertTrue(m.exceeded)
+        self.assertLessEqual(m.peak, 11)
+        self.assertEqual(deepened[0], answers[0]) # before exceeding
+        self.assertEqual(len(set(map(str, deepened))), 30) # skipping the ones found before deepening
+        self.assertEqual(list(run_iter(pairs(), n=30, metrics=stream_metrics(streams=10, fallback='deepening'))), deepened)
+        self.assertEqual(run(pairs(), n=30, metrics=stream_metrics(streams=10)), deepened) # the default fallback
+
+        m, shared = stream_metrics(), stream_metrics()
+        run(pairs(), n=30, metrics=m)
+        self.assertEqual(run(pairs(), n=30, substitution=pmap, metrics=shared), answers)
+        self.assertGreater(shared.peak_size, m.peak_size / 2) # from the bindings of a `pmap`, not its shallow size
+        budgeted = stream_metrics(budget=m.peak_size / 2)
+        self.assertEqual(len(run(pairs(), n=30, substitution=pmap, metrics=budgeted)), 30)
+        self.assertTrue(budgeted.exceeded)
+
+        self.assertTrue(run(pairs(), n=5, metrics=stream_metrics(budget=0)))
+        self.assertIsNone(muk.core._metrics)
+        self.assertIs(muk.core._scheduler, dovetail)
+        with self.assertRaises(ValueError): stream_metrics(fallback='breadth-first')
+        with self.assertRaises(ValueError): run(pairs(), n=5, workers=2, metrics=stream_metrics())
+
+    def test_run_many(self):
+
+        searched = []
+
+        def colouro(c):
+            def C(s):
+                searched.append(s)
+                yield from disj(unify(c, 'red'), unify(c, 'green'), unify(c, 'blue'))(s)
+            return C
+
+        queries = lambda x, q, c: fresh(lambda z: conj(unify(z, x), unify(q, [z, c]))) # vars of the prefix, then fresh ones
+        answers = run_many(queries, ['a', 'b', 'c'], prefix=lambda q, c: colouro(c))
+        self.assertEqual(answers, [[['a', 'red'], ['a', 'green'], ['a', 'blue']],
+                                   [['b', 'red'], ['b', 'green'], ['b', 'blue']],
+                                   [['c', 'red'], ['c', 'green'], ['c', 'blue']]])
+        self.assertEqual(len(searched), 1) # the prefix once, for every query
+        self.assertEqual(answers, [run(fresh(lambda q, c: conj(colouro(c), queries(x, q, c)))) for x in 'abc'])
+
+        self.assertEqual(run_many(queries, 'ab', n=1, prefix=lambda q, c: colouro(c)), [[['a', 'red']], [['b', 'red']]])
+        self.assertEqual(run_many(lambda x, q: disj(unify(q, x), unify(q, x)), [1, 2], distinct=True), [[1], [2]])
+        self.assertEqual(run_many(lambda x, q: unify(q, x), [1, 2, 3], workers=2), [[1], [2], [3]])
+
+        def nat(x):
+            return condi([unify(x, 0)], [fresh(lambda d: conj(unify(x, [d]), nat(d)))])
+
+        self.assertEqual(run_many(lambda i, q: unify(q, i), [[[0]], 0], n=1, prefix=nat), [[[[0]]], [0]]) # infinite, lazily
+
+        class token: pass
+        tokens, alive = [], []
+        def minted(q):
+            def M(s):
+                for _ in range(200):
+                    t = token()
+                    tokens.append(weakref.ref(t))
+                    yield from unify(q, t)(s)
+            return M
+        def counted(s):
+            gc.collect()
+            alive.append(sum(t() is not None for t in tokens))
+            yield s
+        run_many(lambda i, q, t: counted if i == 'last' else succeed, ['first', 'last'], prefix=lambda q, t: minted(t))
+        self.assertEqual(alive[0], 200)
+        self.assertLess(alive[-1], 100) # states that no query needs any more are dropped, a block of `tee` at a time
+        self.assertIs(muk.core._scheduler, dovetail)
+
+    def test_checkpoint_and_resume(self):
+
+        from reasonedschemer import membero
+
+        class crash(Exception): pass
+
+        def crashing(r):
+            r = cons_to_list(r)
+            if r == [50, 3]: raise crash
+            return r
+
+        goal = lambda: fresh(lambda q, x, y: conj(membero(x, list(range(60))), membero(y, list(range(60))), unify([x, y], q)))
+        answers = run(goal())
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'search.checkpoint')
+            with self.assertRaises(FileNotFoundError): resume(goal(), path)
+            with self.assertRaises(crash): run(goal(), post=crashing, checkpoint=path, every=0) # a checkpoint every 4096 alternatives
+            self.assertEqual(resume(goal(), path), answers) # neither lost nor found twice
+            self.assertEqual(resume(goal(), path, n=3), answers[:3]) # a done search gives its answers
+            self.assertEqual(run(fresh(lambda q: disj(unify(q, 1), unify(q, 1), interleaving=False)), checkpoint=path, distinct=True), [1])
+            with warnings.catch_warnings(): # the machine schedules the streams of interleaving goals, whose paths are saved
+                warnings.simplefilter('error')
+                self.assertEqual(run(fresh(lambda q: disj(unify(q, 1), unify(q, 2))), checkpoint=path), [1, 2])
+                self.assertEqual(run(fresh(lambda q: condi([unify(q, 1)], [unify(q, 2)])), checkpoint=path), [1, 2])
+            with self.assertWarns(RuntimeWarning): # unless their scheduler is one it does not know, then they are closures
+                self.assertEqual(run(fresh(lambda q: condi([unify(q, 1)], [unify(q, 2)])), checkpoint=path, scheduler=depth_first), [1, 2])
+        with self.assertRaises(ValueError): run(goal(), checkpoint=path, depth=3)
+
+        # paths of other goals, whose choicepoints have fewer alternatives
+        from muk.vm import execute
+        def two(s):
+            yield from [s, s]
+        for g in [two, conde([succeed], [succeed])]:
+            with self.assertRaisesRegex(ValueError, 'does not match'): list(execute(g, emptystate(), replay=[[5]]))
+
+    def test_checkpoint_and_resume_interleaving_searches(self):
+
+        from mclock import craig_lawo, mcculloch_lawo
+        import muk.vm
+
+        class crash(Exception): pass
+
+        steps = 0
+        def counting(crashing_at=None):
+            def tick():
+                nonlocal steps
+                steps += 1
+                if steps == crashing_at: raise crash
+            return tick
+
+        craig = lambda: fresh(lambda out, χ, M_of_χ, γ: conj(unify([3, 5, 4]+γ, χ), craig_lawo(χ, M_of_χ), unify([χ, M_of_χ], out)))
+        mcculloch = lambda: fresh(lambda out, γ, αγ: conj(mcculloch_lawo(γ, αγ), unify([γ, αγ], out)))
+        period, muk.vm._snapshot_period = muk.vm._snapshot_period, 16
+        try:
+            with tempfile.TemporaryDirectory() as d:
+                for goal, n, scheduler in [(craig, 1, dovetail), (mcculloch, 6, round_robin), (mcculloch, 6, weighted(lambda k: 2))]:
+                    answers = run(goal(), n=n, scheduler=scheduler)
+                    path = os.path.join(d, 'search.checkpoint')
+                    steps, muk.core._tick = 0, counting()
+                    self.assertEqual(run(goal(), n=n, scheduler=scheduler, checkpoint=path, every=0), answers)
+                    whole, steps = steps, 0
+                    os.remove(path)
+                    muk.core._tick = counting(crashing_at=whole * 3 // 4)
+                    with self.assertRaises(crash): run(goal(), n=n, scheduler=scheduler, checkpoint=path, every=0)
+                    steps, muk.core._tick = 0, counting()
+                    self.assertEqual(resume(goal(), path, n=n, scheduler=scheduler), answers) # neither lost nor found twice
+                    self.assertLess(steps, whole // 2) # the three quarters done before the crash are not searched again
+                    os.remove(path)
+        finally: muk.vm._snapshot_period, muk.core._tick = period, None
+
+    def test_committed_choices_close_abandoned_streams(self):
+
+        from reasonedschemer import onceo, bumpo, gentesto, pluso
+
+        closed = []
+
+        def watched(g):
+            def W(s):
+                try: yield from g(s)
+                finally: closed.append(s)
+            return W
+
+        def nat(x):
+            return condi([unify(x, 0)], [fresh(lambda d: conj(unify(x, [d]), nat(d)))])
+
+        closed_already = lambda k: lambda s: iter([s] if len(closed) == k else [])
+
+        self.assertEqual(run(fresh(lambda q: conj(onceo(watched(nat(q))), closed_already(1)))), [0]) # before going on
+        self.assertEqual(run(fresh(lambda q: complement(watched(nat(q))))), [])
+        self.assertEqual(len(closed), 2)
+        self.assertEqual(run(fresh(lambda q: watched(nat(q))), n=1), [0])
+        self.assertEqual(len(closed), 3) # a run that stops early too, not when collected
+
+        def loopo(k): # each iteration commits to the first of infinitely many states
+            return succeed if k == 0 else fresh(lambda x: conj(onceo(nat(x)), loopo(k - 1)))
+
+        for k in [10, 100]:
+            m = stream_metrics()
+            self.assertEqual(run(fresh(lambda q: conj(loopo(k), unify(q, k))), metrics=m), [k])
+            self.assertEqual(m.peak, 1) # the stream of the current question, not of every previous one
+
+        def enumerateo(k, n): # as the one of reasonedschemer, each iteration commits to the first sum of `i` and another number
+            return succeed if k == 0 else fresh(lambda i, j, s: conj(bumpo(n, i), gentesto(pluso, i, j, s), enumerateo(k - 1, n)))
+
+        for k in [1, 3]:
+            m = stream_metrics()
+            self.assertEqual(len(run(fresh(lambda q: enumerateo(k, [1, 1])), metrics=m)), 4 ** k) # `i` from 3 down to 0
+            self.assertEqual(m.peak, 1)
+
+    def test_async_run(self):
+
+        import asyncio
+        from muk.parallel import process_pool
+        from reasonedschemer import membero
+
+        def complete(coroutine): # as `asyncio.run` of Python 3.7 does
+            loop = asyncio.new_event_loop()
+            try: return loop.run_until_complete(coroutine)
+            finally: loop.close()
+
+        long = lambda: fresh(lambda q, x, y: conj(membero(x, list(range(30))), membero(y, list(range(30))), unify([x, y], q)))
+        short = lambda: fresh(lambda q: membero(q, [1, 2, 3]))
+        finished = []
+
+        async def query(name, goal, **kwds):
+            answers = await async_run(goal(), **kwds)
+            finished.append(name)
+            return answers
+
+        async def queries(**kwds):
+            return await asyncio.gather(query('long', long, **kwds), query('short', short, **kwds))
+
+        self.assertEqual(complete(queries(steps=10)), [run(long()), [1, 2, 3]])
+        self.assertEqual(finished, ['short', 'long']) # the long one takes turns with the short one
+
+        # interleaving goals and closures take breaks too, even before their first state
+        for compiled in [True, False]:
+            finished.clear()
+            long = lambda: fresh(lambda q, x: conj(disj(*[unify(x, i) for i in range(300)], flat=True), fail, interleaving=True))
+            self.assertEqual(complete(queries(steps=10, compiled=compiled)), [[], [1, 2, 3]])
+            self.assertEqual(finished, ['short', 'long'])
+
+        closed = []
+        def forever(s):
+            try:
+                while True: yield s
+            finally: closed.append(True)
+        async def abandoned():
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(async_run(conj(forever, fail, interleaving=True), steps=10), 0.05)
+        complete(abandoned())
+        self.assertEqual(closed, [True]) # the search of a cancelled query ends as well
+        self.assertIs(muk.core._tick, None)
+
+        long = lambda: fresh(lambda q, x, y: conj(membero(x, list(range(30))), membero(y, list(range(30))), unify([x, y], q)))
+        self.assertEqual(complete(queries(pool=process_pool(2))), [run(long()), [1, 2, 3]])
+        self.assertEqual(complete(async_run(short(), n=2, distinct=True, steps=1)), [1, 2])
+        with self.assertRaises(ValueError): complete(async_run(short(), pool=process_pool(1), metrics=stream_metrics()))
+        self.assertIs(muk.core._scheduler, dovetail)
+
+    def test_facts(self):
+
+        parent = facts(('abe', 'homer'), ('homer', 'bart'), ('mona', 'homer'), ('homer', 'lisa'), (var(99, 'p'), 'maggie'))
+        self.assertEqual(run(fresh(lambda q: parent('homer', q))), ['bart', 'lisa', 'maggie']) # a var matches any key
+        self.assertEqual(run(fresh(lambda q: parent(q, 'homer'))), ['abe', 'mona'])
+        self.assertEqual(run(fresh(lambda q: parent('bart', q))), ['maggie'])
+        self.assertEqual(len(run(fresh(lambda q, p, c: conj(parent(p, c), unify([p, c], q))))), 5)
+        self.assertEqual(run(fresh(lambda q: parent([1, 2], q))), ['maggie']) # an unhashable value tries every row
+        self.assertEqual(len(run(fresh(rel(parent)))), 5) # its arity is the one of rows
+
+        by_child = facts(('abe', 'homer'), ('homer', 'bart'), ('mona', 'homer'), index=1)
+        self.assertEqual(run(fresh(lambda q: by_child(q, 'homer'))), ['abe', 'mona'])
+
+        nested = facts(([1, 2], 'a'), ([1, 3], 'b'))
+        self.assertEqual(run(fresh(lambda q, x: conj(nested([1, x], q), unify(x, 3))), n=1), ['b'])
+
+    def test_indexed_conde(self):
+
+        compared = []
+
+        class atom:
+            def __init__(self, name): self.name = name
+            def __hash__(self): return hash(self.name)
+            def __eq__(self, other):
+                compared.append(self.name)
+                return isinstance(other, atom) and self.name == other.name
+
+        a, b, c = atom('a'), atom('b'), atom('c')
+
+        def lettero(l, name):
+            return indexed_conde([unify(l, a), unify(name, 'ay')],
+                                 [unify(b, l), unify(name, 'bee')],
+                                 [succeed, unify(name, 'letter')],
+                                 [unify(l, c), unify(name, 'cee')],
+                                 [unify(l, b), unify(name, 'be')])
+
+        self.assertEqual(run(fresh(lambda q, l: conj(unify(l, atom('b')), lettero(l, q)))), ['bee', 'letter', 'be'])
+        self.assertEqual(compared, ['b', 'b', 'b']) # once by the index and once by each matching clause
+        self.assertEqual(run(fresh(lambda q, l: conj(unify(l, 'z'), lettero(l, q)))), ['letter'])
+        self.assertEqual(run(fresh(lambda q, l: conj(unify(l, [a]), lettero(l, q)))), ['letter']) # unhashable
+        self.assertEqual(run(fresh(lambda q, l: lettero(l, q))), ['ay', 'bee', 'letter', 'cee', 'be']) # fresh
+        self.assertEqual(run(fresh(lambda q: lettero(c, q))), ['letter', 'cee']) # a value, nothing to index on
+
+        x = var(100, 'x')
+        for cond, indexed in [(conde, indexed_conde), (condi, indexed_condi)]:
+            goal = lambda q, cond: cond([unify(q, 'a')], [unify(x, 'b'), unify(q, 'b')], [unify(x, 'c'), unify(q, 'c')], 
+                                        else_clause=[unify(q, 'else')])
+            for bound in ['b', 'z', x]:
+                self.assertEqual(run(fresh(lambda q: conj(unify(x, bound), goal(q, partial(indexed, on=x))))),
+                                 run(fresh(lambda q: conj(unify(x, bound), goal(q, cond)))))
+
+    def test_interned_vars(self):
+
+        import pickle
+
+        x = var(3, 'x')
+        self.assertIs(var(3, 'x'), x)
+        self.assertIsNot(var(3, 'y'), x)
+        self.assertIsNot(var(4, 'x'), x)
+        self.assertIs(pickle.loads(pickle.dumps(x)), x)
+        self.assertIs(pickle.loads(pickle.dumps(rvar(0))), rvar(0))
+        self.assertIsInstance(rvar(0), rvar)
+        self.assertIsNot(rvar(0), var(0, '▢')) # a reified var is not a logic one
+        self.assertEqual({x: 1}[var(3, 'x')], 1)
+        with self.assertRaises(AttributeError): x.other = 'not slotted'
+        self.assertEqual(walk(var(0, 'a'), {var(0, 'a'): var(1, 'b'), var(1, 'b'): 2}), 2)
+
+        import sys
+        made, interval = [[] for _ in range(4)], sys.getswitchinterval()
+        sys.setswitchinterval(1e-6) # threads switch as often as they can, between lookup and store too
+        try:
+            threads = [threading.Thread(target=lambda vs: vs.extend(var(i, 'race') for i in range(5000)), args=(vs,)) for vs in made]
+            for th in threads: th.start()
+            for th in threads: th.join()
+        finally: sys.setswitchinterval(interval)
+        self.assertTrue(all(v is w for vs in made[1:] for v, w in zip(vs, made[0]))) # the same var in every thread
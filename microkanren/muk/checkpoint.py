@@ -0,0 +1,87 @@
+'''
+Checkpoints of long searches, which go on from the last one after a crash.
+
+Goals are closures and cannot be serialized, neither can the streams of
+states that they yield; however, the machine of :py:mod:`muk.vm` searches
+depth-first by an explicit stack of choicepoints, whose *path*, the number
+of alternatives that each one started, is a list of ints. A checkpoint
+pickles the paths of the search together with the answers found so far,
+and resuming builds the same goal again and replays them: the machine takes
+the alternatives they tell, skipping the ones before, which are done.
+
+Interleaving goals, as ``condi`` or ``conji`` ones, are scheduled by the
+machine too, whose path saves the round of their streams, each with a path
+of its own, and the states taken from it; states are pickled then, as the
+answers are, therefore they must be picklable objs. However, states that
+``CALL`` ed goals yielded, and the ones of interleaving goals under a
+scheduler that the machine does not know, as ``depth_first``, are searched
+again on resume, since they come from closures; so, a search whose goal is
+called as a whole saves no progress and warns about it.
+
+'''
+
+import os, pickle, tempfile, time, warnings
+
+from muk.core import *
+from muk.core import _answers, _canonical
+from muk import core as _core # whose `_scheduler` is the one of the current search
+from muk.vm import execute, compile_goal, _policy, _CALL, _TRY, _FRESH, _SCHEDULE
+
+def checkpointed_run(goal, n, var_selector, post, substitution, distinct, path, every, resumed=False):
+    '''
+    The answers of ``run(goal, n, compiled=True, ...)``, while the checkpoint
+    of the search is written to file ``path`` at most every ``every`` seconds
+    and when it is done; if ``resumed``, the search goes on from the
+    checkpoint in ``path``, while the one of a done search gives its answers.
+    '''
+
+    if resumed:
+        with open(path, 'rb') as f: checkpoint = pickle.load(f)
+    else: checkpoint = {'path': [], 'answers': [], 'seen': set(), 'done': False}
+    answers, seen = checkpoint['answers'], checkpoint['seen']
+    if checkpoint['done']: return answers[:n] if n else answers
+
+    last = time.monotonic()
+
+    def snapshot(p):
+        nonlocal last
+        if time.monotonic() - last < every: return
+        _write(path, {'path': p, 'answers': answers, 'seen': seen, 'done': False}) # answers of states before `p`
+        last = time.monotonic()
+
+    def search(goal, s):
+        if _unsaved(goal, s):
+            warnings.warn('The search is called as a closure as a whole, as interleaving goals under `depth_first` are, '
+                          'so its checkpoints save no progress; use another scheduler or `conde` instead', RuntimeWarning)
+        return execute(goal, s, replay=checkpoint['path'], snapshot=snapshot)
+
+    for r in _answers(goal, False, var_selector, lambda r: r, substitution, compiled=search):
+        if distinct:
+            key = _canonical(r)
+            if key in seen: continue
+            seen.add(key)
+        answers.append(post(r))
+        if n and len(answers) == n: break
+
+    _write(path, {'path': None, 'answers': answers, 'seen': seen, 'done': True})
+    return answers
+
+def _unsaved(goal, s):
+    # whether the machine `CALL`s `goal` as a whole, once its `fresh` vars are
+    # introduced, so that it pushes no choicepoint whose path could be saved
+    while hasattr(goal, 'unfold'): goal, s = goal.unfold(s)
+    ops = {instruction[0] for instruction in compile_goal(goal)}
+    if _SCHEDULE in ops:
+        if _policy(_core._scheduler) is not None: return False
+        ops.add(_CALL)
+    return _CALL in ops and not ops & {_TRY, _FRESH}
+
+def _write(path, checkpoint):
+    # atomically, so a crash while writing leaves the previous checkpoint
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as f: pickle.dump(checkpoint, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
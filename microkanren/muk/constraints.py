@@ -0,0 +1,316 @@
+'''
+Constraints on logic vars, kept in the ``store`` of a :py:class:`muk.core.state`.
+
+A goal built by :py:func:`muk.ext.unify` commits to associations, while goals
+of this module *post* constraints, namely conditions that every association
+made later must satisfy; so the search is pruned as soon as a constraint is
+violated, instead of enumerating values to filter them afterwards:
+
+* :py:func:`disunify`, the disequality ``=/=`` of two terms;
+* :py:func:`absento`, an atom that must not occur in a term;
+* :py:func:`infd` restricts a var to a finite domain of ints, which
+  :py:func:`fd_neq`, :py:func:`fd_lt`, :py:func:`fd_leq`, :py:func:`fd_plus`
+  and :py:func:`fd_distinct` narrow by propagation, until
+  :py:func:`labeling` enumerates the values left.
+
+    >>> from muk.ext import *
+    >>> run(fresh(lambda q: conj(disunify(q, 1), conde([unify(q, 1)], [unify(q, 2)]))))
+    [2]
+    >>> run(fresh(lambda q: conj(infd(q, range(10)), fd_plus(q, q, 8), labeling(q))))
+    [4]
+
+Answers are reified without the constraints left on their fresh vars.
+'''
+
+from collections import deque
+from itertools import count
+
+from muk.core import *
+from muk.core import _unification, _unify
+
+
+class store:
+    '''
+    An immutable collection of constraints: ``neqs`` are pairs of terms that
+    must not unify, ``absents`` are pairs of an atom and a term that must not
+    contain it, ``domains`` maps fresh vars to ``frozenset`` objs of ints and
+    ``propagators`` maps ids to pairs of a narrowing function and the terms it
+    narrows the domains of.
+
+    Constraints remember the vars they *watch*, namely the ones that must get
+    an association, or a narrower domain, before they can be violated; so,
+    checking a store against an extended substitution costs little for
+    the constraints that are untouched.
+    '''
+
+    __slots__ = ('neqs', 'absents', 'domains', 'propagators', 'watchers', 'waiting')
+
+    def __init__(self, neqs=(), absents=(), domains=None, propagators=None, watchers=None, waiting=frozenset()):
+        self.neqs, self.absents, self.waiting = neqs, absents, waiting
+        self.domains = {} if domains is None else domains
+        self.propagators = {} if propagators is None else propagators
+        self.watchers = {} if watchers is None else watchers # from vars to ids of propagators
+
+    def posted(self, sub, neqs=(), absents=(), domains=(), propagators=()):
+        '''
+        A store with the given constraints too, checked in ``sub``; ``None``
+        if they are violated.
+        '''
+
+        narrowed, changed = dict(self.domains), set()
+        for x, d in domains:
+            t = walk(x, sub)
+            if isinstance(t, var): 
+                narrowed[t] = narrowed[t] & d if t in narrowed else d
+                changed.add(t)
+            elif t not in d: return None
+
+        posted = dict(self.propagators)
+        for p in propagators: posted[next(_ids)] = p
+
+        unwatched = () # so that new constraints are checked right now
+        return store(self.neqs + tuple((u, v, unwatched) for u, v in neqs),
+                     self.absents + tuple((atom, t, unwatched) for atom, t in absents),
+                     narrowed, posted, self.watchers, self.waiting.union(posted.keys() - self.propagators.keys())
+                    )._checked(sub, changed)
+
+    def verify(self, sub):
+        '''
+        The store simplified according to ``sub``, dropping entailed
+        constraints; ``None`` if ``sub`` violates one of them.
+        '''
+        return self._checked(sub, set())
+
+    def _checked(self, sub, changed):
+
+        neqs = []
+        for c in self.neqs:
+            u, v, watched = c
+            if watched and all(walk(w, sub) is w for w in watched): 
+                neqs.append(c)
+                continue
+            extension = []
+            def E(x, y, sub):
+                extension.append((x, y))
+                return ext_s(x, y, sub)
+            try: extended = _unification(u, v, sub, E)
+            except UnificationError: continue # never equal
+            if extended is None: continue
+            if not extension: return None # already equal
+            x, y = extension[0] # it must get an association, or `y` must, for `u` and `v` to be equal
+            neqs.append((u, v, (x, y) if isinstance(y, var) else (x,)))
+
+        absents = []
+        for c in self.absents:
+            atom, t, watched = c
+            if watched and all(walk(w, sub) is w for w in watched):
+                absents.append(c)
+                continue
+            found, fresh_vars = _occurrence(atom, t, sub)
+            if found: return None
+            if fresh_vars: absents.append((atom, t, tuple(fresh_vars)))
+
+        domains = {}
+        for x, d in self.domains.items():
+            t = walk(x, sub)
+            if t is not x: changed.add(x)
+            if isinstance(t, var):
+                if t in domains: # `x` and another var are the same now
+                    d = domains[t] & d
+                    if not d: return None
+                if t is not x: changed.add(t)
+                domains[t] = d
+            elif type(t) is not int or t not in d: return None
+
+        propagators, watchers, waiting = dict(self.propagators), dict(self.watchers), set(self.waiting)
+        if not _propagate(propagators, watchers, waiting, domains, sub, changed): return None
+
+        return store(tuple(neqs), tuple(absents), domains, propagators, watchers, frozenset(waiting))
+
+    def __repr__(self):
+        return 'store(neqs={}, absents={}, domains={}, propagators={})'.format(
+            [(u, v) for u, v, w in self.neqs], [(a, t) for a, t, w in self.absents], 
+            self.domains, len(self.propagators))
+
+_ids = count() # of propagators
+
+def _occurrence(atom, t, sub):
+    '''
+    A pair telling if ``atom`` occurs in term ``t`` and which fresh vars occur
+    in it, given ``sub``.
+    '''
+
+    todo, fresh_vars = [t], []
+    while todo:
+        t = walk(todo.pop(), sub)
+        if isinstance(t, var): fresh_vars.append(t)
+        elif isinstance(t, cons): todo.extend((t.cdr, t.car))
+        elif type(t) is seq:
+            todo.append(t.tail)
+            todo.extend(t)
+        elif isinstance(t, (list, tuple)): todo.extend(t)
+        elif t == atom: return True, fresh_vars
+    return False, fresh_vars
+
+def _domain(t, domains):
+    if isinstance(t, var): return domains.get(t)
+    return frozenset([t]) if type(t) is int else frozenset()
+
+def _propagate(propagators, watchers, waiting, domains, sub, changed):
+    '''
+    Narrows ``domains`` in place until no propagator changes them, dropping
+    the entailed ones; it returns ``False`` if a domain gets empty. Only the
+    propagators watching a ``changed`` var run, or the ones ``waiting`` for
+    a domain of each of their terms; a propagator watches a var as soon as
+    one of its terms walks to it, so ``watchers`` can list dropped ids too.
+    '''
+
+    queue = deque(waiting)
+    for x in changed: queue.extend(watchers.get(x, ()))
+    queued = set(queue)
+
+    while queue:
+        i = queue.popleft()
+        queued.discard(i)
+        if i not in propagators: continue # dropped already
+        narrow, args = propagators[i]
+        terms = [walk(a, sub) for a in args]
+        for t in terms:
+            if isinstance(t, var) and i not in watchers.get(t, ()):
+                watchers[t] = watchers.get(t, frozenset()) | {i}
+        ds = [_domain(t, domains) for t in terms]
+        if any(d is None for d in ds): 
+            waiting.add(i)
+            continue
+        waiting.discard(i)
+        if not all(ds): return False # a ground term that is not an int, which no domain holds
+        narrowed = narrow(*ds)
+        if narrowed is None or not all(narrowed): return False
+        for t, n in zip(terms, narrowed):
+            if not isinstance(t, var): continue
+            n = n & domains[t] # `t` can occur more than once in `terms`
+            if not n: return False
+            if len(n) < len(domains[t]):
+                domains[t] = n
+                for j in watchers[t]:
+                    if j not in queued: 
+                        queue.append(j)
+                        queued.add(j)
+        if all(len(d) == 1 for d in ds): del propagators[i] # entailed, since it checks singletons
+
+    return True
+
+def _post(**constraints):
+
+    def P(s : state):
+        posted = (s.store or store()).posted(s.sub, **constraints)
+        if posted is not None: yield state(s.sub, s.next_index, posted, s.depth)
+
+    return P
+
+# DISEQUALITY {{{
+
+@adapt_iterables_to_conses(all_arguments)
+def disunify(u, v):
+    '''A goal that constrains ``u`` and ``v`` never to be unified, known as ``=/=``.'''
+    return _post(neqs=[(u, v)])
+
+nequalo = disunify
+
+@adapt_iterables_to_conses(lambda atom, t: {t})
+def absento(atom, t):
+    '''A goal that constrains ``atom`` not to occur anywhere in term ``t``.'''
+    if isinstance(atom, (var, cons, seq, list, tuple)):
+        raise ValueError('absento expects an atom, not {}'.format(atom))
+    return _post(absents=[(atom, t)])
+
+# }}}
+
+# FINITE DOMAINS {{{
+
+def _neq(dx, dy):
+    if len(dx) == 1: dy = dy - dx
+    if len(dy) == 1: dx = dx - dy
+    return dx, dy
+
+def _lt(dx, dy):
+    hi = max(dy)
+    dx = frozenset(a for a in dx if a < hi)
+    if not dx: return None
+    lo = min(dx)
+    return dx, frozenset(b for b in dy if b > lo)
+
+def _leq(dx, dy):
+    hi = max(dy)
+    dx = frozenset(a for a in dx if a <= hi)
+    if not dx: return None
+    lo = min(dx)
+    return dx, frozenset(b for b in dy if b >= lo)
+
+def _plus(dx, dy, dz):
+    (lx, hx), (ly, hy) = (min(dx), max(dx)), (min(dy), max(dy))
+    if not (lx + ly <= min(dz) and max(dz) <= hx + hy):
+        dz = frozenset(c for c in dz if lx + ly <= c <= hx + hy)
+        if not dz: return None
+    lz, hz = min(dz), max(dz)
+    if not (lz - hy <= lx and hx <= hz - ly):
+        dx = frozenset(a for a in dx if lz - hy <= a <= hz - ly)
+        if not dx: return None
+        lx, hx = min(dx), max(dx)
+    if not (lz - hx <= ly and hy <= hz - lx):
+        dy = frozenset(b for b in dy if lz - hx <= b <= hz - lx)
+    return dx, dy, dz
+
+def _distinct(*ds):
+    fixed = set()
+    for d in ds:
+        if len(d) == 1:
+            if d <= fixed: return None
+            fixed |= d
+    return [d if len(d) == 1 else d - fixed for d in ds]
+
+def infd(x, values):
+    '''A goal that constrains ``x`` to be one of the ints in ``values``.'''
+    return _post(domains=[(x, frozenset(values))])
+
+def fd_neq(x, y):
+    '''A goal that constrains ``x`` and ``y`` to differ.'''
+    return _post(propagators=[(_neq, (x, y))])
+
+def fd_lt(x, y):
+    '''A goal that constrains ``x`` to be less than ``y``.'''
+    return _post(propagators=[(_lt, (x, y))])
+
+def fd_leq(x, y):
+    '''A goal that constrains ``x`` to be less than or equal to ``y``.'''
+    return _post(propagators=[(_leq, (x, y))])
+
+def fd_plus(x, y, z):
+    '''A goal that constrains ``x + y`` to equal ``z``, narrowing their bounds.'''
+    return _post(propagators=[(_plus, (x, y, z))])
+
+def fd_distinct(*xs):
+    '''A goal that constrains the values of vars in ``xs`` to be pairwise different.'''
+    return _post(propagators=[(_distinct, xs)])
+
+def labeling(*logic_vars):
+    '''
+    A goal that enumerates values of ``logic_vars`` in their domains, choosing
+    first the var with the smallest domain left and trying its values in
+    increasing order; each association propagates before the next choice.
+    '''
+
+    def L(s : state):
+        domains = s.store.domains if s.store is not None else {}
+        pending = [t for t in (walk(v, s.sub) for v in logic_vars) if isinstance(t, var)]
+        if not pending:
+            yield s
+            return
+        x = min(pending, key=lambda t: len(domains[t]) if t in domains else float('inf'))
+        if x not in domains: raise ValueError('labeling {} that has no domain'.format(x))
+        for value in sorted(domains[x]):
+            for r in _unify(x, value, ext_s)(s): yield from L(r)
+
+    return L
+
+# }}}
@@ -27,26 +27,59 @@
     >>> from muk.ext import *
 '''
 
-from collections import namedtuple
-from itertools import chain, count
+from collections import namedtuple, deque
+from itertools import chain, count, tee
 from contextlib import contextmanager
 from inspect import signature
-from functools import partial, reduce, wraps
+from types import FunctionType
+from time import perf_counter
+from weakref import WeakValueDictionary
+from threading import Lock, Semaphore, Thread
+from sys import getsizeof
+from os.path import exists
+from functools import partial, wraps
 
 from muk.sexp import *
+from muk.pmap import pmap
+from muk import profiler as _profiler
 
 
 # STATES {{{
 
-state = namedtuple('state', ['sub', 'next_index'])
+state = namedtuple('state', ['sub', 'next_index', 'store', 'depth'])
+state.__new__.__defaults__ = (None, 0) # no constraints and no `fresh` body around, by default
+state.__doc__ = '''
+A substitution ``sub``, the index ``next_index`` of the next fresh var, an
+optional ``store`` of constraints, as :py:mod:`muk.constraints` defines them,
+that extensions of ``sub`` must satisfy, and the ``depth`` of the ``fresh``
+bodies that the state is searched in, which bounded searches only count.
+'''
+
+def _constrained(s, sub, next_index):
+    '''
+    The state extending ``s`` with ``sub``, after checking the constraints in
+    the store of ``s``, if any; ``None`` if extending it violates them.
+    '''
+    store = s.store
+    if store is not None and sub is not s.sub:
+        store = store.verify(sub)
+        if store is None: return None
+    return state(sub, next_index, store, s.depth)
 
-def emptystate():
-    return state(sub={}, next_index=0)
+def emptystate(substitution=dict):
+    return state(sub=substitution(), next_index=0)
 
 @contextmanager
 def states_stream(g, initial_state=emptystate()):
     α = g(initial_state)
-    yield α
+    try: yield α
+    finally: _abandon(α) # a search left early reclaims its frames now, instead of when collected
+
+def _abandon(α):
+    # closes stream `α`, whose states are not needed anymore, so that its
+    # generator frames and the substitutions they hold are freed at once
+    close = getattr(α, 'close', None)
+    if close is not None: close()
 
 # }}}
 
@@ -54,25 +87,35 @@ def states_stream(g, initial_state=emptystate()):
 
 
 class var:
+    '''
+    A logic var, named ``name``, that ``fresh`` introduces as the ``index``-th
+    one of a state. Vars are *interned*, so that the same index and name give
+    the very same obj as long as one is alive; hence a var hashes and compares
+    by identity, which makes substitution lookups as cheap as the ones of
+    ``object`` keys.
+    '''
 
-    _subscripts = {'0':'₀', '1':'₁','2':'₂','3':'₃','4':'₄','5':'₅','6':'₆','7':'₇','8':'₈','9':'₉'}
+    __slots__ = ('index', 'name', '__weakref__')
 
-    def __init__(self, index, name):
-        self.index = index
-        self.name = name
+    _subscripts = {'0':'₀', '1':'₁','2':'₂','3':'₃','4':'₄','5':'₅','6':'₆','7':'₇','8':'₈','9':'₉'}
+    _interned = WeakValueDictionary() # from triples of class, index and name to the vars alive
 
-    def __eq__(self, other):
-        try:
-            return other.__eq__var(self)
-        except AttributeError:
-            return False
+    _interning = Lock() # so that threads that make the same var at once get the very same obj
 
-    def __eq__var(self, other):
-        return self.index == other.index and self.name == other.name
+    def __new__(cls, index, name):
+        key = cls, index, name
+        v = var._interned.get(key)
+        if v is None:
+            with var._interning:
+                v = var._interned.get(key) # made by another thread meanwhile
+                if v is None:
+                    v = object.__new__(cls)
+                    v.index, v.name = index, name
+                    var._interned[key] = v
+        return v
 
-    def __hash__(self):
-        t = self.index, self.name
-        return hash(t)
+    def __reduce__(self): # so that unpickled vars are interned too
+        return type(self), (self.index, self.name)
 
     def __repr__(self):
         return '{}{}'.format(self.name, ''.join(self._subscripts[c] for c in str(self.index)))
@@ -91,7 +134,7 @@ class var:
         #if isinstance(other, str): 
             #return tuple(list(other) + [self])
 
-        raise NotImplemented
+        return NotImplemented
 
     def walk_star(self, W):
         return self
@@ -99,32 +142,16 @@ class var:
     def reify_s(self, sub, R):
         return ext_s(self, rvar(len(sub)), sub)
 
-    def unification(self, other, sub, ext_s, U, E): 
-        try:
-            UV = other._unification_var # attribute lookup to do double dispatch
-        except AttributeError:
-            return ext_s(self, other, sub)
-        else:
-            return UV(self, sub, ext_s, U)
-
-    def _unification_var(self, other_var, sub, ext_s, U):
-        return sub if self == other_var else ext_s(other_var, self, sub)
-
-    def __getattr__(self, name):
-
-        if not name.startswith('_unification_'): 
-            raise AttributeError
-
-        return lambda other, sub, ext_s, U: ext_s(self, other, sub)
-
     def occur_check(self, u, O, E):
         if self == u: raise E
 
 
 class rvar(var):
 
-    def __init__(self, index, reifed_name='▢'):
-        super().__init__(index, name=reifed_name)
+    __slots__ = ()
+
+    def __new__(cls, index, reifed_name='▢'):
+        return var.__new__(cls, index, reifed_name)
         
     def reify_s(self, sub, R):
         return sub
@@ -147,76 +174,330 @@ class UnificationError(ValueError):
 def unification(u, v, sub, ext_s):
     '''
     Attempts to augment substitution ``sub`` with associations that makes ``u``
-    unify with ``v``.
+    unify with ``v``, raising ``UnificationError`` if they do not unify.
     '''
 
-    u, v = walk(u, sub), walk(v, sub)
+    sub = _unification(u, v, sub, ext_s)
+    if sub is None: raise UnificationError()
+    return sub
 
-    if hasattr(u, 'unification'): 
-        try: return u.unification(v, sub, ext_s, unification, UnificationError)
-        except UnificationError: pass
+def _unification(u, v, sub, ext_s):
+    '''
+    The unifier proper, it returns the augmented substitution or ``None`` if
+    ``u`` and ``v`` do not unify.
 
-    if hasattr(v, 'unification'): 
-        try: return v.unification(u, sub, ext_s, unification, UnificationError)
-        except UnificationError: pass
+    Pairs of terms to be unified are kept on an explicit stack; for each pair,
+    the walked terms select a unifier in a table keyed by their types, see
+    :py:func:`register_unifier`, so neither attribute probing nor exceptions
+    happen on either the success or the failure path.
+    '''
 
-    if  (type(u) is tuple and type(v) is tuple) or \
-        (type(u) is list and type(v) is list):
-        # this branch permits either `u` or `v` to be `cons` cells too:
-        # can be source of trouble or should be a kind of generalization
-        u, v = iter(u), iter(v)
-        subr = reduce(lambda subr, pair: unification(*pair, subr, ext_s), zip(u, v), sub)
-        try: next(u)
-        except StopIteration:
-            try: next(v)
-            except StopIteration:
-                # because both iterables are empty, so there's no
-                # counterexample against their unification
-                return subr 
-    elif u == v:
-        return sub
+    pairs = [(u, v)]
+    while pairs:
+        u, v = pairs.pop()
+        u, v = walk(u, sub), walk(v, sub)
+        try: U = _dispatch[type(u), type(v)]
+        except KeyError: U = _resolve(type(u), type(v))
+        sub = U(u, v, sub, ext_s, pairs)
+        if sub is None: return None
+
+    return sub
+
+_unifiers = {} # registered by the user, keyed by pairs of types
+_dispatch = {} # resolved for pairs of concrete types, the table `_unification` looks into
+
+def register_unifier(u_type, v_type, unifier):
+    '''
+    Registers ``unifier(u, v, sub, ext_s, pairs)`` to unify walked terms ``u``
+    and ``v`` whose types are ``u_type`` and ``v_type``, or subclasses of them;
+    pairs involving a logic var are not overridable since they always bind it.
+    It returns ``sub`` augmented with associations built using ``ext_s`` or
+    ``None`` on failure; moreover, it can push pairs of subterms onto list
+    ``pairs``, which are unified *last-in first-out* after it returns.
+    '''
+    _unifiers[u_type, v_type] = unifier
+    _dispatch.clear()
+
+def _resolve(u_type, v_type):
+
+    if issubclass(u_type, var): U = _unify_vars if issubclass(v_type, var) else _unify_var_left
+    elif issubclass(v_type, var): U = _unify_var_right
+    else:
+        for a in u_type.__mro__: # the first registered pair along `u_type`'s MRO, then `v_type`'s
+            for b in v_type.__mro__:
+                U = _unifiers.get((a, b))
+                if U: break
+            else: continue
+            break
+
+    if U is _unify_atoms and (hasattr(u_type, 'unification') or hasattr(v_type, 'unification')):
+        U = _unify_by_protocol
+
+    _dispatch[u_type, v_type] = U
+    return U
+
+def _unify_vars(u, v, sub, ext_s, pairs):
+    return sub if u == v else ext_s(u, v, sub)
+
+def _unify_var_left(u, v, sub, ext_s, pairs):
+    return ext_s(u, v, sub)
 
-    raise UnificationError()
+def _unify_var_right(u, v, sub, ext_s, pairs):
+    return ext_s(v, u, sub)
+
+def _unify_conses(u, v, sub, ext_s, pairs):
+    if u.cdr == (): pairs.append((u.car, v))
+    elif v.cdr == (): pairs.append((v.car, u))
+    else:
+        pairs.append((u.cdr, v.cdr))
+        pairs.append((u.car, v.car))
+    return sub
+
+def _unify_seqs(u, v, sub, ext_s, pairs):
+    # pair items of the shorter one with a prefix of the longer, then tails
+    n, m = len(u), len(v)
+    if n < m: pairs.append((u.tail, seq(v.items, v.tail, v.start + n)))
+    elif n > m: pairs.append((seq(u.items, u.tail, u.start + m), v.tail))
+    else: pairs.append((u.tail, v.tail))
+    if u.items is v.items and u.start == v.start: return sub
+    k = min(n, m)
+    pairs.extend(zip(reversed(u.items[u.start:u.start+k]), reversed(v.items[v.start:v.start+k])))
+    return sub
+
+def _unify_sequences(u, v, sub, ext_s, pairs):
+    # only vanilla `list` and `tuple` objs, not their subclasses as `cons` is
+    if type(u) is not type(v) or type(u) not in (list, tuple): return _unify_atoms(u, v, sub, ext_s, pairs)
+    if len(u) != len(v): return None
+    pairs.extend(zip(reversed(u), reversed(v)))
+    return sub
+
+def _unify_atoms(u, v, sub, ext_s, pairs):
+    return sub if u == v else None
+
+def _unify_by_protocol(u, v, sub, ext_s, pairs):
+    # for objs that define method `unification(self, other, sub, ext_s, U, E)`
+    for a, b in [(u, v), (v, u)]:
+        if hasattr(a, 'unification'):
+            try: return a.unification(b, sub, ext_s, unification, UnificationError)
+            except UnificationError: pass
+    return _unify_atoms(u, v, sub, ext_s, pairs)
+
+register_unifier(cons, cons, _unify_conses)
+register_unifier(seq, seq, _unify_seqs)
+register_unifier(seq, cons, _unify_conses) # `seq` objs respond to `car` and `cdr` too
+register_unifier(cons, seq, _unify_conses)
+register_unifier(list, list, _unify_sequences)
+register_unifier(tuple, tuple, _unify_sequences)
+register_unifier(object, object, _unify_atoms)
 
 # }}}
 
 # SUBSTITUTION {{{
 
+_unwalked = object()
+
 def walk(u, sub):
+    '''
+    Follows the chain of associations in ``sub`` starting at ``u``; only logic
+    vars can be keys of a substitution, so any other obj, ground or not, walks
+    to itself without any lookup. Substitutions that offer a ``memo`` dict,
+    as :py:class:`muk.pmap.pmap` does, remember the end of every chain they
+    walk, so repeated walks of the same var in the same state are *O(1)*.
+    '''
 
-    try: 
-        while True: u = sub[u]
-    except (TypeError, # to defend against unhashable objs 
-            KeyError): # to defend from "ground" objs and stop iter when `u` is a *fresh* var
-        return u 
+    if not isinstance(u, var): return u
+
+    memo = None if type(sub) is dict else getattr(sub, 'memo', None)
+    if memo is None:
+        v = sub.get(u, _unwalked)
+        while v is not _unwalked:
+            u = v
+            if not isinstance(u, var): break
+            v = sub.get(u, _unwalked)
+        return u
+
+    w = memo.get(u, _unwalked)
+    if w is not _unwalked: return w
+    chain, v = [u], sub.get(u, _unwalked)
+    while v is not _unwalked:
+        u = v
+        if not isinstance(u, var): break
+        w = memo.get(u, _unwalked)
+        if w is not _unwalked: 
+            u = w
+            break
+        chain.append(u)
+        v = sub.get(u, _unwalked)
+    for c in chain: memo[c] = u # path compression, safe because `sub` is immutable
+    return u
+
+class _build(namedtuple('_build', ['ctor', 'arity'])):
+    pass
+
+class _leave(namedtuple('_leave', ['bound_var'])):
+    pass
 
-def walk_star(v, sub):
-    v = walk(v, sub)
-    if isinstance(v, list): return [walk_star(u, sub) for u in v]  
-    elif hasattr(v, 'walk_star'): return v.walk_star(lambda u: walk_star(u, sub))
-    else: return v
+def _seq_of(*args):
+    # items followed by the tail, which is merged when it is a `seq` too
+    *items, tail = args
+    if type(tail) is seq:
+        items.extend(tail)
+        tail = tail.tail
+    return seq(items, tail)
+
+def walk_star(v, sub, cache=None):
+    '''
+    Walks ``v`` and its subterms, namely items of ``list`` objs, ``car`` and
+    ``cdr`` of ``cons`` cells and items and tail of :py:class:`muk.sexp.seq`
+    objs, instantiating them to their most specific value in ``sub``.
+
+    Terms are visited using an explicit stack, therefore arbitrarily long
+    lists and ``cons`` chains need no Python recursion at all; moreover, a var
+    bound more than once inside ``v`` is walked once. A *cyclic* term, that
+    is a var associated to a term containing the var itself as it happens
+    without the occur check, raises ``RecursionError`` as its recursive
+    definition does, since it has no finite instantiation.
+
+    A ``cache``, if given, maps ``cons`` cells that vars are bound to, to their
+    instantiations, so that the calls sharing it rebuild a ground cell once
+    from the second time they meet it on; instantiations map to themselves.
+    '''
+
+    results, todo, path, memo = [], [v], set(), {}
+
+    while todo:
+        t = todo.pop()
+        T = type(t)
+
+        if T is _build:
+            args = results[len(results)-t.arity:]
+            del results[len(results)-t.arity:]
+            results.append(args if t.ctor is list else t.ctor(*args))
+            continue
+
+        if T is _leave:
+            path.discard(t.bound_var)
+            r = results[-1]
+            if type(r) is not list: memo[t.bound_var] = r # share immutable instantiations only
+            continue
+
+        if isinstance(t, var):
+            r = memo.get(t, _unwalked)
+            if r is not _unwalked: 
+                results.append(r)
+                continue
+            w = walk(t, sub)
+            if isinstance(w, var) or not (isinstance(w, (list, cons, seq)) or hasattr(w, 'walk_star')):
+                results.append(w)
+                continue
+            if cache is not None and isinstance(w, cons):
+                copy = _cached(w, cache)
+                if copy is not None:
+                    results.append(copy)
+                    continue
+            if t in path: raise RecursionError('{} is bound to a term containing itself'.format(t))
+            path.add(t)
+            todo.append(_leave(t))
+            t = w
+
+        if isinstance(t, cons):
+            todo.append(_build(cons, 2))
+            todo.append(t.cdr)
+            todo.append(t.car)
+        elif type(t) is seq:
+            todo.append(_build(_seq_of, len(t) + 1))
+            todo.append(t.tail)
+            todo.extend(reversed(t.items[t.start:]))
+        elif isinstance(t, list):
+            todo.append(_build(list, len(t)))
+            todo.extend(reversed(t))
+        elif hasattr(t, 'walk_star'):
+            results.append(t.walk_star(lambda u: walk_star(u, sub)))
+        else:
+            results.append(t)
+
+    return results.pop()
+
+def _cached(c, cache):
+    # the instantiation of cell `c` in `cache`, when it is ground and bound to vars twice at least
+    entry = cache.get(id(c)) # keyed by `id`, entries keep cells alive
+    if entry is None: 
+        cache[id(c)] = [c, None, None] # the last item is for `_canonical`
+        return None
+    if entry[1] is None and (c.ground or (c.ground is None and _ground(c))):
+        copy = entry[1] = walk_star(c, {})
+        copy.ground = True
+        cache[id(copy)] = [copy, copy, None]
+    return entry[1]
 
 class OccurCheck(ValueError):
     pass
 
 def occur_check(ext_s):
+    '''
+    Decorates ``ext_s`` so that, when asked for, it raises :py:class:`OccurCheck`
+    instead of associating var ``u`` to a term ``v`` that contains it, unless
+    ``u`` is one of the ``linear`` vars, which cannot occur in ``v``.
+    '''
 
     @wraps(ext_s)
-    def E_s(u, v, sub, occur_check=False):
-        
-        def O(u, v):
-            v = walk(v, sub)
-            if hasattr(v, 'occur_check'): 
-                v.occur_check(u, O, OccurCheck)
-            elif type(v) is tuple or isinstance(v, list): 
-                for vv in v: O(u, vv)
-
-        if occur_check: O(u, v)
-
+    def E_s(u, v, sub, occur_check=False, linear=()):
+        if occur_check and u not in linear and _occurs(u, v, sub): raise OccurCheck
         return ext_s(u, v, sub)
 
     return E_s
 
+def _occurs(x, v, sub):
+    '''
+    Whether var ``x`` occurs in term ``v`` given ``sub``, visiting terms with an
+    explicit stack and skipping ``cons`` cells that contain no var at all.
+    '''
+
+    todo = [v]
+    while todo:
+        t = todo.pop()
+        if isinstance(t, var):
+            t = walk(t, sub)
+            if isinstance(t, var):
+                if t is x or t == x: return True
+                continue
+        if isinstance(t, cons): 
+            ground = t.ground
+            if not (_ground(t) if ground is None else ground): todo.extend((t.cdr, t.car))
+        elif type(t) is seq:
+            todo.append(t.tail)
+            todo.extend(t)
+        elif type(t) is tuple or isinstance(t, list): todo.extend(t)
+        elif hasattr(t, 'occur_check'): # any other obj that follows the protocol of `cons`
+            try: t.occur_check(x, lambda x, w: todo.append(w), OccurCheck)
+            except OccurCheck: return True
+    return False
+
+def _ground(c):
+    '''
+    Whether the ``cons`` cell ``c`` contains no logic var, bound or not, which
+    is remembered in attr ``ground`` of ``c`` and of the cells inside it, since
+    they are immutable; a cell that contains other containers, but empty
+    ones, counts as not ground, so that its contents are visited.
+    '''
+
+    if c.ground is not None: return c.ground
+    todo, values = [c], []
+    while todo:
+        t = todo.pop()
+        if t is _cell_done: 
+            cell = todo.pop()
+            cell.ground = values.pop() & values.pop()
+            values.append(cell.ground)
+        elif type(t) is cons or type(t) is num:
+            if t.ground is None: todo.extend((t, _cell_done, t.cdr, t.car))
+            else: values.append(t.ground)
+        elif isinstance(t, (list, tuple)): values.append(not t) # the empty one ends proper lists
+        else: values.append(not isinstance(t, (var, cons, seq)) and not hasattr(t, 'occur_check'))
+    return values.pop()
+
+_cell_done = object() # marks a cell whose car and cdr are known
+
 @occur_check
 def ext_s(u, v, sub):
 
@@ -231,19 +512,69 @@ def ext_s(u, v, sub):
         if sub[u] != v: raise UnificationError
         else: return sub
 
-    e = sub.copy()
-    e[u] = v
-    return e
+    try: assoc = sub.assoc # persistent substitutions extend by sharing structure
+    except AttributeError:
+        e = sub.copy()
+        e[u] = v
+        return e
+    else: return assoc(u, v)
 
 def reify_s(v, sub):
-    v = walk(v, sub)
-    if hasattr(v, 'reify_s'): return v.reify_s(sub, reify_s)
-    elif isinstance(v, list): return reduce(lambda sub, u: reify_s(u, sub), v, sub)
-    else: return sub
+    '''
+    Extends ``sub`` associating a fresh reified var to each fresh var in
+    ``v``, numbering them according to their occurrence from left to right;
+    as :py:func:`walk_star` does, it uses an explicit stack.
+    '''
+
+    todo = [v]
+    while todo:
+        t = walk(todo.pop(), sub)
+        if isinstance(t, cons): 
+            if t.ground: continue # no var to reify, when known
+            todo.append(t.cdr)
+            todo.append(t.car)
+        elif type(t) is seq:
+            todo.append(t.tail)
+            todo.extend(reversed(t.items[t.start:]))
+        elif isinstance(t, list): 
+            todo.extend(reversed(t))
+        elif hasattr(t, 'reify_s'): 
+            sub = t.reify_s(sub, reify_s)
+    return sub
 
 def reify(v):
     return walk_star(v, reify_s(v, sub={}))
 
+def _canonical(r, cache=None):
+    '''
+    A hashable key of the reified term ``r``, the same for equal terms, whose
+    reified vars are numbered by occurrence already; a ``seq`` and a chain of
+    ``cons`` cells with the same items give the same key, as they are equal.
+    The keys of cells in the ``cache`` of :py:func:`walk_star` are computed once.
+    '''
+
+    key, todo = [], [r]
+    while todo:
+        t = todo.pop()
+        if t is cons: key.append(t) # marks a cell, it pickles as a reference to the class
+        elif isinstance(t, cons):
+            entry = None if cache is None else cache.get(id(t))
+            if entry is None or entry[1] is not t: todo.extend((t.cdr, t.car, cons))
+            else:
+                if entry[2] is None: entry[2] = _canonical(t)
+                key.extend(entry[2]) # keys of subterms are slices of the whole one
+        elif type(t) is seq:
+            todo.append(t.tail)
+            for item in reversed(t.items[t.start:]): todo.extend((item, cons))
+        elif type(t) is tuple or isinstance(t, list):
+            key.append((type(t) is tuple, len(t)))
+            todo.extend(reversed(t))
+        else:
+            try: hash(t)
+            except TypeError: t = type(t), repr(t)
+            key.append(t)
+    return tuple(key)
+
 # }}}
 
 # GOAL CTORS {{{
@@ -263,14 +594,41 @@ def _unify(u, v, ext_s):
     '''
 
     def U(s : state):
-        try: sub = unification(u, v, s.sub, ext_s)
-        except UnificationError: yield from fail(s)
-        else: yield from succeed(state(sub, s.next_index))
+        try: sub = _unification(u, v, s.sub, ext_s)
+        except UnificationError: return # raised by `ext_s` on inconsistent associations
+        if sub is None: return
+        if s.store is None: yield state(sub, s.next_index, None, s.depth)
+        else:
+            s = _constrained(s, sub, s.next_index)
+            if s is not None: yield s
 
-    return U
+    U.terms, U.ext_s = (u, v), ext_s
+    return U if _profiler.active is None else _profiler.active.instrument(U, 'unify')
 
 def _unify_pure(u, v, occur_check):
-    return _unify(u, v, partial(ext_s, occur_check=occur_check))
+    return _unify(u, v, partial(ext_s, occur_check=occur_check)) if not occur_check else _unify_checked(u, v)
+
+def _unify_checked(u, v):
+    '''
+    As :py:func:`_unify` with the occur check, but its first application
+    skips the check for the vars in attr ``linear``, which :py:func:`fresh`
+    sets when the goal is the first one that its body runs.
+    '''
+
+    checked = partial(ext_s, occur_check=True)
+
+    def U(s : state):
+        linear, U.linear = U.linear, () # only the state that `fresh` unfolds lacks any mention of them
+        try: sub = _unification(u, v, s.sub, partial(checked, linear=linear) if linear else checked)
+        except UnificationError: return
+        if sub is None: return
+        if s.store is None: yield state(sub, s.next_index, None, s.depth)
+        else:
+            s = _constrained(s, sub, s.next_index)
+            if s is not None: yield s
+
+    U.terms, U.ext_s, U.linear = (u, v), checked, ()
+    return U if _profiler.active is None else _profiler.active.instrument(U, 'unify')
 
 def _unify_occur_check(u, v):
 
@@ -282,8 +640,48 @@ def _unify_occur_check(u, v):
         except OccurCheck:
             yield from fail(s)
 
+    U_oc.unification = U
     return U_oc
 
+def _linear(terms, logic_vars):
+    '''
+    The vars among ``logic_vars`` that occur exactly once in ``terms``; a
+    goal that binds them before any other goal mentions them, as the first one
+    in the body of the ``fresh`` that introduces them, needs no occur check
+    for them, since no other term can contain them yet.
+    '''
+
+    candidates, seen, twice = set(logic_vars), set(), set()
+    todo = list(terms)
+    while todo:
+        t = todo.pop()
+        if isinstance(t, var):
+            if t in candidates: (twice if t in seen else seen).add(t)
+        elif isinstance(t, cons): 
+            if not _ground(t): todo.extend((t.cdr, t.car))
+        elif type(t) is seq:
+            todo.append(t.tail)
+            todo.extend(t)
+        elif type(t) is tuple or isinstance(t, list): todo.extend(t)
+        elif hasattr(t, 'occur_check'): return frozenset() # opaque, it could hide any of them
+    return frozenset(seen - twice)
+
+_signatures = {} # from code objs of plain functions to their params
+_lettered = {} # from arities to params named by letters, for `fresh` goals given an arity
+
+def _parameters(f):
+    '''
+    Pairs of index and name of the params of ``f``, computed by ``signature``
+    once per code obj, since ``fresh`` receives new lambdas at every unfold.
+    '''
+
+    plain = type(f) is FunctionType and not hasattr(f, '__wrapped__') # `signature` follows `__wrapped__`
+    params = _signatures.get(f.__code__) if plain else None
+    if params is None:
+        params = [(i, v.name) for i, v in enumerate(signature(f).parameters.values())]
+        if plain: _signatures[f.__code__] = params
+    return params
+
 def fresh(f, arity=None):
     '''
     Introduce new logic variables according to the needs of receiver ``f``.
@@ -304,19 +702,40 @@ def fresh(f, arity=None):
     '''
 
     if arity:
-        params = [(i, n) for i in range(arity) for n in [chr(ord('a') + i)]]
+        params = _lettered.get(arity)
+        if params is None: params = _lettered[arity] = [(i, chr(ord('a') + i)) for i in range(arity)]
     else:
-        f_sig = signature(f)
-        arity = len(f_sig.parameters)
-        params = [(i, v.name) for i, (k, v) in enumerate(f_sig.parameters.items())] 
-
-    def F(s : state):
+        params = _parameters(f)
+        arity = len(params)
+
+    def unfold(s : state):
+        if _tick is not None: _tick() # a step of the search
+        depth = s.depth
+        if _bound is not None:
+            if depth >= _bound.depth:
+                _bound.cut = True
+                return fail, s
+            depth += 1 # for the body, only while bounded, so that plain searches pay nothing
         logic_vars = [var(s.next_index+i, n) for (i, n) in params]
         setattr(F, 'logic_vars', logic_vars) # set the attr in any case, even if `logic_vars == []` because of η-inversion  
         g = f(*logic_vars)
-        α = g(state(s.sub, s.next_index + arity))
-        yield from α
+        if logic_vars:
+            first = g # the goal that runs first on the state with the new vars
+            while getattr(first, 'goals', None): first = first.goals[0]
+            first = getattr(first, 'unification', first) # the one `unify_occur_check` wraps
+            if getattr(first, 'linear', None) == (): first.linear = _linear(first.terms, logic_vars)
+        return g, state(s.sub, s.next_index + arity, s.store, depth)
+
+    def F(s : state):
+        g, r = unfold(s)
+        α = g(r)
+        if r.depth == s.depth: yield from α
+        else:
+            depth = s.depth
+            for r in α: yield state(r.sub, r.next_index, r.store, depth) # out of the body, as deep as before
 
+    F.unfold = unfold # the goal and the state `F` searches, for goals that split a search
+    if _profiler.active is not None: F = _profiler.active.instrument(F, 'fresh', fresh_vars=arity) # `unfold` sets attrs of this one
     return F
 
 def _disj(g1, g2, *, interleaving):
@@ -341,7 +760,8 @@ def _disj(g1, g2, *, interleaving):
         α, β = g1(s), g2(s)
         yield from mplus(iter([α, β]), interleaving)
         
-    return D
+    D.branches, D.interleaving = (g1, g2), interleaving
+    return D if _profiler.active is None else _profiler.active.instrument(D, 'disj')
 
 def _conj(g1, g2, *, interleaving):
     '''
@@ -366,16 +786,104 @@ def _conj(g1, g2, *, interleaving):
         α = g1(s)
         yield from bind(α, g2, mplus=partial(mplus, interleaving=interleaving))
 
-    return C
+    C.goals, C.interleaving = (g1, g2), interleaving
+    return C if _profiler.active is None else _profiler.active.instrument(C, 'conj')
+
+def _conj_flat(goals, interleaving=False):
+    '''
+    A goal that is satisfiable if *every* goal in ``goals`` is, enumerating
+    states depth-first as nested ``_conj(..., interleaving=False)`` goals do,
+    in the very same order. It keeps one stream per goal on an explicit
+    stack, so it takes a single frame whatever the number of goals is and
+    pulling a state resumes only the innermost stream.
+
+    If ``interleaving``, each state that satisfies the first goals starts
+    the stream of the next goal on it, which the scheduler of the search
+    admits among the others, instead of nesting a scheduler per goal;
+    hence, states come in another order than nested interleaving goals
+    give them, but as fairly and whatever the number of goals is.
+    '''
+
+    goals = tuple(goals)
+    if not goals: return succeed
+    if len(goals) == 1: return goals[0]
+
+    def C(s : state):
+        stack, n = [goals[0](s)], len(goals)
+        while stack:
+            s = next(stack[-1], None)
+            if s is None: stack.pop()
+            elif len(stack) == n: yield s
+            else: stack.append(goals[len(stack)](s))
+
+    def I(s : state):
+        if _scheduler is depth_first: # which enumerates as the depth-first conjunction does
+            yield from C(s)
+            return
+
+        last, pending, live = len(goals) - 1, deque(), 0
+
+        def level(k, α):
+            # the states of `α`, which satisfy the first `k + 1` goals
+            nonlocal live
+            live += 1
+            try:
+                for r in α:
+                    if k == last: yield r
+                    else:
+                        pending.append(level(k + 1, goals[k + 1](r)))
+                        yield _spawned # a turn of the scheduler per state, as nested goals take
+            finally: live -= 1
+
+        def streams():
+            yield level(0, goals[0](s))
+            while live or pending: # streams admitted later can spawn others still
+                yield pending.popleft() if pending else iter(())
+
+        for r in mplus(streams(), interleaving=True):
+            if r is not _spawned: yield r
+
+    G = I if interleaving else C
+    G.goals, G.interleaving, G.flat = goals, interleaving, True # unlike `_conj` ones, whose streams are admitted otherwise
+    return G if _profiler.active is None else _profiler.active.instrument(G, 'conj')
+
+_spawned = object() # yielded by the streams of a flat interleaving conjunction instead of a state, see `_conj_flat`
+
+def _disj_flat(goals, interleaving=False):
+    '''
+    A goal that is satisfiable if *any* goal in ``goals`` is, enumerating
+    states depth-first as nested ``_disj(..., interleaving=False)`` goals do,
+    in the very same order but without nesting streams; if ``interleaving``,
+    the scheduler of the search enumerates the streams of all goals at once,
+    taking turns equally, while nested interleaving goals give half of their
+    turns to the first goal, a quarter to the second and so on, hence states
+    come in another order from three goals on.
+    '''
+
+    goals = tuple(goals)
+    if not goals: return fail
+    if len(goals) == 1: return goals[0]
+
+    def D(s : state):
+        for g in goals: yield from g(s)
+
+    def I(s : state):
+        yield from mplus((g(s) for g in goals), interleaving=True)
+
+    G = I if interleaving else D
+    G.branches, G.interleaving = goals, interleaving
+    return G if _profiler.active is None else _profiler.active.instrument(G, 'disj')
 
 def if_pure(question, answer, otherwise, *, interleaving):
     
+    C = _conj(question, answer, interleaving=False) 
+
     def I(s : state):
-        C = _conj(question, answer, interleaving=False) 
         α, β = C(s), otherwise(s)
         yield from mplus(iter([α, β]), interleaving)
 
-    return I
+    I.branches, I.interleaving = (C, otherwise), interleaving
+    return I if _profiler.active is None else _profiler.active.instrument(I, 'if')
 
 ife = partial(if_pure, interleaving=False)
 ifi = partial(if_pure, interleaving=True)
@@ -393,14 +901,23 @@ def if_softcut(question, answer, otherwise, *, doer):
             γ = doer(r, α, answer)
             yield from γ
 
-    return I
+    return I if _profiler.active is None else _profiler.active.instrument(I, 'if')
 
 ifa = partial(if_softcut, doer=lambda r, α, answer: 
         bind(chain([r], α), answer, mplus=partial(mplus, interleaving=False)))
-ifu = partial(if_softcut, doer=lambda r, α, answer: answer(r))
+
+def _committed(r, α, answer):
+    _abandon(α) # while searching `answer`, which could take long
+    return answer(r)
+
+ifu = partial(if_softcut, doer=_committed)
 
 @contextmanager
 def delimited(d):
+    '''
+    Yields a decorator of goals that fail once ``d`` of them were applied,
+    all together; the ``depth`` of :py:func:`run` bounds searches per path.
+    '''
 
     available = iter(range(d)) if d else count()
 
@@ -432,7 +949,7 @@ def sub(*logic_vars, of):
 
     def λ(s : state):  
         lvars = set(logic_vars) if logic_vars else s.sub.keys()
-        return state({v:{v:s.sub[v]} for v in lvars if v in s.sub}, s.next_index)
+        return state({v:{v:s.sub[v]} for v in lvars if v in s.sub}, s.next_index, s.store, s.depth)
         
     def S(s : state):
         α = of(s) 
@@ -449,6 +966,7 @@ def complement(g):
         except StopIteration:
             yield from succeed(s)
         else:
+            _abandon(α)
             yield from fail(s)    
 
     return C
@@ -546,35 +1064,217 @@ def mplus(streams, interleaving):
         providing a *complete* enumeration strategy.
 
 
+    Interleaving enumerations are delegated to a *scheduler*, a function from
+    an iterator of streams to an iterator of states, which is :py:func:`dovetail`
+    unless a different one is given to :py:func:`run`.
+
     :param iter stream: an iterator over a *countable* set of ``state``-streams
-    :param bool interleaving: enumeration strategy selector: *dovetail* if ``interleaving`` else *depth-first*
+    :param bool interleaving: enumeration strategy selector: the scheduler if ``interleaving`` else *depth-first*
     :return: an ``iter`` object over satisfying ``state`` objects
     
     '''
     
-    if interleaving:
+    # not a generator itself, so as not to add a frame to each level of the search
+    return _scheduler(streams) if interleaving else chain.from_iterable(streams)
+
+def _rounds(streams, admit):
+    # each round takes one state from every live stream, then admits the next
+    # stream of `streams`; a round rebuilds the list of live streams, so each
+    # state costs O(1) amortized time, no matter how many streams are dropped
+    if _metrics is not None:
+        yield from _metered(streams, lambda k, α, live: admit(α, live), _turns, list, _metrics)
+        return
+
+    live = []
+    for α in streams:
+        S, live = admit(α, live), []
+        keep = live.append
+        for β in S:
+            if _tick is not None: _tick() # a turn is a step of the search
+            for s in β:
+                keep(β)
+                yield s
+                break
+
+    while live:
+        S, live = live, []
+        keep = live.append
+        for β in S:
+            if _tick is not None: _tick()
+            for s in β:
+                keep(β)
+                yield s
+                break
+
+def _turns(S, keep):
+    for β in S:
+        if _tick is not None: _tick()
+        for s in β:
+            keep(β)
+            yield s
+            break
+
+def dovetail(streams):
+    '''
+    The default scheduler, it enumerates diagonals: each round takes one
+    ``state`` from every live stream, from the newest to the oldest, and then
+    admits the next stream of ``streams``; the cost of each ``state`` does not
+    depend on the number of live streams.
+    '''
+    return _rounds(streams, admit=lambda α, live: [α] + live)
 
-        try: α = next(streams)
-        except StopIteration: return
-        else: S = [α]
+def round_robin(streams):
+    '''
+    A scheduler as :py:func:`dovetail` is, but each round visits live streams
+    from the oldest to the newest, so earlier disjuncts answer first.
+    '''
+    return _rounds(streams, admit=lambda α, live: live + [α])
 
-        while S:
+def weighted(weight):
+    '''
+    Builds a scheduler as :py:func:`dovetail` is, but the stream admitted as
+    the ``k``-th one takes up to ``weight(k)`` consecutive ``state`` objs per
+    turn, instead of one; for example, ``weighted(lambda k: 2 ** max(0, 3 - k))``
+    favours the first disjuncts, that is shallower ones in a recursion. Any
+    positive weights keep the enumeration fair.
+    '''
 
-            for j in reversed(range(len(S))):
-                β = S[j]
-                try: s = next(β)
-                except StopIteration: del S[j]
-                else: yield s
-            
-            try: α = next(streams)
-            except StopIteration: pass
-            else: S.append(α)
-    else:
+    def turns(S, keep):
+        for β, w in S:
+            if _tick is not None: _tick()
+            for i, s in zip(range(w), β):
+                if not i: keep((β, w))
+                yield s
 
-        for α in streams: yield from α
+    def W(streams):
+        if _metrics is not None:
+            yield from _metered(streams, lambda k, α, live: [(α, weight(k))] + live, turns,
+                                lambda S: [β for β, w in S], _metrics)
+            return
 
+        live = []
+        for k, α in enumerate(streams):
+            S, live = [(α, weight(k))] + live, []
+            yield from turns(S, live.append)
+
+        while live:
+            S, live = live, []
+            yield from turns(S, live.append)
+
+    W.weight = weight # so that the machine of `muk.vm` schedules as `W` does
+    return W
+
+def depth_first(streams):
+    '''
+    A scheduler that enumerates each stream to its end before the next one, as
+    non interleaving disjunctions do; it keeps no stream suspended, but it is
+    complete only for finite searches, as the bounded ones of :py:func:`run`.
+    '''
+    return chain.from_iterable(streams)
+
+_scheduler = dovetail # the one of the current `run`
+_tick = None # if any, called at each step of the current search, see `_watching`
+
+class stream_metrics:
+    '''
+    The accounting of the streams that interleaving schedulers hold
+    suspended during a search, which :py:func:`run` keeps when given one as
+    ``metrics``; each suspended stream holds a chain of generator frames and
+    at least the substitution of its last ``state``, so ``size`` estimates
+    the bytes they take as the number of streams of each scheduler times the
+    size of the substitution it yielded last, a lower bound that ignores
+    frames; the size of a ``dict`` is its ``sys.getsizeof``, while the one of
+    other substitutions, as ``pmap`` s, whose shallow size does not grow with
+    their bindings, is the one of a ``dict`` with as many bindings.
+
+    Attributes are ``suspended`` and ``size``, the current estimates,
+    ``peak`` and ``peak_size``, their maxima, ``rounds``, the number of
+    rounds that schedulers took, and ``exceeded``, whether a budget was.
+
+    :param budget: if given, the bytes that ``size`` may reach.
+    :param streams: if given, the number of streams that may be suspended.
+    :param fallback: what to do as soon as a budget is exceeded, either
+        ``'deepening'``, so that the search starts again iteratively
+        deepening, as :py:func:`run` explains, skipping the answers found
+        already, whose answers are distinct from then on, or
+        ``'depth-first'``, so that every scheduler, at its next round,
+        enumerates the streams it holds as :py:func:`depth_first` does and
+        suspends no other, which may starve answers behind an infinite
+        stream and nests deeper and deeper in recursive relations, until
+        ``RecursionError``.
+
+    Only :py:func:`dovetail`, :py:func:`round_robin` and the schedulers
+    that :py:func:`weighted` builds are accounted.
+    '''
+
+    def __init__(self, budget=None, streams=None, fallback='deepening'):
+        if fallback not in ('depth-first', 'deepening'): 
+            raise ValueError("`fallback` is either 'depth-first' or 'deepening', not {!r}".format(fallback))
+        self.budget, self.streams, self.fallback = budget, streams, fallback
+        self.suspended = self.peak = self.size = self.peak_size = self.rounds = 0
+        self.exceeded = False
+
+    def __repr__(self):
+        return 'stream_metrics(suspended={}, peak={}, size={}, peak_size={}, rounds={}, exceeded={})'.format(
+            self.suspended, self.peak, self.size, self.peak_size, self.rounds, self.exceeded)
+
+    def _hold(self, held, size, S, s):
+        # updates the share of a scheduler, which held `held` streams taking
+        # `size` bytes and holds `S` now, whose last state was `s`
+        now = len(S)
+        now_size = now * _sizeof(s.sub) if s is not None else 0
+        self.rounds += 1
+        self.suspended += now - held
+        self.size += now_size - size
+        if self.suspended > self.peak: self.peak = self.suspended
+        if self.size > self.peak_size: self.peak_size = self.size
+        if ((self.streams is not None and self.suspended > self.streams) or 
+            (self.budget is not None and self.size > self.budget)): self.exceeded = True
+        return now, now_size
+
+    def _release(self, held, size):
+        self.suspended -= held
+        self.size -= size
+
+_binding_size = getsizeof(dict.fromkeys(range(1 << 10))) / (1 << 10) # the bytes of a binding of a `dict`
+
+def _sizeof(sub):
+    return getsizeof(sub) if type(sub) is dict else int(len(sub) * _binding_size)
+
+class _over_budget(Exception):
+    pass # raised by schedulers so that the search starts again deepening, see `stream_metrics`
+
+_metrics = None # the one of the current `run`, if any
+
+def _metered(streams, admit, turns, streams_of, m):
+    # schedules as `_rounds` and `weighted` do, accounting the streams held
+    # in `m` each round; `admit(k, α, live)` is the list of streams of the
+    # round that admits the `k`-th stream `α`, `streams_of` its streams
+    live, held, size, s = [], 0, 0, None
+    try:
+        for k, α in enumerate(streams):
+            S, live = admit(k, α, live), []
+            held, size = m._hold(held, size, S, s)
+            if m.exceeded:
+                if m.fallback == 'deepening': raise _over_budget()
+                yield from chain.from_iterable(chain(streams_of(S), streams))
+                return
+            for r in turns(S, live.append):
+                if r.__class__ is state: s = r # not a mark that some goals yield instead, as `_spawned`
+                yield r
+
+        while live:
+            S, live = live, []
+            held, size = m._hold(held, size, S, s)
+            if m.exceeded:
+                if m.fallback == 'deepening': raise _over_budget()
+                yield from chain.from_iterable(streams_of(S))
+                return
+            for r in turns(S, live.append):
+                if r.__class__ is state: s = r # not a mark that some goals yield instead, as `_spawned`
+                yield r
+    finally: m._release(held, size)
 
-                
 
 def bind(α, g, *, mplus):
     '''
@@ -647,10 +1347,25 @@ def bind(α, g, *, mplus):
 
 # INTERFACE {{{
 
+def _as_lists(r):
+    # the default `post` of runs, which answer lists instead of the conses that relations build
+    return cons_to_list(r) if isinstance(r, (cons, seq)) else r
+
 def run(goal, 
         n=False, 
         var_selector=lambda *args: args[0],
-        post=lambda r: cons_to_list(r) if isinstance(r, cons) else r):
+        post=_as_lists,
+        substitution=dict,
+        workers=None,
+        ordered=True,
+        scheduler=dovetail,
+        compiled=False,
+        distinct=False,
+        depth=None,
+        deepening=False,
+        metrics=None,
+        checkpoint=None,
+        every=60):
     '''
     Looks for a list of at most ``n`` associations ``[(u, v) for v in ...]``
     such that when var ``u`` takes value ``v`` the relation ``goal`` is
@@ -658,24 +1373,429 @@ def run(goal,
     invocation; otherwise, it enumerates the relation if ``n`` is ``False``.
 
     :param goal: the relation to be satisfied respect to the main var according to :py:obj:`var_selector`.
+    :param substitution: the ctor of the empty substitution, either ``dict``,
+        which copies itself on each binding, or :py:class:`muk.pmap.pmap`, which
+        shares structure among extensions and pays off on long derivations.
+    :param workers: if given, the number of processes that search in parallel
+        the branches of the top-level disjunctions of ``goal``, as
+        :py:func:`muk.parallel.parallel_run` explains.
+    :param ordered: when searching in parallel, whether answers come in the
+        same order as the sequential search yields them or as soon as found.
+    :param scheduler: the enumeration of interleaving disjunctions, either
+        :py:func:`dovetail`, :py:func:`round_robin`, one built by
+        :py:func:`weighted` or any function from an iterator of states
+        streams to an iterator of states.
+    :param compiled: whether to search by the machine of :py:mod:`muk.vm`,
+        which runs goals compiled into flat code, instead of the closures
+        that goals are; answers are the same, in the same order.
+    :param distinct: whether to skip answers equal to a previous one, as
+        interleaving searches find many times; reified vars are numbered by
+        occurrence, so alpha-equivalent answers are equal. Then ``n``
+        counts distinct answers and the ground terms that vars are bound to
+        are instantiated once per run, since duplicates share them.
+    :param depth: if given, goals built by :py:func:`fresh` fail instead of
+        introducing their vars when they run in the bodies of ``depth``
+        others already, as the ``depth`` of states counts, even if they were
+        built while searching, as bodies of ``project`` are; so, a search
+        for answers whose derivations are that shallow is finite.
+    :param deepening: whether to search *iteratively deepening* the bound
+        ``depth`` of each search, taking values ``1, 2, 3, ...``, up to
+        ``depth`` if given, or the increasing ones of an iterable; each
+        search enumerates every disjunction depth-first, keeping no stream
+        suspended, and all of them together are complete. Answers are
+        distinct, as ``distinct`` explains, and come by depth; the
+        deepening stops after a search that its bound did not cut.
+    :param metrics: if given, a :py:class:`stream_metrics` obj that accounts
+        the streams that the search holds suspended, and enforces its budget.
+    :param checkpoint: if given, the path of the file where the search,
+        which is compiled then, writes its checkpoint at most every ``every``
+        seconds, and when it is done; :py:func:`resume` goes on from it, as
+        :py:mod:`muk.checkpoint` explains, which warns about searches whose
+        progress is not saved, as interleaving ones under ``depth_first``.
 
+    '''
 
-
+    global _scheduler, _metrics
+    previous, _scheduler, _metrics = (_scheduler, _metrics), depth_first if deepening else scheduler, metrics
+    try: return _run(goal, n, var_selector, post, substitution, workers, ordered, compiled, distinct, depth, deepening, metrics, checkpoint, every)
+    finally: _scheduler, _metrics = previous
+
+def resume(goal,
+           checkpoint,
+           n=False,
+           var_selector=lambda *args: args[0],
+           post=_as_lists,
+           substitution=dict,
+           scheduler=dovetail,
+           distinct=False,
+           every=60):
     '''
+    Goes on with the search of ``run(goal, ..., checkpoint=checkpoint)``
+    from the last checkpoint that it wrote, returning every answer, the ones
+    found before too; ``goal`` is built again, as the first time, since
+    closures cannot be serialized, and so are the other params.
+    '''
+
+    if not exists(checkpoint): raise FileNotFoundError('No checkpoint at {}'.format(checkpoint))
+
+    from muk.checkpoint import checkpointed_run # imported here since it depends on this module
+    global _scheduler
+    previous, _scheduler = _scheduler, scheduler
+    try: return checkpointed_run(goal, n, var_selector, post, substitution, distinct, checkpoint, every, resumed=True)
+    finally: _scheduler = previous
+
+def _run(goal, n, var_selector, post, substitution, workers, ordered, compiled, distinct=False, depth=None, deepening=False, metrics=None,
+         checkpoint=None, every=60):
+
+    if checkpoint is not None:
+        if workers or depth is not None or deepening or metrics is not None: 
+            raise ValueError('Checkpointed searches are plain compiled ones, use `checkpoint` alone')
+        from muk.checkpoint import checkpointed_run # imported here since it depends on this module
+        return checkpointed_run(goal, n, var_selector, post, substitution, distinct, checkpoint, every)
+
+    if workers:
+        if depth is not None or deepening: raise ValueError('Bounded searches are sequential, use either `workers` or `depth`')
+        if metrics is not None: raise ValueError('Metered searches are sequential, use either `workers` or `metrics`')
+        from muk.parallel import parallel_run # imported here since it depends on this module
+        return parallel_run(goal, n, var_selector, post, substitution, workers, ordered, compiled, distinct)
+
+    return list(_answers(goal, n, var_selector, post, substitution, compiled, distinct, depth, deepening, metrics))
+
+class _depth_bound:
 
-    with states_stream(goal) as α:
-        domain = range(n) if n else count()
-        subs = [a.sub for i, a in zip(domain, α)]
+    __slots__ = ('depth', 'cut')
 
-    logic_vars = getattr(goal, 'logic_vars', None) # defaults to `None` instead of `[]` to distinguish attr set by `_fresh` 
-    m_var = var_selector(*logic_vars) if logic_vars else Tautology() # any satisfying sub is a Tautology if there are no logic vars
+    def __init__(self, depth):
+        self.depth, self.cut = depth, False # whether a `fresh` goal failed because of `depth`
+
+_bound = None # the one of the current search, if any
+
+def _bounded(α, bound, scheduler=None):
+    # the states of `α`, searched within `bound` and by `scheduler`, if given,
+    # which are active only while searching, since other searches can go on
+    # between states
+    global _bound, _scheduler
+    while True:
+        previous, _bound = (_bound, _scheduler), bound
+        if scheduler is not None: _scheduler = scheduler
+        try: s = next(α, None)
+        finally: _bound, _scheduler = previous
+        if s is None: return
+        yield s
+
+def _answers(goal, n, var_selector, post, substitution, compiled, distinct=False, depth=None, deepening=False, metrics=None):
+
+    if compiled:
+        if compiled is True: 
+            from muk.vm import execute as compiled # imported here since it depends on this module
+        search = partial(compiled, goal) # either `execute` or a function that calls it, as checkpoints do
+    else: search = goal
+
+    if deepening: 
+        depths = deepening if deepening is not True else count(1) if depth is None else range(1, depth + 1)
+        distinct = True
+    else: depths = [depth]
+
+    cache, seen, found = {} if distinct else None, set(), 0 # ground subterms recur among duplicates
+    recorded = metrics is not None and metrics.fallback == 'deepening' # answers to skip when deepening after all
+    fallen = False # whether the search starts again deepening, since it exceeded the budget of `metrics`
 
     def λ(sub): 
-        w_var = walk_star(m_var, sub) # instantiate every content in the expr associated to `main_var` in `sub` to the most specific value
-        r_var = reify(w_var)
-        return post(r_var)
+        w_var = walk_star(m_var, sub, cache) # instantiate every content in the expr associated to `main_var` in `sub` to the most specific value
+        r_sub = reify_s(w_var, sub={})
+        return walk_star(w_var, r_sub) if r_sub else w_var # an instantiation without fresh vars is reified already
 
-    return list(map(λ, subs))
+    while True:
+        try:
+            for d in depths:
+                m_var, bound = None, None if d is None else _depth_bound(d)
+                with states_stream(search, initial_state=emptystate(substitution)) as α:
+                    states = α if bound is None else _bounded(α, bound, depth_first if fallen else None)
+                    for a in states:
+                        if m_var is None: # the attr is set by `fresh` as soon as the search starts
+                            logic_vars = getattr(goal, 'logic_vars', None) # defaults to `None` instead of `[]` to distinguish attr set by `_fresh` 
+                            m_var = var_selector(*logic_vars) if logic_vars else Tautology() # any satisfying sub is a Tautology if there are no logic vars
+                        r_var = λ(a.sub)
+                        if distinct:
+                            key = _canonical(r_var, cache)
+                            if key in seen: continue
+                            seen.add(key)
+                        elif recorded: seen.add(_canonical(r_var))
+                        yield post(r_var)
+                        found += 1
+                        if found == n: return # before asking for a state more, which could take forever
+                if bound is None or not bound.cut: return # no deeper answer
+            return
+        except _over_budget: # raised by schedulers of the first search only, since deepening suspends no stream
+            fallen, distinct, cache = True, True, {}
+            depths = count(1) if depth is None else range(1, depth + 1)
+
+def run_many(goal_factory,
+             inputs,
+             n=False,
+             prefix=None,
+             var_selector=lambda *args: args[0],
+             post=_as_lists,
+             substitution=dict,
+             scheduler=dovetail,
+             distinct=False,
+             workers=None):
+    '''
+    Runs a query for each obj of ``inputs``, returning the list of the
+    answers of each one, in order; each query is the one of
+    ``run(fresh(lambda *vs: conj(prefix(*vs), goal_factory(input, *vs))), n)``
+    but the states that satisfy ``prefix`` are searched once for all of
+    them, lazily, since each query consumes its own fork of their stream.
+
+        >>> from muk.ext import disj, unify
+        >>> run_many(lambda i, q, r: unify(r, i), [1, 2, 3], 
+        ...          prefix=lambda q, r: disj(unify([r, 'x'], q), unify([r, 'y'], q)))
+        [[[1, 'x'], [1, 'y']], [[2, 'x'], [2, 'y']], [[3, 'x'], [3, 'y']]]
+
+    :param goal_factory: a function from an input and the logic vars of
+        ``prefix`` to the goal of a query, searched on each state of
+        ``prefix`` as :py:func:`muk.ext.conj` does.
+    :param prefix: the receiver of a :py:func:`fresh` goal, shared by every
+        query; if not given, queries share their vars only, which the params
+        of ``goal_factory`` after the first one introduce.
+    :param workers: if given, the number of processes that run queries in
+        parallel, as :py:func:`muk.parallel.parallel_map` explains; each one
+        searches ``prefix`` once for the queries it runs.
+
+    The other params are the ones of :py:func:`run`; states of ``prefix``
+    are kept as long as the queries that need them, so a ``prefix`` with
+    infinitely many of them is consumed only as far as some query goes.
+    '''
+
+    global _scheduler
+    previous, _scheduler = _scheduler, scheduler
+    try:
+        inputs = list(inputs)
+        query = _forking(goal_factory, prefix, substitution, len(inputs))
+        answers = lambda k: list(_answers(query(k, inputs[k]), n, var_selector, post, substitution, compiled=False, distinct=distinct))
+        if workers:
+            from muk.parallel import parallel_map # imported here since it depends on this module
+            return parallel_map(answers, range(len(inputs)), workers)
+        return [answers(k) for k in range(len(inputs))]
+    finally: _scheduler = previous
+
+def _forking(goal_factory, prefix, substitution, queries):
+    # a function from the position and the input of each of `queries` to the
+    # goal of its query, whose states extend the ones of `prefix`, searched
+    # once for all of them by the queries that need them first; states are
+    # immutable, so queries can share them
+    if prefix is None:
+        logic_vars = [var(i, name) for i, (_, name) in enumerate(_parameters(goal_factory)[1:])]
+        states = iter([state(substitution(), len(logic_vars))])
+    else:
+        F = fresh(prefix)
+        g, s = F.unfold(emptystate(substitution))
+        logic_vars, states = F.logic_vars, g(s)
+    forks = list(tee(states, queries)) # each one dropped by its query, so states are kept as long as a later query needs them
+
+    def query(k, i):
+        goal, forked, forks[k] = goal_factory(i, *logic_vars), forks[k], None
+        Q = lambda s: bind(forked, goal, mplus=chain.from_iterable)
+        Q.logic_vars = logic_vars # as `fresh` goals have, for `_answers`
+        return Q
+
+    return query
+
+def run_iter(goal, 
+             n=False, 
+             var_selector=lambda *args: args[0],
+             post=_as_lists,
+             substitution=dict,
+             scheduler=dovetail,
+             compiled=False,
+             timeout=None,
+             cancel=None,
+             timed=False,
+             distinct=False,
+             depth=None,
+             deepening=False,
+             metrics=None):
+    '''
+    A generator of the answers that :py:func:`run` returns, in the same order,
+    each one reified as soon as the search finds it; so a caller consumes
+    them incrementally and stops whenever it likes, closing the search.
+
+    :param timeout: if given, the seconds the whole search may take; when the
+        next answer is asked for after them, ``TimeoutError`` is raised.
+    :param cancel: if given, a token as ``threading.Event`` objs are, whose
+        ``is_set()`` ends the search before the next answer.
+    :param timed: whether to yield pairs of an answer and the seconds the
+        search took to find it after the previous one, instead of answers.
+
+    The other params are the ones of :py:func:`run`; both ``timeout`` and
+    ``cancel`` are checked while looking for an answer too, every few hundred
+    steps of the search, so a search that finds none ends anyway.
+
+        >>> from muk.ext import disj, unify
+        >>> for answer in run_iter(fresh(lambda q: disj(unify(q, 1), unify(q, 2), unify(q, 3)))):
+        ...     print(answer)
+        ...     if answer == 2: break
+        1
+        2
+    '''
+
+    global _scheduler, _metrics, _tick
+    answers = _answers(goal, n, var_selector, post, substitution, compiled, distinct, depth, deepening, metrics)
+    if deepening: scheduler = depth_first
+    deadline = None if timeout is None else perf_counter() + timeout
+    tick = None if deadline is None and cancel is None else _watching(deadline, timeout, cancel)
+    try:
+        while True:
+            start = perf_counter()
+            previous, _scheduler, _metrics, _tick = (_scheduler, _metrics, _tick), scheduler, metrics, tick # only while searching, since other runs can go on between answers
+            try:
+                if tick is not None: tick.check() # before the next answer too, which might come at once
+                answer = next(answers, _exhausted)
+            except _cancelled: return
+            finally: _scheduler, _metrics, _tick = previous
+            if answer is _exhausted: return
+            yield (answer, perf_counter() - start) if timed else answer
+    finally: answers.close()
+
+class _cancelled(Exception):
+    pass # raised by `_watching` in the middle of a search, which `run_iter` ends
+
+_watch_period = 256 # the steps of a search between checks of its timeout and cancel token
+
+class _watching:
+    # the `_tick` of searches of `run_iter`, which raises `TimeoutError` after
+    # `deadline` and `_cancelled` once `cancel` is set, checking them every
+    # `_watch_period` steps, since clocks and events cost more than a step
+    def __init__(self, deadline, timeout, cancel):
+        self.deadline, self.timeout, self.cancel, self.steps = deadline, timeout, cancel, 0
+
+    def __call__(self):
+        self.steps += 1
+        if self.steps == _watch_period:
+            self.steps = 0
+            self.check()
+
+    def check(self):
+        if self.cancel is not None and self.cancel.is_set(): raise _cancelled()
+        if self.deadline is not None and perf_counter() > self.deadline:
+            raise TimeoutError('no more answers within {} seconds'.format(self.timeout))
+
+async def async_run(goal,
+                    n=False,
+                    var_selector=lambda *args: args[0],
+                    post=_as_lists,
+                    substitution=dict,
+                    scheduler=dovetail,
+                    compiled=False,
+                    distinct=False,
+                    depth=None,
+                    deepening=False,
+                    metrics=None,
+                    steps=1000,
+                    pool=None):
+    '''
+    A coroutine of the answers that :py:func:`run` returns, in the same order,
+    whose search gives control back to the event loop every ``steps`` steps;
+    so, queries that run concurrently on one loop take turns, each one for
+    ``steps`` steps, and other tasks go on meanwhile.
+
+        >>> import asyncio
+        >>> from muk.ext import disj, unify
+        >>> async def both():
+        ...     return await asyncio.gather(async_run(fresh(lambda q: disj(unify(q, 1), unify(q, 2)))),
+        ...                                 async_run(fresh(lambda q: unify(q, 3))))
+        >>> asyncio.new_event_loop().run_until_complete(both())
+        [[1, 2], [3]]
+
+    :param steps: the steps searched between two breaks, which are the
+        alternatives of the machine of :py:mod:`muk.vm`, the calls of relations
+        and the turns of interleaving schedulers; since the search runs in a
+        thread of its own, which hands control back and forth with the loop, it
+        takes breaks inside interleaving goals and closures too.
+    :param pool: if given, a :py:class:`muk.parallel.process_pool`, whose
+        processes search the query instead, while the loop only waits for its
+        answers, which must be picklable objs then.
+
+    The other params are the ones of :py:func:`run`.
+    '''
+
+    from asyncio import sleep # imported here, since it takes longer to import than this module
+
+    if pool is not None:
+        if metrics is not None: raise ValueError('Metrics of searches in other processes are lost, use either `pool` or `metrics`')
+        return await pool.apply(partial(run, goal, n, var_selector, post, substitution, scheduler=scheduler, compiled=compiled, 
+                                        distinct=distinct, depth=depth, deepening=deepening))
+
+    answers = _answers(goal, n, var_selector, post, substitution, compiled, distinct, depth, deepening, metrics)
+    slices = _slices(steps, depth_first if deepening else scheduler, metrics)
+    found = []
+
+    def search():
+        try:
+            slices.resume()
+            found.extend(answers)
+        except _abandoned: pass
+        except BaseException as e: slices.error = e
+        finally:
+            answers.close()
+            slices.end()
+
+    Thread(target=search, daemon=True).start()
+    try:
+        while True:
+            slices.go.release() # the search goes on for a slice, while the loop waits
+            slices.paused.acquire()
+            if slices.done: break
+            await sleep(0) # a turn of the other tasks
+    except BaseException:
+        if not slices.done: # as a cancelled task, whose search ends as soon as it goes on
+            slices.abandoned = True
+            slices.go.release()
+            slices.paused.acquire()
+        raise
+    if slices.error is not None: raise slices.error
+    return found
+
+class _abandoned(Exception):
+    pass # raised by `_slices` in the searches of cancelled `async_run` s
+
+class _slices:
+    # the `_tick` of searches of `async_run`, which run in threads of their own
+    # and hand control back and forth with the event loop, one slice of `steps`
+    # steps at a time; since either a search or the loop goes on, globals of
+    # the current search are swapped with the ones of the loop at each break
+    def __init__(self, steps, scheduler, metrics):
+        self.steps, self.taken = steps, 0
+        self.go, self.paused = Semaphore(0), Semaphore(0)
+        self.current, self.outer = (scheduler, metrics, None, self), None
+        self.abandoned, self.done, self.error = False, False, None
+
+    def __call__(self):
+        self.taken += 1
+        if self.taken == self.steps:
+            self.taken = 0
+            self.pause()
+            self.resume()
+
+    def resume(self):
+        global _scheduler, _metrics, _bound, _tick
+        self.go.acquire()
+        if self.abandoned: raise _abandoned()
+        self.outer = _scheduler, _metrics, _bound, _tick
+        _scheduler, _metrics, _bound, _tick = self.current
+
+    def pause(self):
+        global _scheduler, _metrics, _bound, _tick
+        self.current = _scheduler, _metrics, _bound, _tick
+        _scheduler, _metrics, _bound, _tick = self.outer
+        self.paused.release()
+
+    def end(self):
+        self.done = True # before the loop goes on
+        if self.outer is not None: self.pause()
+        else: self.paused.release() # abandoned before it started
+
+_exhausted = object()
 
 
 # }}}
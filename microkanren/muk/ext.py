@@ -2,22 +2,28 @@
 import collections
 from functools import wraps, partial, reduce
 from contextlib import contextmanager
+from inspect import Parameter, Signature
 
 from muk.core import *
-from muk.core import _conj, _disj, _unify_pure, _unify_occur_check
+from muk.core import _conj, _disj, _conj_flat, _disj_flat, _unify_pure, _unify_occur_check, _unification, _constrained
 from muk.utils import *
+from muk import profiler as _profiler
 
 
 def snooze(f, formal_vars):
     return fresh(lambda: f(*formal_vars))
 
-def disj(*goals, interleaving=True):
-    D = partial(_disj, interleaving=interleaving)
-    return foldr(D, goals, initialize=fail)
+# depth-first goals are flat, in the order of nested ones; interleaving ones
+# nest, since their order is the one of the nesting, unless `flat`, which
+# takes a frame whatever the number of goals but gives states in another order
 
-def conj(*goals, interleaving=False):
-    C = partial(_conj, interleaving=interleaving)
-    return foldr(C, goals, initialize=succeed)
+def disj(*goals, interleaving=True, flat=False):
+    if not interleaving or flat: return _disj_flat(goals, interleaving)
+    return foldr(partial(_disj, interleaving=True), goals, initialize=fail)
+
+def conj(*goals, interleaving=False, flat=False):
+    if not interleaving or flat: return _conj_flat(goals, interleaving)
+    return foldr(partial(_conj, interleaving=True), goals, initialize=succeed)
 
 conji = partial(conj, interleaving=True)
 
@@ -31,6 +37,13 @@ def unify_occur_check(u, v):
 
 def cond(*clauses, else_clause=[fail], λ_if):
 
+    if _profiler.active is not None: # to count the states each question is asked on and fails
+        clauses = [[_profiler.active.instrument(question, 'clause {}'.format(i))] + answers 
+                   for i, (question, *answers) in enumerate(clauses)]
+
+    if λ_if is ife: # clauses are tried one after the other, so they need no nesting
+        return _disj_flat([conj(*clause) for clause in clauses] + [conj(*else_clause)])
+
     def λ(clause, otherwise):
         question, *answers = clause
         return λ_if(question, conj(*answers), otherwise)
@@ -47,13 +60,291 @@ condu = partial(cond, λ_if=ifu)
 equalo = unify
 
 def rel(r):
+    arity = len(signature(r).parameters) # once, not at each call
     def R(res):
         def recv(*args): 
             return conj(r(*args), unify(list(args), res))
-        r_sig = signature(r)
-        return fresh(recv, arity=len(r_sig.parameters))
+        return fresh(recv, arity=arity)
     return R
 
 def lvars(vars_names, splitter=' '):
     return [var(b, n.strip()) for b, n in enumerate(vars_names.split(splitter))]
 
+# TABLING {{{
+
+class tables:
+    '''
+    The answer tables of a relation decorated with :py:func:`tabled`, keyed by
+    the reified call pattern; ``hits`` counts calls served by an existing
+    table while ``misses`` counts calls that had to build one.
+    '''
+
+    def __init__(self):
+        self.entries, self.hits, self.misses = {}, 0, 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        entries = self.entries.values()
+        return {'calls': len(self.entries),
+                'answers': sum(len(e.answers) for e in entries),
+                'complete': sum(e.complete for e in entries),
+                'hits': self.hits,
+                'misses': self.misses}
+
+    def abolish(self):
+        '''Forgets every answer, for example after facts a relation depends on change.'''
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+class _entry:
+
+    __slots__ = ('tables', 'key', 'answers', 'seen', 'complete', 'depth', 'low', 'scc')
+
+    def __init__(self, tables, key):
+        self.tables, self.key = tables, key
+        self.answers, self.seen, self.complete = [], set(), False
+        self.depth = None # position in `_evaluating` while being evaluated
+
+_evaluating = [] # stack of entries under evaluation, innermost last
+_new_answers = 0 # grows whenever any table learns an answer
+
+def _frozen(t):
+    # a hashable image of a reified term, so that variant terms are equal keys
+    if isinstance(t, (cons, seq)): t = cons_to_list(t)
+    if type(t) is list: return (list, tuple(map(_frozen, t)))
+    if type(t) is tuple: return (tuple, tuple(map(_frozen, t)))
+    return t
+
+def _reified(term, sub):
+    w = walk_star(term, sub)
+    r = reify_s(w, {})
+    return walk_star(w, r), len(r)
+
+def _renamed(answer, offset):
+    n, r = answer[1], {rvar(i): var(offset + i, 'τ') for i in range(answer[1])}
+    return walk_star(answer[0], r), n
+
+def _evaluate(entry, relation, call, substitution):
+    '''
+    Computes answers of ``relation`` for the call pattern ``call`` until a
+    fixpoint: a recursive call of a variant being evaluated consumes the
+    answers found so far, so rounds repeat until none is new. An entry that
+    consumed answers of an older call under evaluation belongs to the same
+    strongly connected component of that call; so it is left incomplete and
+    evaluated again, if needed, during the next round of the older call,
+    which is the leader that completes all of them.
+    '''
+
+    global _new_answers
+
+    depth = len(_evaluating)
+    entry.depth, entry.low, entry.scc = depth, depth, [entry]
+    _evaluating.append(entry)
+    pattern, k = _renamed(call, offset=0)
+    try:
+        while True:
+            before = _new_answers
+            for s in relation(*pattern)(state(substitution(), k)):
+                answer = _reified(pattern, s.sub)
+                key = _frozen(answer[0])
+                if key not in entry.seen:
+                    entry.seen.add(key)
+                    entry.answers.append(answer)
+                    _new_answers += 1
+            if entry.low < depth: break
+            if _new_answers == before:
+                for e in entry.scc: e.complete = True
+                break
+    except BaseException:
+        for e in entry.scc: e.tables.entries.pop(e.key, None)
+        raise
+    finally:
+        _evaluating.pop()
+        entry.depth = None
+        if not entry.complete and _evaluating:
+            leader = _evaluating[-1]
+            leader.low = min(leader.low, entry.low)
+            leader.scc.extend(entry.scc)
+
+def tabled(relation):
+    '''
+    Decorates ``relation`` to memoize its answers in tables, one per variant of
+    call pattern, namely arguments reified in the caller's substitution; a
+    call whose table is already complete consumes its answers instead of
+    searching again. Tables are filled to a fixpoint before yielding their
+    answers, therefore left recursive relations terminate, provided they have
+    finitely many answers per call, and answers are not repeated. Moreover,
+    answers come in the order they enter the table, which can differ from
+    the order of the search. Tables are inspectable through attr ``tables``,
+    an obj of class :py:class:`tables`. Tables record answers only, so
+    constraints posted by ``relation`` are not kept, while the ones of the
+    caller still check the answers it consumes.
+
+    When ``relation`` is decorated by
+    :py:func:`muk.sexp.adapt_iterables_to_conses` too, ``tabled`` should be
+    the innermost decorator, so that tables see ``cons`` cells.
+    '''
+
+    table = tables()
+
+    @wraps(relation)
+    def R(*args):
+
+        def T(s : state):
+            call = _reified(list(args), s.sub)
+            key = _frozen(call[0])
+            try: hash(key)
+            except TypeError: # unhashable atoms, not tabled
+                yield from relation(*args)(s)
+                return
+
+            entry = table.entries.get(key)
+            if entry is None:
+                table.misses += 1
+                entry = table.entries[key] = _entry(table, key)
+            else: table.hits += 1
+
+            if not entry.complete:
+                if entry.depth is None: _evaluate(entry, relation, call, type(s.sub))
+                elif _evaluating: # a variant of a call under evaluation, consume its answers so far
+                    innermost = _evaluating[-1]
+                    innermost.low = min(innermost.low, entry.depth)
+
+            answers, i = entry.answers, 0
+            while i < len(answers): # answers can grow while consuming an incomplete table
+                answer, n = _renamed(answers[i], offset=s.next_index)
+                i += 1
+                try: sub = _unification(list(args), answer, s.sub, ext_s)
+                except UnificationError: continue
+                if sub is None: continue
+                r = _constrained(s, sub, s.next_index + n)
+                if r is not None: yield r
+
+        return T
+
+    R.tables = table
+    return R
+
+# }}}
+
+# INDEXING {{{
+
+def _indexable(c):
+    # whether constant `c` can be a key of an index, as atoms that are not vars are
+    if isinstance(c, (var, cons, seq)): return False
+    try: hash(c)
+    except TypeError: return False
+    return True
+
+def _index(keys):
+    # from each key among `keys` to the positions with that key or with `None`,
+    # which marks an unindexed position and matches any key, in order
+    index, unindexed = {}, []
+    for i, k in enumerate(keys):
+        if k is None: 
+            unindexed.append(i)
+            for positions in index.values(): positions.append(i)
+        elif k not in index: index[k] = unindexed + [i]
+        else: index[k].append(i)
+    return index, unindexed
+
+def facts(*rows, index=0):
+    '''
+    A relation whose answers are ``rows``, each one a tuple of its arguments,
+    that unifies its arguments with each row in order, as a ``conde`` of
+    ``unify`` clauses does; rows are indexed by their argument in position
+    ``index``, so when a call binds it to an atom only the rows with an equal
+    atom there, or a var, are tried, while every row is when it is fresh.
+
+        >>> parent = facts(('abe', 'homer'), ('homer', 'bart'), ('homer', 'lisa'))
+        >>> run(fresh(lambda q: parent('homer', q)))
+        ['bart', 'lisa']
+        >>> run(fresh(lambda q: parent(q, 'lisa')))
+        ['homer']
+    '''
+
+    rows = [tuple(map(list_to_cons, row)) for row in rows]
+    table, unindexed = _index([row[index] if _indexable(row[index]) else None for row in rows])
+    table = {k: [rows[i] for i in positions] for k, positions in table.items()}
+    unindexed = [rows[i] for i in unindexed]
+
+    def R(*args):
+
+        args = tuple(map(list_to_cons, args))
+
+        def F(s : state):
+            v = walk(args[index], s.sub)
+            if isinstance(v, var): candidates = rows
+            else:
+                try: candidates = table.get(v, unindexed)
+                except TypeError: candidates = rows # unhashable, as `cons` cells are
+            for row in candidates:
+                try: sub = _unification(args, row, s.sub, ext_s)
+                except UnificationError: continue
+                if sub is None: continue
+                r = _constrained(s, sub, s.next_index)
+                if r is not None: yield r
+
+        return F
+
+    R.rows = rows
+    if rows: # so that its arity is known, as `rel` needs
+        R.__signature__ = Signature([Parameter('a{}'.format(i), Parameter.POSITIONAL_ONLY) for i in range(len(rows[0]))])
+    return R
+
+def indexed_cond(*clauses, on=None, else_clause=[fail], cond=conde):
+    '''
+    A goal as ``cond(*clauses, else_clause=else_clause)`` is, but clauses
+    whose first goal is ``unify(on, c)``, or ``unify(c, on)``, for an atom
+    ``c`` are indexed by it, so when var ``on`` is bound to an atom only the
+    clauses with an equal one, and the other clauses, are tried, in order;
+    every clause is when ``on`` is fresh. If ``on`` is not given, it is the
+    var that the first goal of the first clause unifies with a constant, as
+    in relations defined by clauses over their first argument; if there is
+    none, as when a caller gives a value for that argument, clauses are not
+    indexed, since each question fails or succeeds right away. Either
+    :py:func:`indexed_conde` or :py:func:`indexed_condi` are handier::
+
+        def bit_xoro(α, β, γ):
+            return indexed_conde([unify(0, α), unify(0, β), unify(0, γ)],
+                                 [unify(1, α), unify(0, β), unify(1, γ)],
+                                 [unify(0, α), unify(1, β), unify(1, γ)],
+                                 [unify(1, α), unify(1, β), unify(0, γ)])
+    '''
+
+    if on is None:
+        terms = getattr(clauses[0][0], 'terms', ()) if clauses else ()
+        logic_vars = [t for t in terms if isinstance(t, var)]
+        if len(logic_vars) == 1: on = logic_vars[0]
+    if not isinstance(on, var): # a caller gave a value, so each question is decided as soon as it is asked
+        return cond(*clauses, else_clause=else_clause)
+
+    def key(question):
+        u, v = getattr(question, 'terms', (None, None)) # not a unification, or one instrumented by a profiler
+        c = v if u is on else u if v is on else None
+        return c if c is not None and _indexable(c) else None
+
+    index, unindexed = _index([key(question) for question, *answers in clauses])
+    everything, goals = range(len(clauses)), {}
+
+    def selected(positions): # built when first needed, since many calls need one of them only
+        k = tuple(positions)
+        g = goals.get(k)
+        if g is None: g = goals[k] = cond(*[clauses[i] for i in positions], else_clause=else_clause)
+        return g
+
+    def I(s : state):
+        v = walk(on, s.sub)
+        if isinstance(v, var): return selected(everything)(s)
+        try: positions = index.get(v, unindexed)
+        except TypeError: positions = everything # unhashable, as `cons` cells are
+        return selected(positions)(s)
+
+    return I
+
+indexed_conde = partial(indexed_cond, cond=conde)
+indexed_condi = partial(indexed_cond, cond=condi)
+
+# }}}
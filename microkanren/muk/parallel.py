@@ -0,0 +1,270 @@
+'''
+Parallel search over the branches of disjunctions.
+
+Goals built by :py:func:`muk.core._disj` and by ``conde``-like ctors remember
+their branches, while goals built by :py:func:`muk.core.fresh` can
+*unfold*, namely introduce their logic vars without searching yet. Hence, the
+top-level disjunctions of a goal can be split into independent subproblems,
+pairs of a goal and a state, which worker processes search concurrently.
+
+Workers are *forked*, so they inherit goals, which are closures and cannot be
+serialized; only answers travel back, already reified, therefore they must be
+picklable objs. On platforms without ``fork`` the search is sequential.
+
+'''
+
+import asyncio, multiprocessing
+from collections import deque
+from itertools import islice
+
+from muk.core import *
+from muk.core import _canonical
+from muk.vm import execute
+
+class _leaf:
+
+    __slots__ = ('goal', 'state', 'index')
+
+    def __init__(self, goal, state):
+        self.goal, self.state, self.index = goal, state, None
+
+class _node:
+
+    __slots__ = ('interleaving', 'children')
+
+    def __init__(self, interleaving, children):
+        self.interleaving, self.children = interleaving, children
+
+def split(goal, s, wanted):
+    '''
+    Splits the search of ``goal`` from state ``s`` into at least ``wanted``
+    subproblems if its disjunctions allow it, expanding shallower ones first.
+    It returns the tree of disjunctions, whose inner nodes are ``_node`` objs
+    and whose leaves are ``_leaf`` objs, together with the list of leaves, from
+    left to right.
+    '''
+
+    root = _leaf(goal, s)
+    while hasattr(root.goal, 'unfold'): # even if one subproblem is wanted, so that `fresh` sets its logic vars
+        root.goal, root.state = root.goal.unfold(root.state)
+    tree, frontier, leaves = root, deque([(root, None, None)]), 1
+    while frontier and leaves < wanted:
+        leaf, parent, i = frontier.popleft()
+        g, s = leaf.goal, leaf.state
+        while hasattr(g, 'unfold'): g, s = g.unfold(s)
+        leaf.goal, leaf.state = g, s
+        branches = getattr(g, 'branches', None)
+        if branches is None: continue
+        children = [_leaf(b, s) for b in branches]
+        node = _node(g.interleaving, children)
+        if parent is None: tree = node
+        else: parent.children[i] = node
+        frontier.extend((c, node, j) for j, c in enumerate(children))
+        leaves += len(children) - 1
+
+    ordered, todo = [], [tree]
+    while todo:
+        t = todo.pop()
+        if type(t) is _leaf: 
+            t.index = len(ordered)
+            ordered.append(t)
+        else: todo.extend(reversed(t.children))
+    return tree, ordered
+
+_job = None # what forked workers search, set by the parent before forking
+
+def _worker():
+    leaves, m_var, n, post, queue, taken, search, distinct = _job
+    while True:
+        with taken.get_lock(): # leaves are searched in order, each by the first idle worker
+            i = taken.value
+            taken.value += 1
+        if i >= len(leaves): return
+        leaf = leaves[i]
+        try:
+            for a in islice(_answers(search(leaf.goal, leaf.state), m_var, distinct), n or None):
+                queue.put((i, 'answer', a if distinct else post(a)))
+        except BaseException as e:
+            try: queue.put((i, 'error', e))
+            except Exception: queue.put((i, 'error', RuntimeError(repr(e)))) # unpicklable one
+        else: queue.put((i, 'done', None))
+
+def _answers(α, m_var, distinct):
+    # reified answers of the states in `α`, paired with their keys and distinct within `α` if `distinct`
+    answers = (reify(walk_star(m_var, s.sub)) for s in α)
+    if not distinct: return answers
+    seen = set()
+    return ((key, r) for r in answers for key in [_canonical(r)] if key not in seen and not seen.add(key))
+
+def _distinct(pairs, post):
+    # posted answers of `pairs` whose keys are distinct, keeping the first of equal ones
+    seen = set()
+    return (post(r) for key, r in pairs if key not in seen and not seen.add(key))
+
+def parallel_run(goal, n, var_selector, post, substitution, workers, ordered, compiled=False, distinct=False):
+    '''
+    The body of :py:func:`muk.core.run` when it is asked for ``workers``
+    processes: disjunctions of ``goal`` are split until there are ``workers``
+    subproblems at least, then ``workers`` processes search them, each one
+    for at most ``n`` answers. 
+    
+    If ``ordered``, answers are merged replaying the enumeration that
+    :py:func:`muk.core.mplus` does on the disjunctions that were split, hence
+    the result is the same as the sequential search, even with respect to
+    ``n``; the parent waits for the next answer of a subproblem only when
+    the sequential search would do. Otherwise, answers are collected as soon
+    as workers find them, so the first ``n`` found are returned in any order.
+
+    Each worker searches one subproblem at a time, to its end or to its
+    ``n``-th answer; so, a subproblem that diverges without answers takes its
+    worker forever, even if the sequential search would never reach it.
+    Subproblems are searched by :py:func:`muk.vm.execute` if ``compiled``.
+
+    If ``distinct``, each worker skips the answers it already found and the
+    parent skips the ones other workers did, so ``n`` counts distinct answers
+    and, when ``ordered``, the result is still the sequential one.
+    '''
+
+    tree, leaves = split(goal, emptystate(substitution), wanted=workers)
+    logic_vars = getattr(goal, 'logic_vars', None)
+    m_var = var_selector(*logic_vars) if logic_vars else Tautology()
+
+    search = execute if compiled else lambda goal, s: goal(s)
+
+    def collected(answers):
+        answers = _distinct(answers, post) if distinct else map(post, answers)
+        return list(islice(answers, n or None))
+
+    if len(leaves) == 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return collected(_merged(tree, lambda leaf: _answers(search(leaf.goal, leaf.state), m_var, distinct)))
+
+    global _job
+    context = multiprocessing.get_context('fork')
+    queue = context.SimpleQueue() # it pickles in the putting process, so errors are reported
+    buffers, done = [deque() for _ in leaves], [False for _ in leaves]
+
+    def receive():
+        i, kind, a = queue.get()
+        if kind == 'answer': buffers[i].append(a)
+        elif kind == 'done': done[i] = True
+        else: raise a
+
+    def received(leaf):
+        i = leaf.index
+        while True:
+            while not buffers[i] and not done[i]: receive()
+            if not buffers[i]: return
+            yield buffers[i].popleft()
+
+    _job = leaves, m_var, n, post, queue, context.Value('i', 0), search, distinct
+    processes = [context.Process(target=_worker, daemon=True) for _ in range(min(workers, len(leaves)))]
+    try:
+        for p in processes: p.start()
+        if ordered: 
+            merged = _merged(tree, received)
+            return collected(merged) if distinct else list(islice(merged, n or None))
+        results, seen = [], set()
+        while not all(done) and not (n and len(results) >= n):
+            receive()
+            for b in buffers: 
+                results.extend([post(r) for key, r in b if key not in seen and not seen.add(key)] if distinct else b)
+                b.clear()
+        return results[:n] if n else results
+    finally:
+        for p in processes: 
+            if p.is_alive(): p.terminate() # workers still searching answers nobody needs
+        for p in processes: 
+            if p.pid is not None: p.join()
+        _job = None
+
+def _map_worker():
+    f, items, queue, taken = _job
+    while True:
+        with taken.get_lock(): # items are taken in order, each by the first idle worker
+            i = taken.value
+            taken.value += 1
+        if i >= len(items): return
+        try: r = f(items[i])
+        except BaseException as e:
+            try: queue.put((i, 'error', e))
+            except Exception: queue.put((i, 'error', RuntimeError(repr(e)))) # unpicklable one
+        else: queue.put((i, 'done', r))
+
+def parallel_map(f, items, workers):
+    '''
+    The list of ``f(item)`` for each of ``items``, computed by ``workers``
+    forked processes, each one taking the next item when idle; so, what a
+    process computes lazily for the first item it takes, as the states of
+    the prefix shared by the queries of :py:func:`muk.core.run_many`, serves
+    the other items it takes. Results must be picklable objs. On platforms
+    without ``fork`` items are mapped sequentially.
+    '''
+
+    items = list(items)
+    if len(items) < 2 or workers < 2 or 'fork' not in multiprocessing.get_all_start_methods(): 
+        return [f(item) for item in items]
+
+    global _job
+    context = multiprocessing.get_context('fork')
+    queue, results, pending = context.SimpleQueue(), [None for _ in items], len(items)
+    _job = f, items, queue, context.Value('i', 0)
+    processes = [context.Process(target=_map_worker, daemon=True) for _ in range(min(workers, len(items)))]
+    try:
+        for p in processes: p.start()
+        while pending:
+            i, kind, r = queue.get()
+            if kind == 'error': raise r
+            results[i], pending = r, pending - 1
+        return results
+    finally:
+        for p in processes: 
+            if p.is_alive(): p.terminate() # after an error, workers still mapping
+        for p in processes: 
+            if p.pid is not None: p.join()
+        _job = None
+
+def _merged(tree, stream):
+    # enumerates answers of leaves as `mplus` enumerates states of the split disjunctions
+    if type(tree) is _leaf: return stream(tree)
+    return mplus(iter([_merged(c, stream) for c in tree.children]), tree.interleaving)
+
+class process_pool:
+    '''
+    At most ``workers`` processes that search queries of
+    :py:func:`muk.core.async_run` at once, shared by the queries given it as
+    ``pool``; queries beyond them wait for one to finish. A process is
+    forked for each query, so that it inherits the goal, and it sends back
+    the answers; on platforms without ``fork`` queries are searched by
+    threads of the event loop instead, as ``run_in_executor`` does.
+    '''
+
+    def __init__(self, workers):
+        self.workers, self._slots = workers, None
+
+    async def apply(self, f):
+        '''The result of ``f()``, computed by a forked process, while the event loop goes on.'''
+
+        loop = asyncio.get_event_loop() # the running one, since Python 3.6 has no `get_running_loop`
+        if self._slots is None: self._slots = asyncio.Semaphore(self.workers) # on the loop that uses it
+        async with self._slots:
+            if 'fork' not in multiprocessing.get_all_start_methods(): return await loop.run_in_executor(None, f)
+            context = multiprocessing.get_context('fork')
+            receiver, sender = context.Pipe(duplex=False)
+            p = context.Process(target=_apply_worker, args=(f, sender), daemon=True)
+            try:
+                p.start()
+                sender.close() # so that `recv` raises `EOFError` if the process dies
+                kind, r = await loop.run_in_executor(None, receiver.recv) # a thread waits, holding no lock
+                receiver.close()
+            finally:
+                if p.is_alive(): p.terminate() # the query was cancelled
+                if p.pid is not None: p.join()
+            if kind == 'error': raise r
+            return r
+
+def _apply_worker(f, sender):
+    try: r = f()
+    except BaseException as e:
+        try: sender.send(('error', e))
+        except Exception: sender.send(('error', RuntimeError(repr(e)))) # unpicklable one
+    else: sender.send(('done', r))
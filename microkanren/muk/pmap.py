@@ -0,0 +1,175 @@
+'''
+Persistent maps for substitutions.
+
+A ``pmap`` is an immutable *hash array mapped trie* (HAMT): extending it with
+:py:meth:`pmap.assoc` copies only the nodes lying on the path from the root to
+the new entry, all other nodes are *shared* with the original map. Therefore,
+a derivation that binds :math:`N` logic variables costs :math:`O(N \\log N)`
+time and memory instead of :math:`O(N^{2})`, as it happens using ``dict.copy``
+per binding.
+
+    >>> m = pmap().assoc('a', 1).assoc('b', 2)
+    >>> m['a'], len(m), 'c' in m
+    (1, 2, False)
+    >>> m == {'a': 1, 'b': 2}
+    True
+
+'''
+
+from collections.abc import Mapping
+
+_BITS = 5
+_WIDTH = 1 << _BITS
+_MASK = _WIDTH - 1
+_DEPTH = 64 # number of hash bits consumed before falling back to collision nodes
+_HASH_MASK = (1 << _DEPTH) - 1
+
+try:
+    _popcount = int.bit_count
+except AttributeError: # Python < 3.10
+    def _popcount(i): return bin(i).count('1')
+
+class _node:
+    '''
+    A bitmap indexed node: ``array`` stores ``key, value`` pairs contiguously,
+    where ``key is _node`` marks ``value`` as a child node.
+    '''
+
+    __slots__ = ('bitmap', 'array')
+
+    def __init__(self, bitmap, array):
+        self.bitmap = bitmap
+        self.array = array
+
+class _collisions:
+    '''A leaf collecting ``key, value`` pairs whose hashes are equal.'''
+
+    __slots__ = ('array',)
+
+    def __init__(self, array):
+        self.array = array
+
+_empty_node = _node(0, ())
+
+def _pair_node(k1, v1, h1, k2, v2, h2, shift):
+    if shift >= _DEPTH: return _collisions((k1, v1, k2, v2))
+    b1, b2 = (h1 >> shift) & _MASK, (h2 >> shift) & _MASK
+    if b1 == b2: return _node(1 << b1, (_node, _pair_node(k1, v1, h1, k2, v2, h2, shift + _BITS)))
+    array = (k1, v1, k2, v2) if b1 < b2 else (k2, v2, k1, v1)
+    return _node((1 << b1) | (1 << b2), array)
+
+def _assoc(node, key, value, h, shift):
+    '''
+    Returns a pair ``(node, added)`` where ``node`` is a copy of the given node
+    extended with ``key ↦ value`` and ``added`` tells if ``key`` is a new one.
+    '''
+
+    if type(node) is _collisions:
+        array = node.array
+        for i in range(0, len(array), 2):
+            if array[i] == key: return _collisions(array[:i+1] + (value,) + array[i+2:]), False
+        return _collisions(array + (key, value)), True
+
+    bit = 1 << ((h >> shift) & _MASK)
+    i = 2 * _popcount(node.bitmap & (bit - 1))
+    array = node.array
+
+    if not node.bitmap & bit:
+        return _node(node.bitmap | bit, array[:i] + (key, value) + array[i:]), True
+
+    k, v = array[i], array[i+1]
+    if k is _node:
+        child, added = _assoc(v, key, value, h, shift + _BITS)
+        return _node(node.bitmap, array[:i+1] + (child,) + array[i+2:]), added
+    if k == key:
+        return _node(node.bitmap, array[:i+1] + (value,) + array[i+2:]), False
+    child = _pair_node(k, v, hash(k) & _HASH_MASK, key, value, h, shift + _BITS)
+    return _node(node.bitmap, array[:i] + (_node, child) + array[i+2:]), True
+
+def _items(node):
+    stack = [node]
+    while stack:
+        array = stack.pop().array
+        for i in range(0, len(array), 2):
+            k = array[i]
+            if k is _node: stack.append(array[i+1])
+            else: yield k, array[i+1]
+
+class pmap(Mapping):
+    '''
+    An immutable mapping sharing structure among its extensions; the empty
+    map is built by calling ``pmap()``, optionally with a mapping or an
+    iterable of pairs to start with.
+    '''
+
+    __slots__ = ('_root', '_count', '_memo')
+
+    def __init__(self, items=()):
+        self._root, self._count, self._memo = _empty_node, 0, None
+        if items:
+            pairs = items.items() if isinstance(items, Mapping) else items
+            for k, v in pairs:
+                self._root, added = _assoc(self._root, k, v, hash(k) & _HASH_MASK, 0)
+                self._count += added
+
+    def assoc(self, key, value):
+        '''Returns a new ``pmap`` that associates ``key`` to ``value``.'''
+        root, added = _assoc(self._root, key, value, hash(key) & _HASH_MASK, 0)
+        m = pmap.__new__(pmap)
+        m._root, m._count, m._memo = root, self._count + added, None
+        return m
+
+    @property
+    def memo(self):
+        '''
+        A ``dict`` for caching facts that hold as long as this very map does,
+        for example the ends of walked chains of associations.
+        '''
+        if self._memo is None: self._memo = {}
+        return self._memo
+
+    def get(self, key, default=None):
+        try: return self[key]
+        except KeyError: return default
+
+    def __getitem__(self, key):
+        h, node, shift = hash(key) & _HASH_MASK, self._root, 0
+        while type(node) is _node:
+            bit = 1 << ((h >> shift) & _MASK)
+            bitmap = node.bitmap
+            if not bitmap & bit: raise KeyError(key)
+            i = 2 * _popcount(bitmap & (bit - 1))
+            array = node.array
+            k = array[i]
+            if k is _node: node, shift = array[i+1], shift + _BITS
+            elif k is key or k == key: return array[i+1]
+            else: raise KeyError(key)
+
+        array = node.array # `node` is a `_collisions` leaf
+        for i in range(0, len(array), 2):
+            if array[i] == key: return array[i+1]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        try: self[key]
+        except KeyError: return False
+        else: return True
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return (k for k, v in _items(self._root))
+
+    def items(self):
+        return list(_items(self._root))
+
+    def copy(self):
+        return self # immutable, hence safe to share
+
+    def __reduce__(self):
+        return (pmap, (self.items(),))
+
+    def __repr__(self):
+        return 'pmap({})'.format(dict(_items(self._root)))
+
@@ -0,0 +1,136 @@
+'''
+Opt-in instrumentation of the goal ctors of :py:mod:`muk.core`, to see where
+a search spends its time.
+
+Inside a ``with profiling() as p:`` block, the goals that ``unify``, ``fresh``,
+conjunctions, disjunctions, ``if`` ctors and the clauses of ``cond`` build are
+wrapped, so that each application of them counts in ``p``, keyed by the
+*relation* that built the goal, namely the innermost function outside the
+``muk`` package whose body was running, as ``appendo`` or ``multiplyo``.
+Outside of such blocks, ctors build their goals as usual, paying a single
+check for an active profile.
+
+    >>> from muk.ext import *
+    >>> def nat(x):
+    ...     return conde([unify(x, 0)], [fresh(lambda d: conj(unify(x, [d]), nat(d)))])
+    >>> with profiling() as p:
+    ...     answers = run(fresh(lambda q: conj(nat(q), unify(q, [[0]]))), n=1)
+    >>> p.calls['nat', 'unify'], p.failures['<toplevel>', 'unify'], p.fresh_vars['nat']
+    (5, 2, 2)
+    >>> [line.split()[0] for line in p.collapsed()]
+    ['<toplevel>', '<toplevel>;nat']
+
+Goals applied while the search runs are profiled, hence ``run`` should be
+called inside the block; goals wrapped by the profiler hide their structure,
+so a ``compiled`` run searches them by closures.
+'''
+
+import os, sys
+from collections import Counter
+from contextlib import contextmanager
+from time import perf_counter
+
+active = None # the profile that ctors report to, if any
+
+class profile:
+    '''
+    Counters and timings of the goals built while profiling:
+
+    ``calls`` and ``failures``
+        map pairs of a relation and a kind of goal, as ``'unify'`` or
+        ``'clause 2'``, to the number of states the goals of that kind were
+        applied to and to the number of times they yielded no state at all;
+    ``fresh_vars``
+        maps relations to the number of logic vars they introduced;
+    ``timings``
+        maps *collapsed stacks* of relations, as ``'appendo;nullo'``, to
+        the seconds spent by goals of the last relation when the search went
+        through the previous ones; a relation that recurs in itself appears once.
+    '''
+
+    def __init__(self):
+        self.calls, self.failures, self.fresh_vars, self.timings = Counter(), Counter(), Counter(), Counter()
+        self._stack = [] # of `[relation, start, seconds spent by nested relations]` lists
+
+    def instrument(self, goal, kind, fresh_vars=0):
+        '''A goal that searches as ``goal`` does, recording it as a ``kind`` goal.'''
+
+        relation = _relation(sys._getframe(1))
+        key, stack = (relation, kind), self._stack
+
+        def P(s):
+            self.calls[key] += 1
+            if fresh_vars: self.fresh_vars[relation] += fresh_vars
+            α, found = goal(s), False
+            while True:
+                nested = not stack or stack[-1][0] != relation
+                if nested: stack.append([relation, perf_counter(), 0.0])
+                try: r = next(α, None)
+                finally:
+                    if nested: self._leave()
+                if r is None: break
+                found = True
+                yield r
+            if not found: self.failures[key] += 1
+
+        return P
+
+    def _leave(self):
+        relation, start, nested = self._stack.pop()
+        elapsed = perf_counter() - start
+        self.timings[';'.join([f[0] for f in self._stack] + [relation])] += elapsed - nested
+        if self._stack: self._stack[-1][2] += elapsed
+
+    def collapsed(self):
+        '''
+        Lines of a collapsed stack and the microseconds spent in it, the
+        format that ``flamegraph.pl`` and *speedscope* read.
+        '''
+        return ['{} {}'.format(stack, round(seconds * 1e6)) for stack, seconds in sorted(self.timings.items())]
+
+    def dump(self, path):
+        '''Writes the :py:meth:`collapsed` stacks to the file at ``path``.'''
+        with open(path, 'w') as f:
+            for line in self.collapsed(): print(line, file=f)
+
+    def __repr__(self):
+        return 'profile({} calls, {} failures, {} fresh vars, {:.6f}s)'.format(
+            sum(self.calls.values()), sum(self.failures.values()),
+            sum(self.fresh_vars.values()), sum(self.timings.values()))
+
+@contextmanager
+def profiling(p=None):
+    '''
+    Makes ``p``, or a new :py:class:`profile`, the active one while the block
+    runs, restoring the previous one afterwards.
+    '''
+
+    global active
+    previous, active = active, profile() if p is None else p
+    try: yield active
+    finally: active = previous
+
+_relations = {} # from code objs to the names of their relations, empty for the ones of `muk`
+_package = os.path.dirname(__file__)
+
+def _relation(frame):
+    '''
+    The name of the innermost function outside the ``muk`` package that is
+    running from ``frame`` outwards, where a lambda counts as the function
+    that defines it, so that goals built in the ``fresh`` bodies of a relation
+    belong to it; ``'<toplevel>'`` when no function but a module is running.
+    '''
+
+    while frame is not None:
+        code = frame.f_code
+        name = _relations.get(code)
+        if name is None:
+            qualname = getattr(code, 'co_qualname', code.co_name) # since Python 3.11
+            parts = [p for p in qualname.split('.') if not p.startswith('<')]
+            if os.path.dirname(code.co_filename) == _package: name = ''
+            elif code.co_name == '<module>' or not parts: name = '<toplevel>' # a lambda of a module too
+            else: name = parts[-1]
+            _relations[code] = name
+        if name: return name
+        frame = frame.f_back
+    return '<toplevel>'
@@ -1,29 +1,19 @@
 
 from collections import namedtuple
 from contextlib import contextmanager
-from functools import wraps
+from functools import wraps, lru_cache
+from itertools import islice
 from inspect import signature
 
 from muk.utils import identity
 
 class cons(namedtuple('_cons', ['car', 'cdr'])):
 
+    ground = None # whether it contains no logic var, once known
+
     def walk_star(self, W):
         return cons(W(self.car), W(self.cdr))
 
-    def unification(self, other, sub, ext_s, U, E):
-        try: UC = other._unification_cons
-        except AttributeError: raise E
-        else: return UC(self, sub, ext_s, U)
-
-    def _unification_cons(self, other_cons, sub, ext_s, U):
-
-        if other_cons.cdr == (): return U(other_cons.car, self, sub, ext_s)
-        if self.cdr == (): return U(self.car, other_cons, sub, ext_s)
-
-        cars_sub = U(other_cons.car, self.car, sub, ext_s)
-        return U(other_cons.cdr, self.cdr, cars_sub, ext_s)
-
     def reify_s(self, sub, R):
         return R(self.cdr, R(self.car, sub))
 
@@ -35,46 +25,160 @@ class cons(namedtuple('_cons', ['car', 'cdr'])):
         if isinstance(other, list):
             return list_to_cons(other, post=lambda l: self if l == [] else l)
 
-        raise NotImplemented
+        return NotImplemented
 
 class ImproperListError(ValueError):
     pass
 
-def list_to_cons(l, post=identity):
-
-    if isinstance(l, (str, cons)): return l # we consider a `str` obj not an iterable obj but as an atom
-
-    λ = type(l) 
-    try:
-        car, cadr, *cddr = l
-    except:
-        try:
-            car, *cdr = l
-        except: 
-            return l
-        else:
-            cdr = λ(cdr) # again, restore correct type of the tail
-            if cdr == (): raise ImproperListError # otherwise outer try couldn't fail
-            cdr = post(cdr)
-            return cons(car=list_to_cons(car), cdr=list_to_cons(cdr))
-    else:
-        cddr = λ(cddr) # restore correct type of tail collecting obj
-        if cddr == (): return cons(car=list_to_cons(car), cdr=list_to_cons(cadr))
-        cdr = λ([cadr]) + cddr # reconstruct `cdr` by adapt `[cadr]` to safely apply +
-        return cons(car=list_to_cons(car), cdr=list_to_cons(cdr))
-
+class seq:
+    '''
+    A compact list term: the chain of ``cons`` cells whose cars are ``items``
+    and whose very last cdr is ``tail``, which is ``[]`` for proper lists.
+    Items live contiguously in a ``tuple`` that every suffix of the chain
+    shares, hence taking the ``cdr`` costs *O(1)* time and memory, while a
+    list of length *N* takes one obj instead of *N* nested ones.
+
+        >>> s = seq([1, 2, 3])
+        >>> s.car, s.cdr, s.cdr.cdr.cdr
+        (1, seq([2, 3]), [])
+        >>> s == cons(1, cons(2, cons(3, [])))
+        True
+
+    '''
+
+    __slots__ = ('items', 'start', 'tail')
+
+    def __init__(self, items, tail=[], start=0):
+        items = items if type(items) is tuple else tuple(items)
+        if start >= len(items): raise ValueError('A `seq` obj needs at least one item, use its tail instead')
+        self.items, self.tail, self.start = items, tail, start
+
+    @property
+    def car(self):
+        return self.items[self.start]
+
+    @property
+    def cdr(self):
+        start = self.start + 1
+        return seq(self.items, self.tail, start) if start < len(self.items) else self.tail
+
+    def __len__(self):
+        '''The number of items, that is the length of the chain of cells.'''
+        return len(self.items) - self.start
+
+    def __iter__(self):
+        return islice(self.items, self.start, None)
+
+    def __eq__(self, other):
+        a, b = self, other
+        while True:
+            if a is b: return True
+            if type(a) is seq and type(b) is seq:
+                n = min(len(a), len(b))
+                if a.items[a.start:a.start+n] != b.items[b.start:b.start+n]: return False
+                a = seq(a.items, a.tail, a.start+n) if len(a) > n else a.tail
+                b = seq(b.items, b.tail, b.start+n) if len(b) > n else b.tail
+            elif isinstance(a, (seq, cons)) and isinstance(b, (seq, cons)):
+                if a.car != b.car: return False
+                a, b = a.cdr, b.cdr
+            elif isinstance(a, seq) or isinstance(b, seq): return False
+            else: return a == b
+
+    __hash__ = None # as `cons` cells ending with `[]` are
 
-def cons_to_list(c, for_cdr=False):
+    def __radd__(self, other):
 
-    try:
-        car, cdr = c
-    except:
-        if c == (): raise ImproperListError
-        return (([], list) if c == [] else ((c,), tuple)) if for_cdr else c
+        if isinstance(other, list):
+            return list_to_seq(other, post=lambda l: self if l == [] else l)
+
+        return NotImplemented
+
+    def __repr__(self):
+        items = list(self)
+        return 'seq({})'.format(items) if self.tail == [] else 'seq({}, tail={})'.format(items, self.tail)
+
+def _atomic(l):
+    # we consider a `str` obj not an iterable obj but as an atom
+    return isinstance(l, (str, cons, seq)) or not isinstance(l, (list, tuple)) or not l
+
+def _items_and_tail(l, post, ctor):
+    '''
+    Splits a non-empty ``list`` or ``tuple`` obj into the items of the chain of
+    cells it denotes and its last cdr, both converted by ``ctor``: a ``list``
+    is a proper list, so its tail is ``post([])``, while a ``tuple`` is an
+    improper one, so its tail is its very last item.
+    '''
+    if isinstance(l, tuple):
+        if len(l) == 1: raise ImproperListError
+        items, tail = l[:-1], ctor(l[-1])
+    else:
+        items, tail = l, ctor(post(type(l)())) # restore correct type of the tail
+    return [ctor(a) for a in items], tail
 
-    d, λ = cons_to_list(cdr, for_cdr=True)
-    r = λ([cons_to_list(car, for_cdr=False)]) + d
-    return (r, λ) if for_cdr else r
+def list_to_cons(l, post=identity):
+    '''
+    Converts ``list`` and ``tuple`` objs, recursively, to chains of ``cons``
+    cells, the former proper and the latter improper; ``post`` maps the empty
+    tail of a proper list, for example to append another list to ``l``.
+    It takes time linear in the size of ``l``.
+    '''
+
+    if _atomic(l): return l
+    if post is identity and type(l) is list and len(l) <= _literal_length:
+        for a in l:
+            if type(a) is not int and type(a) is not str: break
+        else: return _literal(tuple(l))
+
+    items, c = _items_and_tail(l, post, list_to_cons)
+    for a in reversed(items): c = cons(a, c)
+    return c
+
+_literal_length = 8 # of the lists of atoms that are converted once, as literals in relations are
+
+@lru_cache(maxsize=4096)
+def _literal(items):
+    # the chain of cells of a short list of `int` and `str` objs, shared by
+    # every conversion of an equal list, since cells are immutable; so
+    # relations that mention literals as `[2]` build them once, and cells
+    # remember they are ground once for all
+    c = []
+    for a in reversed(items): c = cons(a, c)
+    return c
+
+def list_to_seq(l, post=identity):
+    '''
+    As :py:func:`list_to_cons` does but building compact :py:class:`seq` terms.
+    '''
+
+    if _atomic(l): return l
+
+    items, tail = _items_and_tail(l, post, list_to_seq)
+    return seq(items, tail) if items else tail
+
+def cons_to_list(c):
+    '''
+    Converts chains of ``cons`` cells and :py:class:`seq` terms to ``list``
+    objs, or to ``tuple`` objs if they are improper lists, recursively in their
+    cars and iteratively along their cdrs, hence in linear time.
+    '''
+
+    if c == (): raise ImproperListError
+    if not isinstance(c, (cons, seq)): return c
+
+    items = []
+    while True:
+        if type(c) is seq:
+            items.extend(map(cons_to_list, c))
+            c = c.tail
+        elif isinstance(c, cons):
+            items.append(cons_to_list(c.car))
+            c = c.cdr
+        else: break
+
+    if c == (): raise ImproperListError
+    if c == []: return items
+    items.append(c)
+    return tuple(items)
 
     
 def adapt_iterables_to_conses(selector, ctor=list_to_cons):
@@ -85,10 +189,11 @@ def adapt_iterables_to_conses(selector, ctor=list_to_cons):
         if isinstance(selection, set): 
             selection = {s:ctor for s in selection}
 
+        converters = [selection.get(name, identity) for name in formal_args] # once, not at each call
+
         @wraps(f)
         def D(*args, bypass_cons_adapter=False, **kwds):
-            new_args = args if bypass_cons_adapter else [c(a) for f, a in zip(formal_args, args) 
-                                                              for c in [selection.get(f, identity)]]
+            new_args = args if bypass_cons_adapter else [c(a) for c, a in zip(converters, args)]
             return f(*new_args, **kwds)
         return D
     return decorator
@@ -103,14 +208,21 @@ class num(cons):
 
     @classmethod
     def build(cls, obj):
-        if isinstance(obj, int): obj = int_to_list(obj)
+        if isinstance(obj, int): return _num_of_int(obj) if obj else []
         c = list_to_cons(obj)
         return num(c.car, c.cdr) if isinstance(c, cons) else c
 
     def __int__(self):
-        def I(c, e):
-            return 0 if c == [] else c.car * 2**e + I(c.cdr, e+1)
-        return I(self, e=0)
+        i, e, c = 0, 0, self
+        while c != []:
+            i, e, c = i + c.car * 2**e, e + 1, c.cdr
+        return i
+
+@lru_cache(maxsize=4096)
+def _num_of_int(i):
+    # shared as `_literal` lists are, since arithmetic relations build their constants at every call
+    c = list_to_cons(int_to_list(i))
+    return num(c.car, c.cdr)
 
 
 
@@ -17,15 +17,9 @@ def iterwrap(obj, classes=(tuple,)):
     return obj if isinstance(obj, classes) else [obj]
 
 def foldr(λ, lst, initialize):
-
-    def F(lst):
-        if lst:
-            car, *cdr = lst
-            return λ(car, F(cdr))
-        else:
-            return initialize
-
-    return F(lst)
+    r = initialize
+    for a in reversed(tuple(lst)): r = λ(a, r) # from the right, without recursion
+    return r
 
 def empty_iterable(α):
     α0, α = tee(α)
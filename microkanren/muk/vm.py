@@ -0,0 +1,415 @@
+'''
+A machine that searches goals depth-first by running flat code.
+
+Goals built by the ctors of :py:mod:`muk.core` expose their structure: a
+unification its ``terms``, a conjunction its ``goals``, a disjunction its
+``branches`` and a goal built by :py:func:`muk.core.fresh` its ``unfold``.
+Therefore, :py:func:`compile_goal` translates a goal into a sequence of
+instructions, in the spirit of the *WAM*:
+
+``UNIFY u v ext_s``
+    extends the substitution or backtracks;
+``TRY codes``
+    pushes a choicepoint for the alternatives ``codes[1:]``, then runs ``codes[0]``;
+``FRESH unfold``
+    introduces logic vars and calls the code of the goal ``unfold`` returns;
+``CALL goal``
+    pushes a choicepoint over the states stream of ``goal``, which the
+    closures of :py:mod:`muk.core` search;
+``SCHEDULE goal kind``
+    as ``CALL``, for an interleaving conjunction or disjunction, whose
+    streams the machine schedules itself in checkpointed searches;
+``FAIL``
+    backtracks;
+``DEPTH d``
+    sets the ``depth`` of the state back to ``d`` after the body of a
+    ``FRESH``, which bounded searches count,
+
+while reaching the end of a code *proceeds* with the code of the caller or,
+if none, with an answer. Then :py:func:`execute` runs code in a single loop,
+keeping continuations and choicepoints on explicit stacks, so a search takes
+no Python frame per level of nesting or recursion of its goals.
+
+Interleaving conjunctions and disjunctions, which ``condi`` and ``disj`` build
+by default, are ``CALL`` ed, as any other goal that does not expose its
+structure, unless the search is checkpointed: then :py:class:`_schedule`
+enumerates their streams as the scheduler of the search does, each stream a
+machine of its own, so that their paths are saved too. Either way, answers
+come in the very same order of the closures. Divergent searches loop
+forever, instead of raising ``RecursionError``.
+'''
+
+from collections import deque
+
+from muk.core import *
+from muk.core import _unification, _constrained
+from muk import core as _core # whose `_tick` and `_scheduler` are the ones of the current search
+
+_UNIFY, _TRY, _FRESH, _CALL, _FAIL, _DEPTH, _SCHEDULE = range(7)
+
+_DISJ, _CONJ, _LEVELS = range(3) # kinds of scheduled goals, see `_schedule`
+
+_proceed = () # the empty code
+
+def compile_goal(goal):
+    '''
+    The code of ``goal``, a ``tuple`` of instructions that is remembered in
+    attr ``code`` of the goal itself, so that each goal is compiled once.
+    '''
+
+    code = getattr(goal, 'code', None)
+    if code is None:
+        code = tuple(_instructions(goal))
+        try: goal.code = code
+        except AttributeError: pass # a callable that takes no attrs
+    return code
+
+def _instructions(goal):
+
+    todo = [goal]
+    while todo:
+        g = todo.pop()
+        if g is succeed: continue
+        if g is fail:
+            yield (_FAIL,)
+            continue
+        terms = getattr(g, 'terms', None)
+        if terms is not None:
+            yield (_UNIFY, terms[0], terms[1], g.ext_s)
+            continue
+        goals = getattr(g, 'goals', None)
+        if goals is not None and not g.interleaving:
+            todo.extend(reversed(goals))
+            continue
+        branches = getattr(g, 'branches', None)
+        if branches is not None and not g.interleaving:
+            yield (_TRY, tuple(compile_goal(b) for b in branches))
+            continue
+        if goals is not None or branches is not None: # interleaving ones
+            yield (_SCHEDULE, g, _DISJ if goals is None else _LEVELS if getattr(g, 'flat', False) else _CONJ)
+            continue
+        unfold = getattr(g, 'unfold', None)
+        if unfold is not None: yield (_FRESH, unfold)
+        else: yield (_CALL, g)
+
+def _mismatch():
+    # a replayed path that takes alternatives the goal does not have, as goals whose states change across runs do
+    return ValueError('The checkpoint does not match the goal, whose search took other alternatives')
+
+class _counted:
+
+    __slots__ = ('alternatives', 'taken')
+
+    def __init__(self, alternatives, taken):
+        self.alternatives, self.taken = alternatives, taken # the number of alternatives started
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        alternative = next(self.alternatives)
+        self.taken += 1
+        return alternative
+
+def _path(choices, replay, paths):
+    # the paths of a machine, whose choicepoints are `choices` and whose `replay`
+    # is left to take, reversed, and of the streams of its scheduled goals, which
+    # follow and are indexed by the entries of the `_schedule`s, so that paths
+    # nest no deeper as the search does; `replay` comes from the ones in `paths`
+    saved, todo = [], [(choices, replay[::-1])]
+    for choices, left in todo: # which grows meanwhile
+        path = [a.taken if type(a) is _counted else a.saved(todo) for _, a, _ in choices]
+        path.extend(_moved(e, paths, todo) for e in left)
+        saved.append(path)
+    return saved
+
+def _moved(entry, paths, todo):
+    # an `entry` left from the ones in `paths`, whose streams index `todo` then
+    if type(entry) is not dict: return entry
+    def moved(t):
+        if t[2] is None: return t
+        todo.append(((), paths[t[2]]))
+        return t[:2] + (len(todo) - 1,) + t[3:]
+    return dict(entry, round=[moved(t) for t in entry['round']], kept=[moved(t) for t in entry['kept']],
+                outer=None if entry['outer'] is None else moved(entry['outer']))
+
+def _policy(scheduler):
+    # how `scheduler` admits a stream among the `live` ones and how many states
+    # the `k`-th one takes per turn, if it is one the machine knows
+    if scheduler is dovetail: return (lambda α, live: [α] + live), (lambda k: 1)
+    if scheduler is round_robin: return (lambda α, live: live + [α]), (lambda k: 1)
+    weight = getattr(scheduler, 'weight', None)
+    if weight is not None: return (lambda α, live: [α] + live), weight
+    return None
+
+_NEW, _RUNNING, _SUSPENDED, _DONE = range(4) # statuses of a `_stream`
+
+class _stream:
+
+    __slots__ = ('index', 'origin', 'weight', 'run', 'choices', 'replay', 'skip', 'status')
+
+    def __init__(self, index, origin, weight, skip):
+        # the states of the `index`-th goal of a scheduled one on state
+        # `origin`, or on the state of that goal if `None`; an empty stream if
+        # `index` is `None`; `skip` tells whether the first state is one that
+        # was taken before the checkpoint, again
+        self.index, self.origin, self.weight, self.skip, self.status = index, origin, weight, skip, _NEW
+
+    def saved(self, todo):
+        # its path is the one of `todo` it indexes, which `_path` saves later
+        if self.status == _DONE or self.index is None: return None, None, None, False, self.weight
+        todo.append((self.choices, self.replay[::-1]))
+        return self.index, self.origin, len(todo) - 1, self.skip or self.status == _SUSPENDED, self.weight
+
+class _schedule:
+    """
+    The states of an interleaving goal, which the machine enumerates as
+    :py:func:`muk.core.dovetail`, :py:func:`muk.core.round_robin` or the
+    schedulers that :py:func:`muk.core.weighted` builds do, in the very same
+    order, but keeping each stream as a machine of its own, whose path can
+    be saved; the goal is a disjunction, whose streams are the ones of its
+    branches, a conjunction, whose streams are the ones of its second goal
+    on each state of the first, admitted one per round, or a flat one, whose
+    streams spawn the ones of the next goals, as ``_conj_flat`` explains.
+
+    Its path, that :py:meth:`saved` returns and ``saved`` restores, tells
+    the streams of the current round that are left, the turn of the first
+    one, the streams kept for the next round and the states that the next
+    streams to admit start from; states are pickled with checkpoints, so
+    they take no closures. The state that the machine proceeds with, if
+    any, is saved too, so it comes first again.
+    """
+
+    __slots__ = ('goals', 'kind', 's', 'machine', 'admit', 'weight', 'S', 'i', 'j', 'live', 'admitted', 'admitting',
+                 'outer', 'pending', 'current', 'last', 'running')
+
+    def __init__(self, g, kind, s, machine, policy, saved=None):
+        self.goals = g.branches if kind == _DISJ else g.goals
+        self.kind, self.s, self.machine, (self.admit, self.weight) = kind, s, machine, policy
+        self.current, self.running = None, False
+        if saved is None:
+            self.S, self.i, self.j, self.live, self.admitted, self.admitting = [], 0, 0, [], 0, True
+            self.outer = self._open(0, None, 1, False) if kind == _CONJ else None # whose states start the streams
+            self.pending, self.last = deque(), None # states that streams of the next goals start from, if flat
+            return
+        if type(saved) is not dict: raise _mismatch()
+        self.S, self.i, self.j = [self._restored(t) for t in saved['round']], 0, saved['turn']
+        self.live = [self._restored(t) for t in saved['kept']] + self.S[:1] * bool(self.j) # amid its turn, kept already
+        self.admitted, self.admitting, self.pending = saved['admitted'], saved['admitting'], deque(saved['pending'])
+        self.outer = None if saved['outer'] is None else self._restored(saved['outer'])
+        self.last = saved['last']
+
+    def _open(self, index, origin, weight, skip, path=()):
+        α = _stream(index, origin, weight, skip)
+        if index is None: α.run = iter(())
+        else:
+            if index >= len(self.goals): raise _mismatch()
+            α.choices, α.replay = [], list(reversed(path))
+            α.run = _execute(compile_goal(self.goals[index]), self.s if origin is None else origin,
+                             α.replay, self.machine, α.choices)
+        return α
+
+    def _restored(self, saved):
+        index, origin, k, skip, weight = saved # as `_stream.saved` gives them
+        if k is None: return self._open(index, origin, weight, skip)
+        if type(k) is not int or not 0 < k < len(self.machine.paths): raise _mismatch()
+        return self._open(index, origin, weight, skip, self.machine.paths[k])
+
+    def _poll(self, α):
+        if α.status == _DONE: return None
+        α.status = _RUNNING
+        if α.skip:
+            if next(α.run, None) is None: raise _mismatch()
+            α.skip = False
+        r = next(α.run, None)
+        α.status = _SUSPENDED if r is not None else _DONE
+        return r
+
+    def _admitted(self):
+        # the next stream to admit, if any, as the `streams` of the closures give it
+        k = self.admitted
+        if self.kind == _DISJ:
+            if k == len(self.goals): return None
+            α = self._open(k, None, self.weight(k), False)
+        elif self.kind == _CONJ:
+            r = self._poll(self.outer)
+            if r is None: return None
+            α = self._open(1, r, self.weight(k), False)
+        elif not k: α = self._open(0, None, self.weight(k), False)
+        elif self.pending:
+            i, r = self.pending.popleft()
+            α = self._open(i, r, self.weight(k), False)
+        elif any(β.status != _DONE and β.index is not None for β in self.live): # streams admitted later can spawn others still
+            α = self._open(None, None, self.weight(k), False)
+        else: return None
+        self.admitted += 1
+        return α
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.last is not None: # the one taken before the checkpoint
+            self.current, self.last = self.last, None
+            return self.current
+        self.running, last = True, len(self.goals) - 1
+        try:
+            while True:
+                if self.i < len(self.S):
+                    α = self.S[self.i]
+                    if not self.j and _core._tick is not None: _core._tick() # a turn is a step of the search
+                    r = self._poll(α)
+                    if r is None:
+                        self.i, self.j = self.i + 1, 0
+                        continue
+                    if not self.j: self.live.append(α)
+                    self.j += 1
+                    if self.j == α.weight: self.i, self.j = self.i + 1, 0
+                    if self.kind != _LEVELS or α.index == last: break
+                    self.pending.append((α.index + 1, r)) # a turn, as the `_spawned` of the closures takes
+                else: # the round is over, the next one admits a stream while any is left
+                    α = self._admitted() if self.admitting else None
+                    if α is None: self.admitting = False
+                    if α is not None: self.S, self.live, self.i = self.admit(α, self.live), [], 0
+                    elif self.live: self.S, self.live, self.i = self.live, [], 0
+                    else: raise StopIteration
+        finally: self.running = False
+        self.current = r
+        return r
+
+    def saved(self, todo):
+        """
+        The path of this choicepoint, which the ``saved`` param of the ctor
+        takes; its streams index their own paths, which :py:func:`_path` saves.
+        """
+        return {'round': [α.saved(todo) for α in self.S[self.i:]], 'turn': self.j,
+                'kept': [α.saved(todo) for α in (self.live[:-1] if self.j else self.live)],
+                'admitted': self.admitted, 'admitting': self.admitting, 'pending': list(self.pending),
+                'outer': self.outer.saved(todo) if self.outer is not None and self.admitting else None,
+                'last': None if self.running else self.last if self.last is not None else self.current}
+
+class _machine:
+
+    __slots__ = ('choices', 'replay', 'paths', 'snapshot', 'steps')
+
+    def __init__(self, paths, snapshot):
+        # what the machines of a search share: the choicepoints of the outermost
+        # one, the path it has left to take, reversed, the `paths` to replay and
+        # the alternatives that all of them started since `snapshot` was called last
+        if paths and type(paths[0]) is not list: raise _mismatch()
+        self.choices, self.replay, self.paths = [], list(reversed(paths[0])) if paths else [], paths
+        self.snapshot, self.steps = snapshot, 0
+
+    def step(self):
+        self.steps += 1
+        if self.steps == _snapshot_period:
+            self.steps = 0
+            self.snapshot(_path(self.choices, self.replay, self.paths))
+
+_snapshot_period = 4096 # alternatives between calls of `snapshot`, see `execute`
+
+def execute(goal, s, replay=(), snapshot=None):
+    """
+    An iterator over the states that satisfy ``goal`` starting from state
+    ``s``, in the order of the closures of :py:mod:`muk.core`.
+
+    The continuation ``cont`` is either ``None`` or a triple of a code, the
+    position in it to resume and the continuation of that code; a choicepoint
+    is a triple of a state, an iterator of alternatives and the continuation
+    they share, where the state is ``None`` for alternatives that are states
+    themselves.
+
+    If given, ``snapshot`` is called every so many alternatives with the
+    *paths* of the search: the first one is the number of alternatives that
+    each choicepoint started, from the oldest, or the path of a
+    :py:class:`_schedule` for the ones of interleaving goals, whose streams
+    index their own paths among the next ones. Since the alternatives before
+    the last one started are done, the same search given those paths as
+    ``replay`` goes on from there, taking the very alternatives the paths
+    tell when it pushes its first choicepoints, without searching the ones
+    before. States that a ``CALL`` ed goal yielded before are searched again,
+    though, since they come from closures.
+    """
+
+    if not replay and snapshot is None: return _execute(compile_goal(goal), s, [], None, [])
+    m = _machine(replay, snapshot)
+    return _execute(compile_goal(goal), s, m.replay, m, m.choices)
+
+def _execute(code, s, replay, machine, choices):
+    # the states of `code` on `s`, taking the reversed path `replay`; both
+    # `replay` and `choices` are the caller's, so it can save the path
+    counting = machine is not None
+    step = machine.step if counting and machine.snapshot is not None else None
+    cont = None
+    pc = 0
+
+    while True:
+
+        if pc < len(code):
+            instruction = code[pc]
+            pc += 1
+            op = instruction[0]
+            if op == _UNIFY:
+                _, u, v, ext_s = instruction
+                try: sub = _unification(u, v, s.sub, ext_s)
+                except UnificationError: sub = None
+                if sub is not None:
+                    s = state(sub, s.next_index, None, s.depth) if s.store is None else _constrained(s, sub, s.next_index)
+                    if s is not None: continue
+            elif op == _TRY:
+                codes = instruction[1]
+                if pc < len(code): cont = (code, pc, cont) # otherwise, a tail call
+                k = replay.pop() if replay else 1 # the alternative to start
+                if type(k) is not int or k > len(codes): raise _mismatch()
+                alternatives = iter(codes[k:])
+                choices.append((s, _counted(alternatives, k) if counting else alternatives, cont))
+                code, pc = codes[k - 1], 0
+                continue
+            elif op == _FRESH:
+                depth = s.depth
+                g, s = instruction[1](s)
+                if pc < len(code): cont = (code, pc, cont)
+                if s.depth != depth: cont = (((_DEPTH, depth),), 0, cont) # the body is one deeper, in bounded searches
+                code, pc = compile_goal(g), 0
+                continue
+            elif op == _DEPTH:
+                s = state(s.sub, s.next_index, s.store, instruction[1])
+                continue
+            elif op == _CALL or op == _SCHEDULE:
+                if pc < len(code): cont = (code, pc, cont)
+                policy = _policy(_core._scheduler) if counting and op == _SCHEDULE else None
+                if policy is not None:
+                    alternatives = _schedule(instruction[1], instruction[2], s, machine, policy, replay.pop() if replay else None)
+                else:
+                    alternatives = instruction[1](s)
+                    if counting:
+                        k = replay.pop() if replay else 1
+                        if type(k) is not int: raise _mismatch()
+                        for _ in range(k - 1): # the states started before, searched again
+                            if next(alternatives, None) is None: raise _mismatch()
+                        alternatives = _counted(alternatives, k - 1)
+                choices.append((None, alternatives, cont))
+        elif cont is not None:
+            code, pc, cont = cont
+            continue
+        else:
+            yield s
+
+        # backtrack to the most recent choicepoint that has alternatives left
+        while choices:
+            r, alternatives, cont = choices[-1]
+            alternative = next(alternatives, None)
+            if alternative is None:
+                choices.pop()
+            elif r is None: # a state of a `CALL` ed goal, which proceeds
+                s, code, pc = alternative, _proceed, 0
+                break
+            else:
+                s, code, pc = r, alternative, 0
+                break
+        else:
+            return
+
+        if _core._tick is not None: _core._tick() # an alternative is a step of the search
+
+        if step is not None: step()
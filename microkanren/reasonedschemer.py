@@ -1,4 +1,6 @@
 
+from functools import wraps
+
 from muk.sexp import *
 from muk.core import *
 from muk.ext import *
@@ -180,17 +182,15 @@ def succeed_at_least(g, times=1):
     return conde(*[[succeed, succeed] for _ in range(times)],
                  else_clause=[g])
 
-def bit_xoro(α, β, γ):
-    return conde([unify(0, α), unify(0, β), unify(0, γ)],
-                 [unify(1, α), unify(0, β), unify(1, γ)],
-                 [unify(0, α), unify(1, β), unify(1, γ)],
-                 [unify(1, α), unify(1, β), unify(0, γ)],)
+bit_xoro = facts((0, 0, 0), 
+                 (1, 0, 1), 
+                 (0, 1, 1), 
+                 (1, 1, 0))
 
-def bit_ando(α, β, γ):
-    return conde([unify(0, α), unify(0, β), unify(0, γ)],
-                 [unify(1, α), unify(0, β), unify(0, γ)],
-                 [unify(0, α), unify(1, β), unify(0, γ)],
-                 [unify(1, α), unify(1, β), unify(1, γ)],)
+bit_ando = facts((0, 0, 0), 
+                 (1, 0, 0), 
+                 (0, 1, 0), 
+                 (1, 1, 1))
 
 def half_addero(α, β, γ, δ):
     return conj(bit_xoro(α, β, γ), bit_ando(α, β, δ))
@@ -249,7 +249,78 @@ def _addero(δ, n, m, r): # alias for `gen_adder` as it appears in The Reasoned
                          conji(full_addero(δ, α, β, γ, ε),  
                                addero(ε, x, y, z))))
 
+# NATIVE ARITHMETIC {{{
+
+def _as_int(t, sub):
+    '''
+    The int that term ``t`` denotes in ``sub`` when it is a ground numeral
+    without trailing zeros, as ``num.build`` makes them; otherwise ``None``.
+    '''
+
+    i, e, bit, t = 0, 0, None, walk(t, sub)
+    while isinstance(t, cons):
+        bit = walk(t.car, sub)
+        if type(bit) is not int or bit not in (0, 1): return None
+        i, e, t = i + (bit << e), e + 1, walk(t.cdr, sub)
+    return i if t == [] and bit != 0 else None
+
+def hybrid(natively):
+    '''
+    Decorates an arithmetic relation so that, when ``natively`` can solve it
+    with Python ints, the search of the bit level definition is skipped.
+
+    The decorated goal walks its arguments first: ``natively`` takes their
+    ints, ``None`` for the ones that are not ground numerals, and returns
+    either ``None``, to fall back to the relational definition, or the list
+    of the tuples of ints the definition would answer, *duplicates included*;
+    so answers are the same, in the same order, as long as ``natively`` only
+    solves the modes where the definition yields a finite stream.
+    '''
+
+    def decorator(relation):
+
+        @wraps(relation)
+        def H(*args):
+
+            def N(s : state):
+                answers = natively(*(_as_int(a, s.sub) for a in args))
+                if answers is None:
+                    yield from relation(*args)(s)
+                    return
+                for values in answers:
+                    yield from conj(*[unify(a, num.build(v)) for a, v in zip(args, values)])(s)
+
+            return N
+
+        H.relational = relation
+        return H
+
+    return decorator
+
+def _plus_natively(n, m, k):
+    if n is not None and m is not None: return [(n, m, n + m)]
+    if n is not None and k is not None: return [(n, k - n, k)] if n <= k else []
+    if m is not None and k is not None: return [(k - m, m, k)] if m <= k else []
+    return None
+
+def _multiply_natively(n, m, p):
+    if n is None or m is None: return None
+    return [(n, m, n * m)] * (2 if n == m == 1 else 1) # both `oneo` clauses succeed
+
+def _divmod_natively(n, m, q, r):
+    if n is None or m is None: return None
+    if n < m: return [(n, m, 0, n)]
+    if n == m: return [(n, m, 1, 0)] if m else []
+    if not m: return []
+    q, r = divmod(n, m)
+    # the definition finds `m * q` among numerals as long as `n`, hence it misses
+    # the quotients of the `n` whose bits outnumber the ones of `m * q`
+    return [(n, m, q, r)] if (m * q).bit_length() == n.bit_length() else []
+
+# }}}
+
 @adapt_iterables_to_conses(all_arguments, ctor=num.build)
+@hybrid(_plus_natively)
 def pluso(n, m, k):
     return addero(0, n, m, k)
 
@@ -308,6 +379,7 @@ def pluseo(n, m, k):
 
 
 @adapt_iterables_to_conses(all_arguments, ctor=num.build)
+@hybrid(_multiply_natively)
 def multiplyo(n, m, p):
     return condi([zeroo(n), zeroo(p)],
                  [poso(n), zeroo(m), zeroo(p)],
@@ -381,6 +453,7 @@ def leq(n, m):
                  [lto(n, m), succeed])
 
 @adapt_iterables_to_conses(all_arguments, ctor=num.build)
+@hybrid(_divmod_natively)
 def divmodo(n, m, q, r):
     return condi([zeroo(q), unify(n, r), lto(r, m)],
                  [oneo(q), zeroo(r), equalo(n, m), lto(r, m)], 
@@ -622,6 +622,17 @@ class reasonedschemer_test(unittest.TestCase):
                           ((('pizza', rvar(0)), rvar(1)), rvar(2)),
                           (((('pizza', rvar(0)), rvar(1)), rvar(2)), rvar(3)),]) # 5.55
 
+    def test_appendo_on_seqs(self):
+
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(10000) # the search nests generators as deep as the recursion
+        try:
+            l = list_to_seq(list(range(300)))
+            self.assertEqual(run(fresh(lambda q: appendo(l, ['end'], q))), [list(range(300)) + ["end"]])
+            self.assertEqual(run(fresh(lambda x: appendso(x, [298, 299], l))), [list(range(298))])
+        finally:
+            sys.setrecursionlimit(limit)
+
     def test_flatteno(self):
 
         self.assertEqual(run(fresh(lambda x: flatteno([['a', 'b'], 'c'], x)), n=1), [['a', 'b', 'c']]) # 5.60
@@ -652,6 +663,18 @@ class reasonedschemer_test(unittest.TestCase):
                           [[['a']], []],
                           [[[['a']]]],
                           ]) # 5.66
+        self.assertEqual(run(fresh(lambda x: flatteno([[['a']]], x)), distinct=True), 
+                         [['a'], 
+                          ['a', []], 
+                          ['a', [], []], 
+                          ['a', [], [], []],
+                          [['a']],
+                          [['a'], []],
+                          [['a'], [], []],
+                          [[['a']]],
+                          [[['a']], []],
+                          [[[['a']]]],
+                          ])
         self.assertEqual(run(fresh(lambda x: flatteno([['a', 'b'], 'c'], x))), 
                          [['a', 'b', 'c'],
                           ['a', 'b', 'c', []],
@@ -1305,6 +1328,33 @@ class reasonedschemer_test(unittest.TestCase):
             self.assertEqual(run(fresh(lambda dm, q, r: conj(divmodo(83, 6, q, r), unify([q, r], dm)))), [[int_to_list(13), int_to_list(5)]])
             self.assertEqual(run(fresh(lambda dm, q, r: conj(divmod_proo(83, 6, q, r), unify([q, r], dm))), n=1), [[int_to_list(13), int_to_list(5)]])
 
+    def test_native_arithmetic(self):
+
+        def answers(relation, *args): # with a fresh var for each `None` in `args`, for the undecorated definitions too
+
+            def G(t, *vs):
+                fresh_vars = iter(vs)
+                return conj(relation(*[next(fresh_vars) if a is None else num.build(a) for a in args]), unify(list(vs), t))
+
+            return run(fresh(G, arity=args.count(None) + 1), n=10)
+
+        def modes(n, m):
+            yield pluso, (n, m, None), (n, None, n + m), (None, m, n + m), (n, m, m), (n, None, m)
+            yield multiplyo, (n, m, None), (n, m, n * m), (n, m, n + 1)
+            yield divmodo, (n, m, None, None), (n, m, None, n % 3), (n, m, 1, None)
+
+        for n in range(7):
+            for m in range(7):
+                for relation, *cases in modes(n, m):
+                    for args in cases: # the definitions terminate in these modes
+                        self.assertEqual(answers(relation, *args), answers(relation.relational, *args), (relation, args))
+
+        a, b = 2**20 - 3, 2**19 + 7
+        self.assertEqual(run(fresh(lambda p: multiplyo(a, b, p))), [int_to_list(a * b)])
+        self.assertEqual(run(fresh(lambda x: pluso(x, b, a))), [int_to_list(a - b)])
+        self.assertEqual(run(fresh(lambda x: minuso(b, a, x))), [])
+        self.assertEqual(run(fresh(lambda t, q, r: conj(divmodo(a * b + 5, b, q, r), unify([q, r], t)))), [[int_to_list(a), int_to_list(5)]])
+
 
     def test_logo(self):
         self.assertEqual(run(fresh(lambda r: logo([0, 1, 1, 1], [0, 1], [1, 1], r))), [[0, 1, 1]]) # 8.89
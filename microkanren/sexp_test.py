@@ -42,6 +42,46 @@ class sexp_tests(unittest.TestCase):
         with self.assertRaises(ImproperListError):
             cons_to_list(c=cons(3, ()))
 
+    def test_append_to_cons(self):
+        self.assertEqual([1, 2] + cons(3, []), cons(1, cons(2, cons(3, []))))
+        self.assertEqual([1] + seq([2, 3]), seq([1], tail=seq([2, 3])))
+        for l in [cons(1, []), seq([1, 2])]:
+            with self.assertRaisesRegex(TypeError, 'unsupported operand'): 1 + l
+
+    def test_long_lists_in_linear_time(self):
+        l = list(range(100000))
+        self.assertEqual(l, cons_to_list(list_to_cons(l)))
+        self.assertEqual(l, cons_to_list(list_to_seq(l)))
+        self.assertEqual(tuple(l), cons_to_list(list_to_seq(tuple(l))))
+
+    def test_seq(self):
+        s = list_to_seq([1, [2, 3], (4, 5), 6])
+        self.assertEqual(s, seq([1, seq([2, 3]), seq([4], tail=5), 6]))
+        self.assertEqual(s, list_to_cons([1, [2, 3], (4, 5), 6]))
+        self.assertEqual((s.car, len(s.cdr), s.cdr.cdr.cdr.cdr), (1, 3, []))
+        self.assertIs(s.cdr.items, s.items) # suffixes share the array of items
+        self.assertNotEqual(s, list_to_seq([1, [2, 3], (4, 5)]))
+        self.assertNotEqual(seq([1], tail=2), cons(1, []))
+        self.assertEqual(list_to_seq([]), [])
+        with self.assertRaises(ImproperListError):
+            cons_to_list(seq([3], tail=()))
+
+    def test_literals_converted_once(self):
+        self.assertIs(list_to_cons([3, 2]), list_to_cons([3, 2]))
+        self.assertIs(list_to_cons(['a']), list_to_cons(['a']))
+        self.assertIsNot(list_to_cons([True]), list_to_cons([1])) # equal, but not literals of the same type
+        self.assertIsNot(list_to_cons([[1]]), list_to_cons([[1]])) # of atoms only
+        self.assertIsNot(list_to_cons(list(range(20))), list_to_cons(list(range(20)))) # short ones only
+        self.assertEqual(list_to_cons((3, 2)), cons(3, 2))
+        self.assertEqual(list_to_cons([3, 2], post=lambda l: [4]), list_to_cons([3, 2, 4]))
+        self.assertIs(num.build(11), num.build(11))
+        self.assertEqual((type(num.build(11)), int(num.build(11)), num.build(0)), (num, 11, []))
+
+        @adapt_iterables_to_conses(lambda a, b: {b})
+        def pair(a, b): return a, b
+        self.assertEqual(pair([1], [2]), ([1], cons(2, [])))
+        self.assertEqual(pair([1], [2], bypass_cons_adapter=True), ([1], [2]))
+
     def isomorphism(self, l, c):
         self.assertEqual(c, list_to_cons(l))
         self.assertEqual(l, cons_to_list(c))